@@ -0,0 +1,59 @@
+"""
+Benchmark: row-major QueryResponse vs columnar encodings.
+
+Usage (from repo root):
+    python -m benchmarks.query_encoding [rows]
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from uuid import uuid4
+import json
+import sys
+import time
+
+from src.api.database.manager import DatabaseManager
+from src.api.database.encoding import encode_columnar_json, encode_arrow, pa
+
+
+def make_rows(n: int) -> list:
+    start = datetime(2026, 1, 1)
+    return [
+        [i, f"user{i}@example.com", start + timedelta(minutes=i), Decimal(i) / 100, uuid4(), i % 3 == 0]
+        for i in range(n)
+    ]
+
+
+def bench(name: str, fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<18} {best * 1000:9.1f} ms {len(out) / 1024:10.0f} KiB")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    columns = ["id", "email", "created_at", "balance", "token", "active"]
+    rows = make_rows(n)
+    serialize = DatabaseManager._serialize_value
+
+    def row_major() -> bytes:
+        data = [[serialize(None, cell) for cell in row] for row in rows]
+        return json.dumps({"columns": columns, "rows": data, "affected_rows": n}).encode()
+
+    def columnar_json() -> bytes:
+        return json.dumps(encode_columnar_json(columns, rows)).encode()
+
+    print(f"{n} rows x {len(columns)} columns")
+    bench("row-major json", row_major)
+    bench("columnar json", columnar_json)
+    if pa is not None:
+        bench("arrow ipc", lambda: encode_arrow(columns, rows))
+    else:
+        print("arrow ipc          skipped (pyarrow not installed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: snapshot archive write / read throughput (framing + gzip).
+
+No database involved; data is synthetic COPY-binary-like rows in 64 KiB
+chunks, so this is the CPU cost the API adds on top of COPY itself.
+
+Usage (from repo root):
+    python -m benchmarks.snapshot_codec [megabytes]
+"""
+
+import asyncio
+import random
+import struct
+import sys
+import time
+
+from src.api.database.snapshot import SnapshotProgress, SnapshotReader, SnapshotWriter
+
+
+def make_chunks(megabytes: int) -> list:
+    rng = random.Random(0)
+    chunks = []
+    chunk = bytearray()
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        email = f"user{rng.randrange(10**6)}@example.com".encode()
+        row = struct.pack(">hiqi", 3, 8, rng.randrange(10**9), len(email)) + email + struct.pack(">iq", 8, rng.randrange(10**12))
+        chunk += row
+        if len(chunk) >= 64 * 1024:
+            chunks.append(bytes(chunk))
+            size += len(chunk)
+            chunk = bytearray()
+    return chunks
+
+
+def write(chunks: list, level: int) -> tuple:
+    progress = SnapshotProgress(operation="export")
+    writer = SnapshotWriter(progress, level)
+    out = [writer.start({"version": 1, "tables": ["t"]}), writer.frame(b"T", b'{"table": "t"}')]
+    out += [writer.frame(b"D", chunk) for chunk in chunks]
+    out += [writer.frame(b"E"), writer.close()]
+    return b"".join(out), progress
+
+
+async def read(archive: bytes) -> SnapshotProgress:
+    async def body():
+        for i in range(0, len(archive), 64 * 1024):
+            yield archive[i:i + 64 * 1024]
+
+    progress = SnapshotProgress(operation="restore")
+    reader = SnapshotReader(body(), progress)
+    await reader.manifest()
+    await reader.frame()
+    async for _ in reader.table_data():
+        pass
+    await reader.frame()
+    await reader.finish()
+    return progress
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    chunks = make_chunks(megabytes)
+    print(f"{megabytes} MiB of row data in {len(chunks)} chunks")
+
+    for level in (1, 6):
+        t0 = time.perf_counter()
+        archive, progress = write(chunks, level)
+        written = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        asyncio.run(read(archive))
+        restored = time.perf_counter() - t0
+
+        mb = progress.bytes_raw / 1024 / 1024
+        print(
+            f"level {level}: ratio {progress.bytes_raw / len(archive):4.1f}x  "
+            f"write {mb / written:7.1f} MB/s  read {mb / restored:7.1f} MB/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
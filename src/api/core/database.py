@@ -1,6 +1,7 @@
 """
 Database configuration and connection.
 """
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
@@ -25,10 +26,21 @@ class Base(DeclarativeBase):
     pass
 
 
+# Columns added after their table first shipped: create_all does not alter existing tables
+UPGRADES = [
+    "ALTER TABLE deployments ADD COLUMN IF NOT EXISTS railway_deployment_id VARCHAR(100)",
+    "ALTER TABLE projects ADD COLUMN IF NOT EXISTS repo_key VARCHAR(255)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_projects_repo_key ON projects (repo_key)",
+]
+
+
 async def init_db():
     """Initialize database tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            for statement in UPGRADES:
+                await conn.execute(text(statement))
 
 
 async def get_db() -> AsyncSession:
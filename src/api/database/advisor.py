@@ -0,0 +1,268 @@
+"""
+Index Advisor - index proposals from captured slow queries.
+
+1. Take the project's slowest recorded SELECTs (QueryStatsCollector)
+2. EXPLAIN them and walk the plans (heuristics):
+   - Seq Scan with Filter -> equality columns first, then one range column
+   - Sort over a Seq Scan -> filter columns + sort key
+3. Drop proposals already covered by an existing index prefix
+4. With the HypoPG extension installed, cost every proposal as a
+   hypothetical index and report the estimated benefit per query
+
+AI proposals (database/router.py) go through the same costing.
+All proposals are CREATE INDEX CONCURRENTLY, applied via migrations.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import json
+import re
+
+from sqlalchemy import text
+
+from .ddl import quote_ident
+
+_COMPARISON = re.compile(r'(\S+)\s+(=|<=|>=|<|>)\s')
+_CAST = re.compile(r'::[\w ]+(?:\[\])?')
+_INDEX_COLUMNS = re.compile(r'USING \w+ \((.*)\)')
+_CREATE_INDEX = re.compile(
+    r'^CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(IF\s+NOT\s+EXISTS\s+)?"?(\w+)"?\s+ON\s+"?(\w+)"?\s*(?:USING\s+\w+\s*)?\((.+)\)\s*;?$',
+    re.IGNORECASE | re.DOTALL,
+)
+
+MAX_INDEX_COLUMNS = 3
+
+
+@dataclass
+class IndexProposal:
+    table: str
+    columns: List[str]
+    reason: str
+    source: str = "heuristic"  # heuristic, ai
+    queries: List[str] = field(default_factory=list)  # fingerprints
+    cost_before: Optional[float] = None
+    cost_after: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        base = "_".join([self.table] + [c.split()[0] for c in self.columns])
+        return f"idx_{base}"[:63]
+
+    @property
+    def sql(self) -> str:
+        """Migration statement."""
+        columns = ", ".join(_column_sql(c) for c in self.columns)
+        return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote_ident(self.name)} ON {quote_ident(self.table)} ({columns})"
+
+    @property
+    def hypothetical_sql(self) -> str:
+        """Plain CREATE INDEX for hypopg_create_index()."""
+        columns = ", ".join(_column_sql(c) for c in self.columns)
+        return f"CREATE INDEX ON {quote_ident(self.table)} ({columns})"
+
+    @property
+    def benefit(self) -> Optional[float]:
+        """Estimated cost reduction, 0..1."""
+        if not self.cost_before or self.cost_after is None:
+            return None
+        return round(max(0.0, 1 - self.cost_after / self.cost_before), 4)
+
+
+def _column_sql(column: str) -> str:
+    """'created_at DESC' -> '"created_at" DESC'."""
+    name, _, order = column.partition(" ")
+    return f"{quote_ident(name)} {order}".strip()
+
+
+def is_concurrent_index(sql: str) -> bool:
+    return bool(re.match(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\s+CONCURRENTLY\b', sql, re.IGNORECASE))
+
+
+def concurrent_index_name(sql: str) -> Optional[str]:
+    match = _CREATE_INDEX.match(sql.strip())
+    return match.group(3) if match else None
+
+
+def without_concurrently(sql: str) -> str:
+    """Same statement, runnable inside a transaction (dry runs)."""
+    return re.sub(r'\bCONCURRENTLY\s+', '', sql, count=1, flags=re.IGNORECASE)
+
+
+def parse_index_statement(sql: str) -> Optional[IndexProposal]:
+    """Parse a single-table CREATE INDEX CONCURRENTLY (AI output). None if anything else."""
+    match = _CREATE_INDEX.match(sql.strip())
+    if not match or ";" in match.group(5):
+        return None
+
+    columns = []
+    for part in match.group(5).split(","):
+        tokens = part.strip().replace('"', "").split()
+        if not tokens or not re.match(r'^\w+$', tokens[0]) or len(tokens) > 2:
+            return None
+        if len(tokens) == 2 and tokens[1].upper() not in ("ASC", "DESC"):
+            return None
+        columns.append(" ".join([tokens[0]] + [t.upper() for t in tokens[1:]]))
+
+    return IndexProposal(table=match.group(4), columns=columns, reason="AI suggestion", source="ai")
+
+
+def _walk(node: Dict[str, Any], parent: Optional[Dict[str, Any]] = None) -> Iterator[Tuple[Dict, Optional[Dict]]]:
+    yield node, parent
+    for child in node.get("Plans", []):
+        yield from _walk(child, node)
+
+
+def _filter_columns(condition: str, alias: str) -> Tuple[List[str], List[str]]:
+    """Split filter into (equality columns, range columns) of one relation."""
+    equality: List[str] = []
+    ranges: List[str] = []
+
+    for left, op in _COMPARISON.findall(condition):
+        column = _CAST.sub("", left).strip("()")
+        if "(" in column or ")" in column:
+            continue  # expression, e.g. lower(email)
+        if "." in column:
+            qualifier, _, column = column.partition(".")
+            if qualifier != alias:
+                continue
+        if not re.match(r'^[a-z_][a-z0-9_]*$', column):
+            continue
+
+        target = equality if op == "=" else ranges
+        if column not in equality and column not in ranges:
+            target.append(column)
+
+    return equality, ranges
+
+
+def proposals_from_plan(explain: Any, fingerprint: str = "") -> List[IndexProposal]:
+    """Heuristic index proposals from EXPLAIN (FORMAT JSON) output."""
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+
+    proposals = []
+    for node, parent in _walk(explain[0]["Plan"]):
+        if node.get("Node Type") != "Seq Scan" or "Relation Name" not in node:
+            continue
+
+        table = node["Relation Name"]
+        alias = node.get("Alias", table)
+        equality, ranges = _filter_columns(node.get("Filter", ""), alias)
+
+        sort_keys = []
+        if parent and parent.get("Node Type") in ("Sort", "Incremental Sort"):
+            for key in parent.get("Sort Key", []):
+                name, _, order = key.partition(" ")
+                name = name.split(".")[-1].strip("()")
+                if re.match(r'^[a-z_][a-z0-9_]*$', name):
+                    sort_keys.append(f"{name} {order}".strip())
+
+        columns = equality + ranges[:1]
+        if sort_keys and not ranges:
+            columns += [k for k in sort_keys if k.split()[0] not in columns]
+        columns = columns[:MAX_INDEX_COLUMNS]
+
+        if not columns:
+            continue
+
+        reason = f"Seq Scan on {table}"
+        if equality or ranges:
+            reason += f" filtered by {', '.join(equality + ranges)}"
+        if sort_keys:
+            reason += f", sorted by {', '.join(sort_keys)}"
+
+        proposals.append(IndexProposal(
+            table=table,
+            columns=columns,
+            reason=reason,
+            queries=[fingerprint] if fingerprint else [],
+        ))
+
+    return proposals
+
+
+def merge_proposals(proposals: List[IndexProposal]) -> List[IndexProposal]:
+    """Merge duplicates; a proposal that is a prefix of another is dropped."""
+    merged: Dict[Tuple[str, Tuple[str, ...]], IndexProposal] = {}
+    for proposal in proposals:
+        key = (proposal.table, tuple(proposal.columns))
+        if key in merged:
+            existing = merged[key]
+            existing.queries += [q for q in proposal.queries if q not in existing.queries]
+        else:
+            merged[key] = proposal
+
+    result = []
+    for (table, columns), proposal in merged.items():
+        covered = any(
+            other_table == table and len(other) > len(columns) and other[:len(columns)] == columns
+            for other_table, other in merged
+        )
+        if not covered:
+            result.append(proposal)
+    return result
+
+
+async def existing_index_columns(conn, schema: str) -> Dict[str, List[List[str]]]:
+    """Column lists of existing indexes per table."""
+    result = await conn.execute(text('''
+        SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = :schema
+    '''), {"schema": schema})
+
+    indexes: Dict[str, List[List[str]]] = {}
+    for table, indexdef in result:
+        match = _INDEX_COLUMNS.search(indexdef)
+        if match:
+            columns = [c.strip().replace('"', "").split()[0] for c in match.group(1).split(",")]
+            indexes.setdefault(table, []).append(columns)
+    return indexes
+
+
+def is_covered(proposal: IndexProposal, indexes: Dict[str, List[List[str]]]) -> bool:
+    """Existing index already starts with the proposed columns."""
+    columns = [c.split()[0] for c in proposal.columns]
+    return any(existing[:len(columns)] == columns for existing in indexes.get(proposal.table, []))
+
+
+async def has_hypopg(conn) -> bool:
+    result = await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"))
+    return result.scalar() is not None
+
+
+async def plan_cost(conn, sql: str) -> float:
+    result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+    explain = result.scalar()
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    return float(explain[0]["Plan"]["Total Cost"])
+
+
+async def cost_with_hypothetical_index(
+    conn,
+    proposal: IndexProposal,
+    queries: Dict[str, str],
+):
+    """
+    Fill cost_before / cost_after using HypoPG.
+
+    queries: fingerprint -> example SQL. Costs are summed over the queries
+    the proposal targets (all queries if it has none, e.g. AI proposals).
+    """
+    targets = [queries[q] for q in proposal.queries if q in queries] or list(queries.values())
+    if not targets:
+        return
+
+    before = 0.0
+    for sql in targets:
+        before += await plan_cost(conn, sql)
+
+    await conn.execute(text("SELECT * FROM hypopg_create_index(:sql)"), {"sql": proposal.hypothetical_sql})
+    try:
+        after = 0.0
+        for sql in targets:
+            after += await plan_cost(conn, sql)
+    finally:
+        await conn.execute(text("SELECT hypopg_reset()"))
+
+    proposal.cost_before = before
+    proposal.cost_after = after
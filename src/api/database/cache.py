@@ -0,0 +1,62 @@
+"""
+Query Cache - small read-only results per project.
+
+Key: (project_id, data version, normalized SQL, serialized?).
+DatabaseManager bumps a project's data version on every write
+(execute_sql, apply_migration, import), so old entries simply stop
+matching. The TTL bounds staleness when writes happen on another
+API worker, which this in-process version doesn't see.
+"""
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+import time
+
+from .sqltext import normalize_sql
+
+
+CacheKey = Tuple[int, int, str, bool]
+
+
+class QueryCache:
+    """LRU cache of QueryResult objects."""
+
+    def __init__(self, max_entries: int = 2048, max_rows: int = 1000, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, project_id: int, version: int, sql: str, serialized: bool) -> CacheKey:
+        return (project_id, version, normalize_sql(sql), serialized)
+
+    def get(self, project_id: int, version: int, sql: str, serialized: bool = True) -> Optional[object]:
+        key = self._key(project_id, version, sql, serialized)
+        entry = self._entries.get(key)
+
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, project_id: int, version: int, sql: str, result, serialized: bool = True):
+        """Store result if small enough."""
+        if result.error or len(result.rows) > self.max_rows:
+            return
+
+        key = self._key(project_id, version, sql, serialized)
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, project_id: int):
+        """Drop all entries of project (they're unreachable after a version bump anyway)."""
+        for key in [k for k in self._entries if k[0] == project_id]:
+            del self._entries[key]
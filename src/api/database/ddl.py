@@ -0,0 +1,158 @@
+"""
+Schema DDL from catalog introspection.
+
+Produces schema-relative statements (run them with search_path set to the
+target schema), split the way a bulk copy wants them:
+- pre_data: sequences and tables without constraints
+- post_data: constraints, indexes, sequence ownership and values
+
+Covers plain tables, sequences (serial and identity), constraints and
+indexes. Views, functions, triggers and partitioned parents are not included.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from sqlalchemy import text
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+@dataclass
+class SchemaDDL:
+    tables: List[str] = field(default_factory=list)
+    copy_columns: Dict[str, List[str]] = field(default_factory=dict)  # without generated columns
+    pre_data: List[str] = field(default_factory=list)
+    post_data: List[str] = field(default_factory=list)
+
+    def statements(self) -> List[str]:
+        return self.pre_data + self.post_data
+
+
+async def introspect_schema(conn, schema: str) -> SchemaDDL:
+    """
+    Build DDL for schema. Sets search_path locally, so conn must be in a transaction.
+    """
+    await conn.execute(text(f"SET LOCAL search_path TO {quote_ident(schema)}"))
+    ddl = SchemaDDL()
+    params = {"schema": schema}
+
+    # Sequences owned by a column: 'a' = serial (OWNED BY), 'i' = identity (implicit)
+    owned = await conn.execute(text('''
+        SELECT s.relname, t.relname, a.attname, d.deptype
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        JOIN pg_class t ON t.oid = d.refobjid
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = d.refobjsubid
+        JOIN pg_namespace n ON n.oid = s.relnamespace
+        WHERE n.nspname = :schema AND d.deptype IN ('a', 'i')
+    '''), params)
+    identity_sequences = set()
+    for seq, table, column, deptype in owned:
+        if deptype == "i":
+            identity_sequences.add(seq)
+        else:
+            ddl.post_data.append(
+                f"ALTER SEQUENCE {quote_ident(seq)} OWNED BY {quote_ident(table)}.{quote_ident(column)}"
+            )
+
+    sequences = await conn.execute(text('''
+        SELECT sequencename, data_type, start_value, min_value, max_value,
+               increment_by, cycle, last_value
+        FROM pg_sequences
+        WHERE schemaname = :schema
+        ORDER BY sequencename
+    '''), params)
+    for name, data_type, start, min_value, max_value, increment, cycle, last_value in sequences:
+        if name not in identity_sequences:
+            ddl.pre_data.append(
+                f"CREATE SEQUENCE {quote_ident(name)} AS {data_type} "
+                f"INCREMENT BY {increment} MINVALUE {min_value} MAXVALUE {max_value} "
+                f"START WITH {start}{' CYCLE' if cycle else ''}"
+            )
+
+    columns = await conn.execute(text('''
+        SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod),
+               a.attnotnull, pg_get_expr(d.adbin, d.adrelid), a.attidentity, a.attgenerated
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_attrdef d ON d.adrelid = c.oid AND d.adnum = a.attnum
+        WHERE n.nspname = :schema AND c.relkind = 'r'
+        ORDER BY c.relname, a.attnum
+    '''), params)
+
+    definitions: Dict[str, List[str]] = {}
+    for table, column, col_type, not_null, default, identity, generated in columns:
+        if table not in definitions:
+            definitions[table] = []
+            ddl.tables.append(table)
+            ddl.copy_columns[table] = []
+
+        col_def = f"{quote_ident(column)} {col_type}"
+        if generated == "s":
+            col_def += f" GENERATED ALWAYS AS ({default}) STORED"
+        elif identity:
+            col_def += f" GENERATED {'ALWAYS' if identity == 'a' else 'BY DEFAULT'} AS IDENTITY"
+        elif default is not None:
+            col_def += f" DEFAULT {default}"
+        if not_null:
+            col_def += " NOT NULL"
+
+        definitions[table].append(col_def)
+        if generated != "s":
+            ddl.copy_columns[table].append(column)
+
+        if identity:
+            ddl.post_data.append(
+                f"SELECT setval(pg_get_serial_sequence({quote_literal(quote_ident(table))}, {quote_literal(column)}), "
+                f"(SELECT COALESCE(MAX({quote_ident(column)}), 0) + 1 FROM {quote_ident(table)}), false)"
+            )
+
+    for table in ddl.tables:
+        ddl.pre_data.append(
+            f"CREATE TABLE {quote_ident(table)} (\n  " + ",\n  ".join(definitions[table]) + "\n)"
+        )
+
+    # Foreign keys last, after the keys they reference
+    constraints = await conn.execute(text('''
+        SELECT c.relname, con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND con.contype IN ('p', 'u', 'c', 'x', 'f')
+        ORDER BY con.contype = 'f', c.relname, con.conname
+    '''), params)
+    for table, name, definition in constraints:
+        ddl.post_data.append(
+            f"ALTER TABLE {quote_ident(table)} ADD CONSTRAINT {quote_ident(name)} {definition}"
+        )
+
+    # pg_get_indexdef() always qualifies the table; drop it to stay schema-relative
+    indexes = await conn.execute(text('''
+        SELECT pg_get_indexdef(ix.indexrelid), quote_ident(n.nspname)
+        FROM pg_index ix
+        JOIN pg_class t ON t.oid = ix.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        LEFT JOIN pg_constraint con ON con.conindid = ix.indexrelid
+        WHERE n.nspname = :schema AND con.oid IS NULL
+    '''), params)
+    for definition, qualifier in indexes:
+        ddl.post_data.append(definition.replace(f" ON {qualifier}.", " ON ", 1))
+
+    sequence_values = await conn.execute(text('''
+        SELECT sequencename, last_value
+        FROM pg_sequences
+        WHERE schemaname = :schema AND last_value IS NOT NULL
+    '''), params)
+    for name, last_value in sequence_values:
+        if name not in identity_sequences:
+            ddl.post_data.append(f"SELECT setval({quote_literal(quote_ident(name))}, {last_value}, true)")
+
+    return ddl
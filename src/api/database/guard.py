@@ -0,0 +1,136 @@
+"""
+Cost Guard - EXPLAIN-based pre-flight for user SQL.
+
+Before a SELECT runs on the shared server we ask the planner for its
+estimate (EXPLAIN without ANALYZE never executes the query):
+- cost/rows over the plan's hard limit -> rejected
+- cost over the confirm threshold -> user must re-send with confirm=true
+- otherwise -> allowed, with statement_timeout derived from estimated cost
+
+Verdicts are cached per (project, normalized SQL, plan) for a short TTL,
+so IDE polling of the same query doesn't pay for EXPLAIN every time.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+import json
+import time
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .sqltext import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_cost: float  # planner cost units, reject above
+    max_rows: int  # estimated result rows, reject above
+    confirm_cost: float  # ask for confirmation above
+    max_timeout_ms: int  # upper bound for statement_timeout
+    min_timeout_ms: int = 1000  # floor for statement_timeout, capped by max_timeout_ms
+    ms_per_cost: float = 0.05  # timeout granted per planner cost unit
+
+
+PLAN_QUERY_BUDGETS: Dict[str, QueryBudget] = {
+    "free": QueryBudget(max_cost=1_000_000, max_rows=100_000, confirm_cost=100_000, max_timeout_ms=10_000),
+    "pro": QueryBudget(max_cost=10_000_000, max_rows=1_000_000, confirm_cost=1_000_000, max_timeout_ms=30_000),
+    "team": QueryBudget(max_cost=50_000_000, max_rows=5_000_000, confirm_cost=5_000_000, max_timeout_ms=30_000),
+    "enterprise": QueryBudget(max_cost=200_000_000, max_rows=20_000_000, confirm_cost=20_000_000, max_timeout_ms=60_000),
+}
+
+DEFAULT_BUDGET = PLAN_QUERY_BUDGETS["free"]
+
+
+@dataclass
+class PlanVerdict:
+    allowed: bool
+    needs_confirmation: bool
+    total_cost: float
+    plan_rows: int
+    timeout_ms: int
+    reason: Optional[str] = None
+
+
+class CostGuard:
+    """
+    Evaluates EXPLAIN (FORMAT JSON) output against per-plan budgets.
+    """
+
+    def __init__(self, cache_size: int = 1024, cache_ttl: float = 60.0):
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[Tuple[int, str, str], Tuple[float, PlanVerdict]]" = OrderedDict()
+
+    def get_budget(self, plan: Optional[str]) -> QueryBudget:
+        """Budget for billing plan (falls back to free)."""
+        return PLAN_QUERY_BUDGETS.get(plan or "free", DEFAULT_BUDGET)
+
+    def evaluate(self, explain: Any, budget: QueryBudget) -> PlanVerdict:
+        """Turn EXPLAIN JSON into a verdict."""
+        if isinstance(explain, str):
+            explain = json.loads(explain)
+
+        root = explain[0]["Plan"]
+        total_cost = float(root.get("Total Cost", 0))
+        plan_rows = int(root.get("Plan Rows", 0))
+
+        # The floor keeps cheap queries from timing out on a busy server; the plan limit always wins
+        timeout_ms = int(total_cost * budget.ms_per_cost)
+        timeout_ms = min(max(timeout_ms, budget.min_timeout_ms), budget.max_timeout_ms)
+
+        if total_cost > budget.max_cost:
+            return PlanVerdict(
+                False, False, total_cost, plan_rows, timeout_ms,
+                f"Query too expensive: estimated cost {total_cost:.0f} exceeds limit {budget.max_cost:.0f}",
+            )
+
+        if plan_rows > budget.max_rows:
+            return PlanVerdict(
+                False, False, total_cost, plan_rows, timeout_ms,
+                f"Query returns too many rows: estimated {plan_rows} exceeds limit {budget.max_rows}",
+            )
+
+        if total_cost > budget.confirm_cost:
+            return PlanVerdict(
+                True, True, total_cost, plan_rows, timeout_ms,
+                f"Estimated cost {total_cost:.0f} is high, re-run with confirm=true",
+            )
+
+        return PlanVerdict(True, False, total_cost, plan_rows, timeout_ms)
+
+    async def check(
+        self,
+        conn: AsyncConnection,
+        project_id: int,
+        sql: str,
+        plan: Optional[str] = None,
+    ) -> PlanVerdict:
+        """
+        Run EXPLAIN on connection (search_path must already be set).
+        """
+        key = (project_id, normalize_sql(sql), plan or "free")
+
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl:
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        verdict = self.evaluate(result.scalar(), self.get_budget(plan))
+
+        self._cache[key] = (time.monotonic(), verdict)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return verdict
+
+    def invalidate(self, project_id: int):
+        """Drop cached verdicts for project (e.g. after DDL)."""
+        for key in [k for k in self._cache if k[0] == project_id]:
+            del self._cache[key]
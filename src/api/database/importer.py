@@ -0,0 +1,207 @@
+"""
+Bulk import - streaming CSV / NDJSON into project tables via COPY.
+
+The upload is never held in memory as a whole:
+- CSV: header line is parsed and validated, the rest is passed to
+  COPY FROM STDIN chunk by chunk as-is
+- NDJSON: lines are converted to CSV in batches of ~BATCH_BYTES
+
+Both feed asyncpg's copy_to_table() as an async iterator of bytes.
+"""
+
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, TYPE_CHECKING
+import csv
+import json
+import time
+
+if TYPE_CHECKING:
+    from .manager import ColumnInfo
+
+
+BATCH_BYTES = 256 * 1024
+MAX_LINE_BYTES = 16 * 1024 * 1024
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+class ImportFormatError(ValueError):
+    """Invalid import payload (bad header, unknown columns, broken JSON)."""
+
+
+@dataclass
+class ImportProgress:
+    table: str
+    format: str
+    bytes_read: int = 0
+    rows: int = 0  # approximate while running, exact when done
+    status: str = "running"  # running, done, failed
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+
+def validate_columns(names: List[str], columns: List["ColumnInfo"]) -> Optional[str]:
+    """Check import columns against introspected table columns. Returns error or None."""
+    known = {c.name for c in columns}
+
+    if not names:
+        return "No columns in import"
+
+    if len(set(names)) != len(names):
+        return "Duplicate columns in import"
+
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        return f"Unknown columns: {', '.join(unknown)}"
+
+    required = [
+        c.name for c in columns
+        if not c.nullable and c.default is None and c.name not in names
+    ]
+    if required:
+        return f"Missing required columns: {', '.join(required)}"
+
+    return None
+
+
+async def read_csv_header(
+    chunks: AsyncIterator[bytes],
+    progress: ImportProgress,
+) -> tuple:
+    """Read up to first newline. Returns (column names, leftover bytes)."""
+    buffer = b""
+    async for chunk in chunks:
+        progress.bytes_read += len(chunk)
+        buffer += chunk
+        if b"\n" in buffer:
+            break
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ImportFormatError("CSV header line too long")
+
+    line, _, rest = buffer.partition(b"\n")
+    if not line.strip():
+        raise ImportFormatError("Empty CSV upload")
+
+    names = next(csv.reader([line.decode("utf-8-sig").rstrip("\r")]))
+    return [n.strip() for n in names], rest
+
+
+async def csv_body(
+    first: bytes,
+    chunks: AsyncIterator[bytes],
+    progress: ImportProgress,
+) -> AsyncIterator[bytes]:
+    """Pass CSV body through, counting bytes and lines."""
+    if first:
+        progress.rows += first.count(b"\n")
+        yield first
+
+    async for chunk in chunks:
+        progress.bytes_read += len(chunk)
+        progress.rows += chunk.count(b"\n")
+        yield chunk
+
+
+def _csv_field(value) -> str:
+    """Format value as a COPY CSV field (unquoted empty = NULL)."""
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False)
+    return '"' + value.replace('"', '""') + '"'
+
+
+async def read_ndjson_columns(
+    chunks: AsyncIterator[bytes],
+    progress: ImportProgress,
+) -> tuple:
+    """Read first object. Returns (column names, leftover bytes incl. first line)."""
+    buffer = b""
+    async for chunk in chunks:
+        progress.bytes_read += len(chunk)
+        buffer += chunk
+        if b"\n" in buffer.lstrip():
+            break
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ImportFormatError("NDJSON line too long")
+
+    buffer = buffer.lstrip()
+    line = buffer.partition(b"\n")[0]
+    if not line.strip():
+        raise ImportFormatError("Empty NDJSON upload")
+
+    try:
+        first = json.loads(line)
+    except ValueError as e:
+        raise ImportFormatError(f"Invalid JSON on line 1: {e}")
+
+    if not isinstance(first, dict):
+        raise ImportFormatError("NDJSON lines must be objects")
+
+    return list(first.keys()), buffer
+
+
+async def ndjson_body(
+    first: bytes,
+    chunks: AsyncIterator[bytes],
+    names: List[str],
+    progress: ImportProgress,
+) -> AsyncIterator[bytes]:
+    """Convert NDJSON lines to CSV rows in columns order, batched."""
+    allowed = set(names)
+    line_no = 0
+    batch: List[str] = []
+    batch_size = 0
+
+    def convert(line: bytes) -> Optional[str]:
+        nonlocal line_no
+        line_no += 1
+        if not line.strip():
+            return None
+        try:
+            obj: Dict = json.loads(line)
+        except ValueError as e:
+            raise ImportFormatError(f"Invalid JSON on line {line_no}: {e}")
+        if not isinstance(obj, dict):
+            raise ImportFormatError(f"Line {line_no} is not an object")
+        extra = obj.keys() - allowed
+        if extra:
+            raise ImportFormatError(f"Unknown columns on line {line_no}: {', '.join(sorted(extra))}")
+        return ",".join(_csv_field(obj.get(n)) for n in names) + "\n"
+
+    pending = first
+    while True:
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            row = convert(line)
+            if row is None:
+                continue
+            batch.append(row)
+            batch_size += len(row)
+            progress.rows += 1
+
+        if batch_size >= BATCH_BYTES:
+            yield "".join(batch).encode()
+            batch, batch_size = [], 0
+
+        if len(pending) > MAX_LINE_BYTES:
+            raise ImportFormatError(f"NDJSON line {line_no + 1} too long")
+
+        chunk = await anext(chunks, None)
+        if chunk is None:
+            break
+        progress.bytes_read += len(chunk)
+        pending += chunk
+
+    row = convert(pending)
+    if row is not None:
+        batch.append(row)
+        progress.rows += 1
+
+    if batch:
+        yield "".join(batch).encode()
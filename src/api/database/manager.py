@@ -8,14 +8,35 @@ Architecture:
 - Isolation via schema + permissions
 """
 
-from dataclasses import dataclass
-from typing import List, Optional, Any
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Any
+import hashlib
+import json
 import re
+import time
 import logging
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy import text
 
+from .advisor import (
+    IndexProposal, concurrent_index_name, cost_with_hypothetical_index, existing_index_columns,
+    has_hypopg, is_concurrent_index, is_covered, merge_proposals, proposals_from_plan, without_concurrently,
+)
+from .cache import QueryCache
+from .ddl import introspect_schema, quote_ident
+from .guard import CostGuard
+from .importer import (
+    ImportFormatError, ImportProgress, validate_columns,
+    read_csv_header, csv_body, read_ndjson_columns, ndjson_body,
+)
+from .sharding import DEFAULT_SHARD, ShardMap, copy_table
+from .prepared import PreparedStatementCache
+from .snapshot import SnapshotError, SnapshotProgress, SnapshotReader, check_ddl, write_snapshot
+from .sqltext import is_ddl, is_select
+from .stats import QueryStatsCollector
+from .usage import StorageSampler
+
 logger = logging.getLogger(__name__)
 
 
@@ -41,6 +62,8 @@ class QueryResult:
     rows: List[List[Any]]
     affected_rows: int
     error: Optional[str] = None
+    needs_confirmation: bool = False
+    estimated_cost: Optional[float] = None
 
 
 @dataclass
@@ -51,6 +74,34 @@ class MigrationInfo:
     applied_at: str
 
 
+@dataclass
+class MigrationStep:
+    sql: str
+    description: str = ""
+    
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.sql.strip().encode()).hexdigest()
+
+
+@dataclass
+class MigrationStepResult:
+    description: str
+    checksum: str
+    status: str  # applied, skipped, dry_run, failed, not_run
+    duration_ms: float = 0.0
+    locks: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchMigrationResult:
+    steps: List[MigrationStepResult]
+    dry_run: bool
+    duration_ms: float
+    error: Optional[str] = None
+
+
 @dataclass
 class DatabaseInfo:
     project_id: int
@@ -63,16 +114,86 @@ class DatabaseManager:
     Manages PostgreSQL schemas for user projects.
     
     Each project gets schema: "project_{id}"
+    
+    Read-only queries go to replica_url when configured, except shortly
+    after a write to the same project (read-your-writes).
+    
+    With a shard map, each project's schema lives on the shard picked for it
+    and every method routes there; database_url is the "default" shard.
     """
     
-    def __init__(self, database_url: str):
+    def __init__(
+        self,
+        database_url: str,
+        shard_map: Optional[ShardMap] = None,
+        cost_guard: Optional[CostGuard] = None,
+        replica_url: Optional[str] = None,
+        query_cache: Optional[QueryCache] = None,
+        query_stats: Optional[QueryStatsCollector] = None,
+        prepared: Optional[PreparedStatementCache] = None,
+        storage: Optional[StorageSampler] = None,
+        replica_sticky_seconds: float = 5.0,
+        lock_timeout_ms: int = 3000,
+    ):
         self.database_url = database_url
-        self.engine = create_async_engine(database_url)
+        self.shard_map = shard_map or ShardMap({DEFAULT_SHARD: database_url})
+        self.engine = self.shard_map.default_engine
+        self.replica_engine = create_async_engine(replica_url) if replica_url else None
+        self.replica_sticky_seconds = replica_sticky_seconds
+        self.lock_timeout_ms = lock_timeout_ms
+        self.cost_guard = cost_guard
+        self.query_cache = query_cache
+        self.query_stats = query_stats
+        self.prepared = prepared
+        self.storage = storage
+        self.imports: Dict[int, ImportProgress] = {}
+        self.snapshots: Dict[int, SnapshotProgress] = {}
+        self._versions: Dict[int, int] = {}
+        self._schema_versions: Dict[int, int] = {}
+        self._last_write: Dict[int, float] = {}
     
     def _schema_name(self, project_id: int) -> str:
         """Generate schema name for project."""
         return f"project_{project_id}"
     
+    def data_version(self, project_id: int) -> int:
+        """Counter bumped on every write to project (data or schema)."""
+        return self._versions.get(project_id, 0)
+    
+    def schema_version(self, project_id: int) -> int:
+        """Counter bumped on schema changes only (DDL, migrations, restore)."""
+        return self._schema_versions.get(project_id, 0)
+    
+    def _bump_version(self, project_id: int, schema: bool = False):
+        """Invalidate everything cached for project after a write."""
+        self._versions[project_id] = self._versions.get(project_id, 0) + 1
+        self._last_write[project_id] = time.monotonic()
+        if schema:
+            self._schema_versions[project_id] = self._schema_versions.get(project_id, 0) + 1
+        
+        if self.cost_guard:
+            self.cost_guard.invalidate(project_id)
+        if self.query_cache:
+            self.query_cache.invalidate(project_id)
+    
+    async def _engine(self, project_id: int):
+        """Engine of the shard holding project schema."""
+        return await self.shard_map.engine_for(project_id)
+    
+    async def _read_engine(self, project_id: int):
+        """Replica for reads, unless project was written to just now."""
+        engine = await self._engine(project_id)
+        
+        # Replica mirrors the default shard only
+        if self.replica_engine is None or engine is not self.engine:
+            return engine
+        
+        last_write = self._last_write.get(project_id)
+        if last_write and time.monotonic() - last_write < self.replica_sticky_seconds:
+            return engine
+        
+        return self.replica_engine
+    
     def _validate_identifier(self, name: str) -> bool:
         """Validate SQL identifier (prevent injection)."""
         return bool(re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', name))
@@ -81,7 +202,8 @@ class DatabaseManager:
         """Create schema for project."""
         schema = self._schema_name(project_id)
         
-        async with self.engine.begin() as conn:
+        engine = await self._engine(project_id)
+        async with engine.begin() as conn:
             await conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema}"'))
             
             await conn.execute(text(f'''
@@ -89,6 +211,7 @@ class DatabaseManager:
                     id SERIAL PRIMARY KEY,
                     description TEXT NOT NULL,
                     sql TEXT NOT NULL,
+                    checksum TEXT,
                     applied_at TIMESTAMP DEFAULT NOW()
                 )
             '''))
@@ -105,58 +228,36 @@ class DatabaseManager:
         """Drop schema and all its contents."""
         schema = self._schema_name(project_id)
         
-        async with self.engine.begin() as conn:
+        engine = await self._engine(project_id)
+        async with engine.begin() as conn:
             await conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
         
+        self._bump_version(project_id, schema=True)
+        if self.prepared:
+            await self.prepared.unpin(project_id)
+        if self.query_stats:
+            self.query_stats.forget(project_id)
+        
         logger.info(f"Dropped database schema for project {project_id}")
     
     async def get_tables(self, project_id: int) -> List[TableInfo]:
         """List all tables in project's schema."""
         schema = self._schema_name(project_id)
         
-        async with self.engine.connect() as conn:
+        engine = await self._engine(project_id)
+        async with engine.connect() as conn:
             result = await conn.execute(text('''
                 SELECT table_name 
                 FROM information_schema.tables 
                 WHERE table_schema = :schema
-                AND table_name NOT LIKE '_%'
+                AND table_name NOT LIKE '\\_%'
             '''), {"schema": schema})
             
             tables = []
             for row in result:
                 table_name = row[0]
                 
-                cols_result = await conn.execute(text('''
-                    SELECT 
-                        c.column_name, 
-                        c.data_type, 
-                        c.is_nullable,
-                        c.column_default,
-                        CASE WHEN pk.column_name IS NOT NULL THEN true ELSE false END as is_primary
-                    FROM information_schema.columns c
-                    LEFT JOIN (
-                        SELECT ku.column_name
-                        FROM information_schema.table_constraints tc
-                        JOIN information_schema.key_column_usage ku 
-                            ON tc.constraint_name = ku.constraint_name
-                        WHERE tc.table_schema = :schema 
-                        AND tc.table_name = :table
-                        AND tc.constraint_type = 'PRIMARY KEY'
-                    ) pk ON c.column_name = pk.column_name
-                    WHERE c.table_schema = :schema AND c.table_name = :table
-                    ORDER BY c.ordinal_position
-                '''), {"schema": schema, "table": table_name})
-                
-                columns = [
-                    ColumnInfo(
-                        name=c[0],
-                        type=c[1],
-                        nullable=c[2] == "YES",
-                        default=c[3],
-                        is_primary=c[4],
-                    )
-                    for c in cols_result
-                ]
+                columns = await self._get_columns(conn, schema, table_name)
                 
                 try:
                     count_result = await conn.execute(
@@ -174,28 +275,81 @@ class DatabaseManager:
             
             return tables
     
+    async def _get_columns(self, conn, schema: str, table: str) -> List[ColumnInfo]:
+        """Introspect table columns (with primary key flag)."""
+        cols_result = await conn.execute(text('''
+            SELECT 
+                c.column_name, 
+                c.data_type, 
+                c.is_nullable,
+                c.column_default,
+                CASE WHEN pk.column_name IS NOT NULL THEN true ELSE false END as is_primary
+            FROM information_schema.columns c
+            LEFT JOIN (
+                SELECT ku.column_name
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage ku 
+                    ON tc.constraint_name = ku.constraint_name
+                WHERE tc.table_schema = :schema 
+                AND tc.table_name = :table
+                AND tc.constraint_type = 'PRIMARY KEY'
+            ) pk ON c.column_name = pk.column_name
+            WHERE c.table_schema = :schema AND c.table_name = :table
+            ORDER BY c.ordinal_position
+        '''), {"schema": schema, "table": table})
+        
+        return [
+            ColumnInfo(
+                name=c[0],
+                type=c[1],
+                nullable=c[2] == "YES",
+                default=c[3],
+                is_primary=c[4],
+            )
+            for c in cols_result
+        ]
+    
+    async def get_columns(self, project_id: int, table: str) -> List[ColumnInfo]:
+        """List columns of a single table (empty if table doesn't exist)."""
+        if not self._validate_identifier(table):
+            return []
+        
+        engine = await self._engine(project_id)
+        async with engine.connect() as conn:
+            return await self._get_columns(conn, self._schema_name(project_id), table)
+    
     async def get_table_data(
         self,
         project_id: int,
         table: str,
         limit: int = 100,
         offset: int = 0,
+        serialize: bool = True,
     ) -> QueryResult:
-        """Get data from a table."""
+        """
+        Get data from a table.
+        
+        serialize=False keeps raw driver values (for columnar encodings).
+        """
         schema = self._schema_name(project_id)
         
         if not self._validate_identifier(table):
             return QueryResult([], [], 0, "Invalid table name")
         
+        sql = f'SELECT * FROM "{schema}"."{table}" LIMIT :limit OFFSET :offset'
+        started = time.perf_counter()
+        
         try:
-            async with self.engine.connect() as conn:
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
                 result = await conn.execute(
-                    text(f'SELECT * FROM "{schema}"."{table}" LIMIT :limit OFFSET :offset'),
+                    text(sql),
                     {"limit": limit, "offset": offset}
                 )
                 
                 columns = list(result.keys())
-                rows = [[self._serialize_value(cell) for cell in row] for row in result]
+                rows = self._fetch_rows(result, serialize)
+                self._record(project_id, sql, started, len(rows))
                 
                 return QueryResult(
                     columns=columns,
@@ -203,6 +357,7 @@ class DatabaseManager:
                     affected_rows=len(rows),
                 )
         except Exception as e:
+            self._record(project_id, sql, started, error=e)
             return QueryResult([], [], 0, str(e))
     
     async def execute_sql(
@@ -210,8 +365,24 @@ class DatabaseManager:
         project_id: int,
         sql: str,
         readonly: bool = False,
+        plan: Optional[str] = None,
+        confirmed: bool = False,
+        serialize: bool = True,
     ) -> QueryResult:
-        """Execute SQL in project's schema."""
+        """
+        Execute SQL in project's schema.
+        
+        With cost guard enabled, SELECTs are EXPLAINed first and checked
+        against the budget of `plan`. Expensive queries come back with
+        needs_confirmation=True until re-sent with confirmed=True.
+        serialize=False keeps raw driver values (for columnar encodings).
+        
+        Projects over the storage limit of `plan` can only run statements
+        that don't grow the schema.
+        
+        readonly=True runs in a READ ONLY transaction (on the replica if
+        configured), and small results are cached until the next write.
+        """
         schema = self._schema_name(project_id)
         sql = sql.strip()
         
@@ -225,24 +396,209 @@ class DatabaseManager:
         if readonly and not sql_upper.startswith('SELECT'):
             return QueryResult([], [], 0, "Only SELECT allowed in readonly mode")
         
+        if not readonly:
+            quota_error = self.storage_error(project_id, plan, sql)
+            if quota_error:
+                return QueryResult([], [], 0, quota_error)
+        
+        version = self.data_version(project_id)
+        if readonly and self.query_cache:
+            cached = self.query_cache.get(project_id, version, sql, serialize)
+            if cached is not None:
+                return cached
+        
+        if readonly and self.prepared:
+            await self.prepared.refresh(self.engine)
+            if project_id in self.prepared.enabled:
+                query_result = await self._execute_prepared(project_id, sql, plan, confirmed, serialize)
+                if query_result is not None:
+                    if self.query_cache:
+                        self.query_cache.put(project_id, version, sql, query_result, serialize)
+                    return query_result
+        
+        engine = await self._read_engine(project_id) if readonly else await self._engine(project_id)
+        started = time.perf_counter()
+        
         try:
-            async with self.engine.connect() as conn:
+            async with engine.connect() as conn:
+                if readonly:
+                    await conn.execute(text("SET TRANSACTION READ ONLY"))
                 await conn.execute(text(f'SET search_path TO "{schema}"'))
-                await conn.execute(text("SET statement_timeout = '30s'"))
                 
+                rejected, estimated_cost, timeout_ms = await self._guard(conn, project_id, sql, plan, confirmed)
+                if rejected:
+                    return rejected
+                await conn.execute(text(f"SET statement_timeout = '{timeout_ms}ms'"))
+                
+                started = time.perf_counter()
                 result = await conn.execute(text(sql))
                 
                 if result.returns_rows:
                     columns = list(result.keys())
-                    rows = [[self._serialize_value(cell) for cell in row] for row in result]
-                    return QueryResult(columns, rows, len(rows))
+                    rows = self._fetch_rows(result, serialize)
+                    query_result = QueryResult(columns, rows, len(rows), estimated_cost=estimated_cost)
                 else:
+                    query_result = QueryResult([], [], result.rowcount)
+                
+                if readonly:
+                    if self.query_cache:
+                        self.query_cache.put(project_id, version, sql, query_result, serialize)
+                else:
+                    # Also commits INSERT ... RETURNING; a SELECT here may call
+                    # functions that write, so any non-readonly statement invalidates
                     await conn.commit()
-                    return QueryResult([], [], result.rowcount)
+                    self._bump_version(project_id, schema=is_ddl(sql))
+                
+                self._record(project_id, sql, started, query_result.affected_rows)
+                return query_result
                     
         except Exception as e:
+            self._record(project_id, sql, started, error=e)
             return QueryResult([], [], 0, str(e))
     
+    async def _guard(
+        self,
+        conn,
+        project_id: int,
+        sql: str,
+        plan: Optional[str],
+        confirmed: bool,
+    ) -> Tuple[Optional[QueryResult], Optional[float], int]:
+        """Cost guard pre-flight: (rejection or None, estimated cost, statement timeout ms)."""
+        if not self.cost_guard or not is_select(sql):
+            return None, None, 30000
+        
+        verdict = await self.cost_guard.check(conn, project_id, sql, plan)
+        if not verdict.allowed:
+            return QueryResult([], [], 0, verdict.reason, estimated_cost=verdict.total_cost), verdict.total_cost, 0
+        if verdict.needs_confirmation and not confirmed:
+            rejected = QueryResult(
+                [], [], 0, verdict.reason,
+                needs_confirmation=True,
+                estimated_cost=verdict.total_cost,
+            )
+            return rejected, verdict.total_cost, 0
+        return None, verdict.total_cost, verdict.timeout_ms
+    
+    async def _execute_prepared(
+        self,
+        project_id: int,
+        sql: str,
+        plan: Optional[str],
+        confirmed: bool,
+        serialize: bool,
+    ) -> Optional[QueryResult]:
+        """
+        Run read-only SELECT on project's pinned connection via a cached
+        prepared statement. None if the pinned connection is busy.
+        """
+        engine = await self._engine(project_id)
+        try:
+            pinned = await self.prepared.acquire(
+                project_id, engine, self._schema_name(project_id), self.schema_version(project_id)
+            )
+        except Exception as e:
+            logger.warning(f"Can't pin connection for project {project_id}: {e}")
+            return None
+        if pinned is None:
+            return None
+        
+        started = time.perf_counter()
+        try:
+            rejected, estimated_cost, timeout_ms = await self._guard(pinned.conn, project_id, sql, plan, confirmed)
+            if rejected:
+                return rejected
+            
+            started = time.perf_counter()
+            columns, records = await self.prepared.fetch(pinned, sql, timeout_ms / 1000)
+            rows = self._fetch_rows(records, serialize)
+            
+            self._record(project_id, sql, started, len(rows))
+            return QueryResult(columns, rows, len(rows), estimated_cost=estimated_cost)
+        except Exception as e:
+            self._record(project_id, sql, started, error=e)
+            return QueryResult([], [], 0, str(e))
+        finally:
+            pinned.lock.release()
+            if pinned.raw.is_closed():
+                await self.prepared.unpin(project_id)
+    
+    def storage_error(self, project_id: int, plan: Optional[str], sql: Optional[str] = None) -> Optional[str]:
+        """Error if project is over its plan's storage limit (from the last sample)."""
+        if not self.storage:
+            return None
+        return self.storage.check_write(project_id, plan, sql)
+    
+    async def import_data(
+        self,
+        project_id: int,
+        table: str,
+        chunks: AsyncIterator[bytes],
+        format: str = "csv",
+    ) -> ImportProgress:
+        """
+        Stream CSV (with header) or NDJSON into table via COPY FROM STDIN.
+        
+        Columns are validated against the table before any data is sent.
+        Progress is available in self.imports[project_id] while running.
+        """
+        schema = self._schema_name(project_id)
+        progress = ImportProgress(table=table, format=format)
+        
+        running = self.imports.get(project_id)
+        if running and running.status == "running":
+            progress.status = "failed"
+            progress.error = f"Import into {running.table} already running"
+            return progress
+        self.imports[project_id] = progress
+        
+        try:
+            if not self._validate_identifier(table):
+                raise ImportFormatError("Invalid table name")
+            
+            columns = await self.get_columns(project_id, table)
+            if not columns:
+                raise ImportFormatError(f"Table {table} not found")
+            
+            if format == "csv":
+                names, first = await read_csv_header(chunks, progress)
+                body = csv_body(first, chunks, progress)
+            elif format == "ndjson":
+                names, first = await read_ndjson_columns(chunks, progress)
+                body = ndjson_body(first, chunks, names, progress)
+            else:
+                raise ImportFormatError(f"Unsupported format: {format}")
+            
+            error = validate_columns(names, columns)
+            if error:
+                raise ImportFormatError(error)
+            
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
+                raw = await conn.get_raw_connection()
+                status = await raw.driver_connection.copy_to_table(
+                    table,
+                    source=body,
+                    columns=names,
+                    schema_name=schema,
+                    format="csv",
+                )
+            
+            progress.rows = int(status.split()[-1])
+            progress.status = "done"
+            
+            self._bump_version(project_id)
+            
+            logger.info(f"Imported {progress.rows} rows into {schema}.{table}")
+        except Exception as e:
+            progress.status = "failed"
+            progress.error = str(e)
+            logger.warning(f"Import failed for project {project_id}: {e}")
+        finally:
+            progress.finished_at = time.time()
+        
+        return progress
+    
     async def apply_migration(
         self,
         project_id: int,
@@ -250,34 +606,320 @@ class DatabaseManager:
         description: str = "",
     ) -> QueryResult:
         """Apply migration."""
+        result = await self.apply_migrations(
+            project_id,
+            [MigrationStep(sql=sql, description=description)],
+            skip_applied=False,
+        )
+        return QueryResult([], [], 0, result.error)
+    
+    async def _relation_locks(self, conn, schema: str) -> List[str]:
+        """Relation locks held by this backend on project's tables."""
+        result = await conn.execute(text('''
+            SELECT l.mode, c.relname
+            FROM pg_locks l
+            JOIN pg_class c ON c.oid = l.relation
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE l.pid = pg_backend_pid()
+            AND l.granted
+            AND n.nspname = :schema
+            ORDER BY c.relname, l.mode
+        '''), {"schema": schema})
+        return [f"{row[0]} on {row[1]}" for row in result]
+    
+    async def apply_migrations(
+        self,
+        project_id: int,
+        migrations: List[MigrationStep],
+        dry_run: bool = False,
+        skip_applied: bool = True,
+    ) -> BatchMigrationResult:
+        """
+        Apply ordered migrations in one transaction.
+        
+        - lock_timeout makes a migration blocked by tenant traffic fail fast
+          instead of queueing every query behind its lock
+        - checksums go to _migrations; with skip_applied, steps whose
+          checksum is already recorded are skipped
+        - dry_run executes everything, reports timing and locks, rolls back
+        """
         schema = self._schema_name(project_id)
+        steps = [
+            MigrationStepResult(description=m.description, checksum=m.checksum, status="not_run")
+            for m in migrations
+        ]
+        started = time.perf_counter()
+        error = None
+        
+        if not dry_run and any(is_concurrent_index(m.sql) for m in migrations):
+            if len(migrations) > 1:
+                return BatchMigrationResult(
+                    steps=steps,
+                    dry_run=False,
+                    duration_ms=0.0,
+                    error="CREATE INDEX CONCURRENTLY can't run in a transaction; apply it as a separate migration",
+                )
+            return await self._apply_concurrent_index(project_id, migrations[0], steps[0], skip_applied, started)
         
         try:
-            async with self.engine.begin() as conn:
-                await conn.execute(text(f'SET search_path TO "{schema}"'))
-                await conn.execute(text(sql))
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
+                await conn.begin()
+                await conn.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+                await conn.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout_ms}ms'"))
+                await conn.execute(text(
+                    'ALTER TABLE _migrations ADD COLUMN IF NOT EXISTS checksum TEXT'
+                ))
                 
-                await conn.execute(
-                    text('''
-                        INSERT INTO _migrations (description, sql) 
-                        VALUES (:desc, :sql)
-                    '''),
-                    {"desc": description, "sql": sql}
-                )
+                applied = set()
+                if skip_applied:
+                    result = await conn.execute(text(
+                        'SELECT checksum FROM _migrations WHERE checksum IS NOT NULL'
+                    ))
+                    applied = {row[0] for row in result}
                 
-                logger.info(f"Applied migration for project {project_id}: {description}")
-                return QueryResult([], [], 0)
+                for migration, step in zip(migrations, steps):
+                    if step.checksum in applied:
+                        step.status = "skipped"
+                        continue
+                    
+                    locks_before = set(await self._relation_locks(conn, schema)) if dry_run else set()
+                    step_started = time.perf_counter()
+                    sql = migration.sql
+                    if dry_run and is_concurrent_index(sql):
+                        sql = without_concurrently(sql)  # same index build, inside the rollback
+                    try:
+                        await conn.execute(text(sql))
+                    except Exception as e:
+                        step.status = "failed"
+                        step.error = str(e)
+                        error = f"Migration '{migration.description}' failed: {e}"
+                        break
+                    finally:
+                        step.duration_ms = round((time.perf_counter() - step_started) * 1000, 2)
+                    
+                    if dry_run:
+                        locks = await self._relation_locks(conn, schema)
+                        step.locks = [lock for lock in locks if lock not in locks_before]
+                        step.status = "dry_run"
+                    else:
+                        step.status = "applied"
+                    
+                    await conn.execute(
+                        text('''
+                            INSERT INTO _migrations (description, sql, checksum) 
+                            VALUES (:desc, :sql, :checksum)
+                        '''),
+                        {"desc": migration.description, "sql": migration.sql, "checksum": step.checksum}
+                    )
+                    applied.add(step.checksum)
                 
+                if dry_run or error:
+                    await conn.rollback()
+                else:
+                    await conn.commit()
+        
         except Exception as e:
-            logger.error(f"Migration failed for project {project_id}: {e}")
-            return QueryResult([], [], 0, str(e))
+            error = str(e)
+        
+        if error:
+            for step in steps:
+                if step.status == "applied":
+                    step.status = "not_run"  # rolled back with the rest
+            logger.error(f"Migration failed for project {project_id}: {error}")
+        elif not dry_run:
+            self._bump_version(project_id, schema=True)
+            logger.info(f"Applied {len(migrations)} migration(s) for project {project_id}")
+        
+        return BatchMigrationResult(
+            steps=steps,
+            dry_run=dry_run,
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+            error=error,
+        )
+    
+    async def _apply_concurrent_index(
+        self,
+        project_id: int,
+        migration: MigrationStep,
+        step: MigrationStepResult,
+        skip_applied: bool,
+        started: float,
+    ) -> BatchMigrationResult:
+        """
+        Run CREATE INDEX CONCURRENTLY outside a transaction (autocommit).
+        
+        A failed build leaves an INVALID index behind; it is dropped so the
+        migration can simply be retried.
+        """
+        schema = self._schema_name(project_id)
+        error = None
+        
+        try:
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(f'SET search_path TO "{schema}"'))
+                await conn.execute(text(f"SET lock_timeout = '{self.lock_timeout_ms}ms'"))
+                try:
+                    await conn.execute(text(
+                        'ALTER TABLE _migrations ADD COLUMN IF NOT EXISTS checksum TEXT'
+                    ))
+                    if skip_applied:
+                        result = await conn.execute(
+                            text('SELECT 1 FROM _migrations WHERE checksum = :checksum'),
+                            {"checksum": step.checksum}
+                        )
+                        if result.scalar() is not None:
+                            step.status = "skipped"
+                    
+                    if step.status != "skipped":
+                        step_started = time.perf_counter()
+                        try:
+                            await conn.execute(text(migration.sql))
+                            step.status = "applied"
+                        except Exception as e:
+                            step.status = "failed"
+                            step.error = str(e)
+                            error = f"Migration '{migration.description}' failed: {e}"
+                        finally:
+                            step.duration_ms = round((time.perf_counter() - step_started) * 1000, 2)
+                        
+                        if error:
+                            await self._drop_invalid_index(conn, schema, concurrent_index_name(migration.sql))
+                        else:
+                            await conn.execute(
+                                text('''
+                                    INSERT INTO _migrations (description, sql, checksum)
+                                    VALUES (:desc, :sql, :checksum)
+                                '''),
+                                {"desc": migration.description, "sql": migration.sql, "checksum": step.checksum}
+                            )
+                finally:
+                    # Session settings, connection goes back to the pool
+                    await conn.execute(text('RESET search_path'))
+                    await conn.execute(text('RESET lock_timeout'))
+        
+        except Exception as e:
+            error = error or str(e)
+        
+        if error:
+            logger.error(f"Migration failed for project {project_id}: {error}")
+        elif step.status == "applied":
+            self._bump_version(project_id, schema=True)
+            logger.info(f"Applied concurrent index migration for project {project_id}")
+        
+        return BatchMigrationResult(
+            steps=[step],
+            dry_run=False,
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+            error=error,
+        )
+    
+    async def _drop_invalid_index(self, conn, schema: str, name: Optional[str]):
+        """Drop a leftover INVALID index from a failed concurrent build."""
+        if not name:
+            return
+        result = await conn.execute(text('''
+            SELECT 1 FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = :name AND NOT i.indisvalid
+        '''), {"schema": schema, "name": name})
+        if result.scalar() is not None:
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {quote_ident(schema)}.{quote_ident(name)}'))
+    
+    async def _advisor_transaction(self, conn, schema: str):
+        await conn.begin()
+        await conn.execute(text('SET TRANSACTION READ ONLY'))
+        await conn.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+        await conn.execute(text("SET LOCAL statement_timeout = '5s'"))
+    
+    async def advise_indexes(self, project_id: int, limit: int = 10) -> Dict[str, Any]:
+        """
+        Heuristic index proposals for the project's most expensive SELECTs.
+        
+        Returns the proposals plus the plans and example queries they came
+        from, so AI proposals can be built on and costed against the same set.
+        """
+        schema = self._schema_name(project_id)
+        queries: Dict[str, str] = {}
+        if self.query_stats:
+            for stats in self.query_stats.top(project_id, by="total", limit=limit * 3):
+                if is_select(stats.example) and len(queries) < limit:
+                    queries[stats.fingerprint] = stats.example
+        
+        plans: Dict[str, Any] = {}
+        proposals: List[IndexProposal] = []
+        hypothetical = False
+        
+        engine = await self._engine(project_id)
+        async with engine.connect() as conn:
+            await self._advisor_transaction(conn, schema)
+            try:
+                for fingerprint, sql in list(queries.items()):
+                    try:
+                        async with conn.begin_nested():
+                            result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+                            plans[fingerprint] = result.scalar()
+                    except Exception as e:
+                        logger.debug(f"Can't explain {fingerprint} for project {project_id}: {e}")
+                        queries.pop(fingerprint)
+                        continue
+                    proposals += proposals_from_plan(plans[fingerprint], fingerprint)
+                
+                indexes = await existing_index_columns(conn, schema)
+                proposals = [p for p in merge_proposals(proposals) if not is_covered(p, indexes)]
+                
+                if proposals and await has_hypopg(conn):
+                    hypothetical = True
+                    await self._cost_proposals(conn, proposals, queries)
+            finally:
+                await conn.rollback()
+        
+        proposals.sort(key=lambda p: p.benefit or 0, reverse=True)
+        return {
+            "proposals": proposals,
+            "plans": plans,
+            "queries": queries,
+            "indexes": indexes,
+            "hypothetical": hypothetical,
+        }
+    
+    async def estimate_indexes(
+        self,
+        project_id: int,
+        proposals: List[IndexProposal],
+        queries: Dict[str, str],
+    ) -> bool:
+        """Cost proposals (e.g. from AI) with HypoPG. False if it isn't installed."""
+        schema = self._schema_name(project_id)
+        engine = await self._engine(project_id)
+        async with engine.connect() as conn:
+            await self._advisor_transaction(conn, schema)
+            try:
+                if not await has_hypopg(conn):
+                    return False
+                await self._cost_proposals(conn, proposals, queries)
+                return True
+            finally:
+                await conn.rollback()
+    
+    async def _cost_proposals(self, conn, proposals: List[IndexProposal], queries: Dict[str, str]):
+        for proposal in proposals:
+            try:
+                async with conn.begin_nested():
+                    await cost_with_hypothetical_index(conn, proposal, queries)
+            except Exception as e:
+                logger.debug(f"Can't cost {proposal.sql}: {e}")
     
     async def get_migrations(self, project_id: int) -> List[MigrationInfo]:
         """Get list of applied migrations."""
         schema = self._schema_name(project_id)
         
         try:
-            async with self.engine.connect() as conn:
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
                 result = await conn.execute(text(f'''
                     SELECT id, description, sql, applied_at
                     FROM "{schema}"._migrations
@@ -296,6 +938,230 @@ class DatabaseManager:
         except:
             return []
     
+    async def move_project(
+        self,
+        project_id: int,
+        target_shard: str,
+        keep_source: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Move project schema to another shard.
+        
+        Source tables are locked IN EXCLUSIVE MODE for the copy: reads keep
+        working, writes wait. The shard override is switched before the
+        locks are released and the source schema is dropped in the same
+        transaction, so waiting writers fail instead of writing to the old copy.
+        """
+        schema = self._schema_name(project_id)
+        source_shard = self.shard_map.shard_for(project_id)
+        
+        if source_shard == target_shard:
+            return {"project_id": project_id, "shard": target_shard, "moved": False}
+        
+        source_engine = self.shard_map.engine(source_shard)
+        target_engine = self.shard_map.engine(target_shard)
+        started = time.perf_counter()
+        rows = 0
+        
+        async with source_engine.connect() as src:
+            await src.begin()
+            ddl = await introspect_schema(src, schema)
+            await src.execute(text(f"SET LOCAL lock_timeout = '{self.lock_timeout_ms}ms'"))
+            for table in ddl.tables:
+                await src.execute(text(f'LOCK TABLE {quote_ident(table)} IN EXCLUSIVE MODE'))
+            
+            async with target_engine.connect() as dst:
+                await dst.begin()
+                await dst.execute(text(f'CREATE SCHEMA "{schema}"'))
+                await dst.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+                for statement in ddl.pre_data:
+                    await dst.execute(text(statement))
+                
+                src_raw = (await src.get_raw_connection()).driver_connection
+                dst_raw = (await dst.get_raw_connection()).driver_connection
+                for table in ddl.tables:
+                    rows += await copy_table(src_raw, dst_raw, schema, table, ddl.copy_columns[table])
+                
+                for statement in ddl.post_data:
+                    await dst.execute(text(statement))
+                await dst.commit()
+            
+            await self.shard_map.set_override(project_id, target_shard)
+            
+            if not keep_source:
+                await src.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+            await src.commit()
+        
+        self._bump_version(project_id, schema=True)
+        if self.prepared:
+            await self.prepared.unpin(project_id)  # pinned to the old shard
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Moved project {project_id} from {source_shard} to {target_shard}: "
+            f"{len(ddl.tables)} tables, {rows} rows in {elapsed:.1f}s"
+        )
+        
+        return {
+            "project_id": project_id,
+            "shard": target_shard,
+            "moved": True,
+            "from": source_shard,
+            "tables": len(ddl.tables),
+            "rows": rows,
+            "seconds": round(elapsed, 3),
+        }
+    
+    async def schema_exists(self, project_id: int) -> bool:
+        engine = await self._engine(project_id)
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text('SELECT 1 FROM pg_namespace WHERE nspname = :schema'),
+                {"schema": self._schema_name(project_id)}
+            )
+            return result.scalar() is not None
+    
+    async def export_snapshot(self, project_id: int, compress_level: int = 1) -> AsyncIterator[bytes]:
+        """
+        Stream compressed snapshot (DDL + COPY data) of project schema.
+        
+        Runs in one REPEATABLE READ, READ ONLY transaction: tables are
+        consistent with each other and writers are never blocked.
+        """
+        schema = self._schema_name(project_id)
+        progress = SnapshotProgress(operation="export")
+        self.snapshots[project_id] = progress
+        
+        try:
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
+                conn = await conn.execution_options(isolation_level="REPEATABLE READ")
+                await conn.begin()
+                await conn.execute(text('SET TRANSACTION READ ONLY'))
+                async for chunk in write_snapshot(conn, schema, progress, compress_level):
+                    yield chunk
+                await conn.rollback()
+            
+            progress.status = "done"
+            progress.finished_at = time.time()
+            logger.info(
+                f"Exported project {project_id}: {progress.tables} tables, "
+                f"{progress.bytes_raw / 1024 / 1024:.1f} MB at {progress.mb_per_s} MB/s"
+            )
+        except BaseException as e:  # also client disconnect (GeneratorExit)
+            progress.status = "failed"
+            progress.error = str(e) or type(e).__name__
+            raise
+        finally:
+            progress.finished_at = progress.finished_at or time.time()
+    
+    async def restore_snapshot(
+        self,
+        project_id: int,
+        chunks: AsyncIterator[bytes],
+        replace: bool = False,
+    ) -> SnapshotProgress:
+        """
+        Restore snapshot into project schema, in one transaction.
+        
+        The schema must not exist unless replace=True, in which case the old
+        one is dropped in the same transaction (a failed restore keeps it).
+        """
+        schema = self._schema_name(project_id)
+        progress = SnapshotProgress(operation="restore")
+        self.snapshots[project_id] = progress
+        
+        try:
+            reader = SnapshotReader(chunks, progress)
+            manifest = await reader.manifest()
+            tables = set(manifest["tables"])
+            
+            engine = await self._engine(project_id)
+            async with engine.connect() as conn:
+                await conn.begin()
+                exists = await conn.execute(
+                    text('SELECT 1 FROM pg_namespace WHERE nspname = :schema'),
+                    {"schema": schema}
+                )
+                if exists.scalar() is not None:
+                    if not replace:
+                        raise SnapshotError("Database already exists, restore with replace=true")
+                    await conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+                
+                await conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+                await conn.execute(text(f'SET LOCAL search_path TO "{schema}"'))
+                for statement in manifest["pre_data"]:
+                    await conn.execute(text(check_ddl(statement)))
+                
+                raw = (await conn.get_raw_connection()).driver_connection
+                while True:
+                    kind, payload = await reader.frame()
+                    if kind == b"Z":
+                        break
+                    if kind != b"T":
+                        raise SnapshotError(f"Unexpected frame {kind!r}")
+                    table = json.loads(payload)["table"]
+                    if table not in tables:
+                        raise SnapshotError(f"Table {table} not in manifest")
+                    status = await raw.copy_to_table(
+                        table,
+                        schema_name=schema,
+                        columns=manifest["copy_columns"][table],
+                        format="binary",
+                        source=reader.table_data(),
+                    )
+                    progress.rows += int(status.split()[-1])
+                    progress.tables += 1
+                
+                for statement in manifest["post_data"]:
+                    await conn.execute(text(check_ddl(statement)))
+                await reader.finish()
+                await conn.commit()
+            
+            self._bump_version(project_id, schema=True)
+            progress.status = "done"
+            progress.finished_at = time.time()
+            logger.info(
+                f"Restored project {project_id} from {manifest['schema']}: {progress.tables} tables, "
+                f"{progress.rows} rows, {progress.mb_per_s} MB/s"
+            )
+        except Exception as e:
+            progress.status = "failed"
+            progress.error = str(e)
+            logger.warning(f"Restore failed for project {project_id}: {e}")
+        finally:
+            progress.finished_at = progress.finished_at or time.time()
+        
+        return progress
+    
+    async def clone_database(self, source_id: int, target_id: int, replace: bool = False) -> SnapshotProgress:
+        """Copy one project's schema into another (e.g. a preview environment)."""
+        chunks = self.export_snapshot(source_id)
+        try:
+            return await self.restore_snapshot(target_id, chunks, replace=replace)
+        finally:
+            await chunks.aclose()  # release source connection if restore stopped early
+    
+    async def pin_existing_projects(self) -> Dict[int, str]:
+        """
+        Record overrides for schemas that exist somewhere other than their hashed shard.
+        
+        Run once after adding shards, so existing projects stay where they are.
+        """
+        pinned = {}
+        
+        for shard in self.shard_map.shards:
+            async with self.shard_map.engine(shard).connect() as conn:
+                result = await conn.execute(text(
+                    "SELECT nspname FROM pg_namespace WHERE nspname ~ '^project_[0-9]+$'"
+                ))
+                for row in result:
+                    project_id = int(row[0].split("_", 1)[1])
+                    if self.shard_map.shard_for(project_id) != shard:
+                        await self.shard_map.set_override(project_id, shard)
+                        pinned[project_id] = shard
+        
+        return pinned
+    
     async def get_schema_sql(self, project_id: int) -> str:
         """Get current schema as SQL (for AI context)."""
         tables = await self.get_tables(project_id)
@@ -321,6 +1187,34 @@ class DatabaseManager:
         
         return "\n\n".join(sql_parts)
     
+    def _record(
+        self,
+        project_id: int,
+        sql: str,
+        started: float,
+        rows: int = 0,
+        error: Optional[Exception] = None,
+    ):
+        """Record statement in query stats (if enabled)."""
+        if not self.query_stats:
+            return
+        
+        error_class = None
+        if error is not None:
+            # SQLAlchemy wraps driver errors: DBAPIError.orig -> adapter -> asyncpg error
+            orig = getattr(error, "orig", None)
+            cause = getattr(orig, "__cause__", None)
+            error_class = type(cause or orig or error).__name__
+        
+        duration_ms = (time.perf_counter() - started) * 1000
+        self.query_stats.record(project_id, sql, duration_ms, rows, error_class)
+    
+    def _fetch_rows(self, result, serialize: bool = True) -> List[List[Any]]:
+        """Fetch result rows, optionally serializing each cell for JSON."""
+        if not serialize:
+            return [list(row) for row in result]
+        return [[self._serialize_value(cell) for cell in row] for row in result]
+    
     def _serialize_value(self, value: Any) -> Any:
         """Convert database values to JSON-serializable format."""
         if value is None:
@@ -338,5 +1232,21 @@ def get_database_manager() -> DatabaseManager:
     global database_manager
     if database_manager is None:
         from ..core.config import settings
-        database_manager = DatabaseManager(settings.DATABASE_URL)
+        database_manager = DatabaseManager(
+            settings.DATABASE_URL,
+            shard_map=ShardMap(
+                {**settings.DATABASE_SHARDS, DEFAULT_SHARD: settings.DATABASE_URL},
+                overrides=settings.DATABASE_SHARD_OVERRIDES,
+            ),
+            cost_guard=CostGuard() if settings.SQL_COST_GUARD else None,
+            replica_url=settings.DATABASE_REPLICA_URL or None,
+            query_cache=QueryCache(max_rows=settings.QUERY_CACHE_MAX_ROWS) if settings.QUERY_CACHE_MAX_ROWS else None,
+            query_stats=QueryStatsCollector(slow_ms=settings.SLOW_QUERY_MS),
+            prepared=PreparedStatementCache(
+                max_statements=settings.PREPARED_STATEMENT_CACHE_SIZE,
+                max_connections=settings.PREPARED_STATEMENT_CONNECTIONS,
+            ) if settings.PREPARED_STATEMENT_CONNECTIONS else None,
+            storage=StorageSampler(retention_days=settings.STORAGE_USAGE_RETENTION_DAYS),
+            lock_timeout_ms=settings.MIGRATION_LOCK_TIMEOUT_MS,
+        )
     return database_manager
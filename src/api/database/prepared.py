@@ -0,0 +1,226 @@
+"""
+Prepared Statements - per-project cache on pinned connections.
+
+Opt-in per project. An enabled project gets one pinned, read-only
+connection (outside the shared pool) holding an LRU of server-side
+prepared statements keyed by normalized SQL. A repeated SELECT then skips
+parse/plan and just executes.
+
+- Statements are dropped when the project's schema version changes
+  (migrations, DDL, restore); PostgreSQL also re-plans on DDL by itself,
+  and a "cached plan must not change result type" error re-prepares once
+- Pinned connections are LRU-bounded across projects
+- A busy pinned connection is never waited on: the caller falls back to
+  the regular pooled path
+
+Opt-in flags live in project_db_options on the default shard and are
+re-read every refresh_seconds, like shard overrides.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import time
+import logging
+
+from asyncpg.exceptions import InvalidCachedStatementError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from .sqltext import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PinnedConnection:
+    project_id: int
+    conn: AsyncConnection  # autocommit, default_transaction_read_only
+    raw: Any  # asyncpg connection
+    schema_version: int
+    statements: "OrderedDict[str, Any]" = field(default_factory=OrderedDict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    hits: int = 0
+    misses: int = 0
+
+
+class PreparedStatementCache:
+    """
+    Pinned connections and their prepared statements, per project.
+    """
+
+    def __init__(
+        self,
+        max_statements: int = 100,
+        max_connections: int = 10,
+        refresh_seconds: float = 10.0,
+    ):
+        self.max_statements = max_statements
+        self.max_connections = max_connections
+        self.refresh_seconds = refresh_seconds
+        self.pinned: "OrderedDict[int, PinnedConnection]" = OrderedDict()
+        self.enabled: Set[int] = set()
+        self._engines: Dict[str, AsyncEngine] = {}
+        self._loaded_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    async def _ensure_table(self, conn):
+        await conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS project_db_options (
+                project_id INTEGER PRIMARY KEY,
+                prepared_statements BOOLEAN NOT NULL DEFAULT FALSE,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        '''))
+
+    async def refresh(self, engine: AsyncEngine, force: bool = False):
+        """Reload opt-in flags from project_db_options."""
+        if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+
+        async with self._refresh_lock:
+            if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            try:
+                async with engine.begin() as conn:
+                    await self._ensure_table(conn)
+                    result = await conn.execute(text(
+                        'SELECT project_id FROM project_db_options WHERE prepared_statements'
+                    ))
+                    self.enabled = {row[0] for row in result}
+            except Exception as e:
+                logger.warning(f"Failed to load prepared statement options: {e}")
+            self._loaded_at = time.monotonic()
+
+        for project_id in [p for p in self.pinned if p not in self.enabled]:
+            await self.unpin(project_id)
+
+    async def set_enabled(self, engine: AsyncEngine, project_id: int, enabled: bool):
+        """Opt project in or out (persisted)."""
+        async with engine.begin() as conn:
+            await self._ensure_table(conn)
+            await conn.execute(text('''
+                INSERT INTO project_db_options (project_id, prepared_statements)
+                VALUES (:project_id, :enabled)
+                ON CONFLICT (project_id) DO UPDATE
+                SET prepared_statements = EXCLUDED.prepared_statements, updated_at = NOW()
+            '''), {"project_id": project_id, "enabled": enabled})
+
+        if enabled:
+            self.enabled.add(project_id)
+        else:
+            self.enabled.discard(project_id)
+            await self.unpin(project_id)
+
+    def _pin_engine(self, engine: AsyncEngine) -> AsyncEngine:
+        """Unpooled engine for the same server: pins don't take shared pool slots."""
+        key = engine.url.render_as_string(hide_password=False)
+        if key not in self._engines:
+            self._engines[key] = create_async_engine(engine.url, poolclass=NullPool)
+        return self._engines[key]
+
+    async def acquire(
+        self,
+        project_id: int,
+        engine: AsyncEngine,
+        schema: str,
+        schema_version: int,
+    ) -> Optional[PinnedConnection]:
+        """
+        Pinned connection of project with its lock held, or None if it's busy.
+        Caller must release pinned.lock.
+        """
+        pinned = self.pinned.get(project_id)
+        if pinned is not None and pinned.raw.is_closed():
+            await self.unpin(project_id)
+            pinned = None
+
+        if pinned is None:
+            conn = await self._pin_engine(engine).connect()
+            try:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                await conn.execute(text(f'SET search_path TO "{schema}"'))
+                await conn.execute(text('SET default_transaction_read_only = on'))
+                await conn.execute(text("SET statement_timeout = '30s'"))
+                raw = (await conn.get_raw_connection()).driver_connection
+            except BaseException:
+                await conn.close()
+                raise
+            if project_id in self.pinned:  # pinned concurrently while we connected
+                await conn.close()
+                pinned = self.pinned[project_id]
+            else:
+                pinned = PinnedConnection(project_id, conn, raw, schema_version)
+                self.pinned[project_id] = pinned
+                await self._evict(keep=project_id)
+        self.pinned.move_to_end(project_id)
+
+        if pinned.lock.locked():
+            return None
+        await pinned.lock.acquire()
+
+        if pinned.schema_version != schema_version:
+            pinned.statements.clear()
+            pinned.schema_version = schema_version
+        return pinned
+
+    async def _evict(self, keep: int):
+        """Unpin least recently used idle connections over max_connections."""
+        for project_id in list(self.pinned):
+            if len(self.pinned) <= self.max_connections:
+                return
+            if project_id != keep and not self.pinned[project_id].lock.locked():
+                await self.unpin(project_id)
+
+    async def fetch(self, pinned: PinnedConnection, sql: str, timeout: float) -> Tuple[List[str], List[Any]]:
+        """Execute via cached prepared statement: (column names, records)."""
+        key = normalize_sql(sql)
+        for attempt in range(2):
+            statement = pinned.statements.get(key)
+            if statement is None:
+                pinned.misses += 1
+                statement = await pinned.raw.prepare(sql, timeout=timeout)
+                pinned.statements[key] = statement
+                while len(pinned.statements) > self.max_statements:
+                    pinned.statements.popitem(last=False)  # closed by asyncpg once unreferenced
+            else:
+                pinned.hits += 1
+                pinned.statements.move_to_end(key)
+
+            try:
+                records = await statement.fetch(timeout=timeout)
+            except InvalidCachedStatementError:
+                # Schema changed under us (e.g. DDL from another API worker)
+                pinned.statements.pop(key, None)
+                if attempt:
+                    raise
+                continue
+            return [attribute.name for attribute in statement.get_attributes()], records
+
+    async def unpin(self, project_id: int):
+        pinned = self.pinned.pop(project_id, None)
+        if pinned is None:
+            return
+        pinned.statements.clear()
+        try:
+            await pinned.conn.close()
+        except Exception as e:
+            logger.debug(f"Closing pinned connection of project {project_id}: {e}")
+
+    def stats(self, project_id: int) -> dict:
+        pinned = self.pinned.get(project_id)
+        return {
+            "enabled": project_id in self.enabled,
+            "pinned": pinned is not None,
+            "statements": len(pinned.statements) if pinned else 0,
+            "hits": pinned.hits if pinned else 0,
+            "misses": pinned.misses if pinned else 0,
+        }
+
+    async def close(self):
+        for project_id in list(self.pinned):
+            await self.unpin(project_id)
+        for engine in self._engines.values():
+            await engine.dispose()
@@ -2,8 +2,11 @@
 Database API endpoints for user project databases.
 """
 
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, List, Optional
+import time
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,7 +15,11 @@ from ..core.database import get_db
 from ..models.user import User
 from ..models.project import Project
 from ..auth.router import get_current_user
-from .manager import get_database_manager, TableInfo, QueryResult, MigrationInfo
+from .manager import get_database_manager, TableInfo, QueryResult, MigrationInfo, MigrationStep
+from .importer import IMPORT_FORMATS, ImportProgress
+from .encoding import ARROW_MEDIA_TYPE, negotiate, encode_arrow, encode_columnar_json
+from .snapshot import MEDIA_TYPE as SNAPSHOT_MEDIA_TYPE, SnapshotProgress
+from .advisor import IndexProposal, is_covered, parse_index_statement
 
 
 router = APIRouter()
@@ -39,6 +46,7 @@ class TableSchema(BaseModel):
 class QueryRequest(BaseModel):
     sql: str
     readonly: bool = False
+    confirm: bool = False  # run even if cost guard asks for confirmation
 
 
 class QueryResponse(BaseModel):
@@ -46,6 +54,8 @@ class QueryResponse(BaseModel):
     rows: List[List]
     affected_rows: int
     error: Optional[str] = None
+    needs_confirmation: bool = False
+    estimated_cost: Optional[float] = None
 
 
 class MigrationRequest(BaseModel):
@@ -53,6 +63,27 @@ class MigrationRequest(BaseModel):
     description: str = ""
 
 
+class BatchMigrationRequest(BaseModel):
+    migrations: List[MigrationRequest]
+    dry_run: bool = False
+
+
+class MigrationStepResponse(BaseModel):
+    description: str
+    checksum: str
+    status: str
+    duration_ms: float
+    locks: List[str] = []
+    error: Optional[str] = None
+
+
+class BatchMigrationResponse(BaseModel):
+    steps: List[MigrationStepResponse]
+    dry_run: bool
+    duration_ms: float
+    error: Optional[str] = None
+
+
 class MigrationResponse(BaseModel):
     id: int
     description: str
@@ -60,10 +91,123 @@ class MigrationResponse(BaseModel):
     applied_at: str
 
 
+class ImportResponse(BaseModel):
+    table: str
+    format: str
+    status: str
+    rows: int
+    bytes_read: int
+    elapsed: float
+    error: Optional[str] = None
+
+
+class StatementStatsSchema(BaseModel):
+    fingerprint: str
+    query: str
+    calls: int
+    rows: int
+    errors: Dict[str, int]
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    total_ms: float
+
+
+class SlowQuerySchema(BaseModel):
+    fingerprint: str
+    sql: str
+    duration_ms: float
+    rows: int
+    error: Optional[str] = None
+    at: float
+
+
+class QueryStatsResponse(BaseModel):
+    slowest: List[StatementStatsSchema]
+    most_time: List[StatementStatsSchema]
+    frequent: List[StatementStatsSchema]
+    slow_log: List[SlowQuerySchema]
+
+
+class SnapshotResponse(BaseModel):
+    operation: str
+    status: str
+    tables: int
+    rows: int
+    bytes_raw: int
+    bytes_compressed: int
+    elapsed: float
+    mb_per_s: float
+    error: Optional[str] = None
+
+
+class CloneRequest(BaseModel):
+    source_project_id: int
+    replace: bool = False
+
+
+class PreparedStatementsRequest(BaseModel):
+    enabled: bool
+
+
+class PreparedStatementsResponse(BaseModel):
+    enabled: bool
+    pinned: bool  # has a pinned connection in this API worker
+    statements: int
+    hits: int
+    misses: int
+
+
+class TableUsageSchema(BaseModel):
+    name: str
+    bytes: int
+
+
+class UsagePointSchema(BaseModel):
+    at: str
+    bytes: int
+
+
+class StorageUsageResponse(BaseModel):
+    total_bytes: int
+    limit_bytes: int
+    percent: float
+    over_limit: bool
+    sampled_at: Optional[float] = None
+    tables: List[TableUsageSchema]
+    history: List[UsagePointSchema]
+
+
 class GenerateMigrationRequest(BaseModel):
     request: str  # "Добавь поле avatar в users"
 
 
+class IndexAdviceRequest(BaseModel):
+    limit: int = 10  # slowest statements to analyze
+    use_ai: bool = True
+
+
+class IndexProposalSchema(BaseModel):
+    table: str
+    columns: List[str]
+    sql: str  # CREATE INDEX CONCURRENTLY, ready for /database/migrations
+    description: str
+    reason: str
+    source: str
+    queries: List[str]
+    cost_before: Optional[float] = None
+    cost_after: Optional[float] = None
+    benefit: Optional[float] = None
+
+
+class IndexAdviceResponse(BaseModel):
+    proposals: List[IndexProposalSchema]
+    analyzed_queries: int
+    hypothetical: bool  # costs estimated with HypoPG
+
+
 # ════════════════════════════════════════════
 # Helper
 # ════════════════════════════════════════════
@@ -90,6 +234,56 @@ async def verify_project_access(
     return project
 
 
+def enforce_storage_quota(project_id: int, user: User, sqls: Optional[List[str]] = None):
+    """Reject writes that would grow a project over its plan's storage limit."""
+    db_manager = get_database_manager()
+    for sql in sqls or [None]:
+        error = db_manager.storage_error(project_id, user.plan.value, sql)
+        if error:
+            raise HTTPException(status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail=error)
+
+
+def columnar_response(result: QueryResult, media_type: str) -> Response:
+    """Encode raw (unserialized) result in negotiated columnar format."""
+    if media_type == ARROW_MEDIA_TYPE:
+        return Response(
+            content=encode_arrow(result.columns, result.rows),
+            media_type=media_type,
+        )
+    
+    payload = encode_columnar_json(result.columns, result.rows)
+    payload["affected_rows"] = result.affected_rows
+    return JSONResponse(content=payload, media_type=media_type)
+
+
+def import_response(progress: ImportProgress) -> ImportResponse:
+    """Convert import progress to response."""
+    end = progress.finished_at or time.time()
+    return ImportResponse(
+        table=progress.table,
+        format=progress.format,
+        status=progress.status,
+        rows=progress.rows,
+        bytes_read=progress.bytes_read,
+        elapsed=round(end - progress.started_at, 3),
+        error=progress.error,
+    )
+
+
+def snapshot_response(progress: SnapshotProgress) -> SnapshotResponse:
+    return SnapshotResponse(
+        operation=progress.operation,
+        status=progress.status,
+        tables=progress.tables,
+        rows=progress.rows,
+        bytes_raw=progress.bytes_raw,
+        bytes_compressed=progress.bytes_compressed,
+        elapsed=round(progress.elapsed, 3),
+        mb_per_s=progress.mb_per_s,
+        error=progress.error,
+    )
+
+
 # ════════════════════════════════════════════
 # Endpoints
 # ════════════════════════════════════════════
@@ -164,18 +358,32 @@ async def get_table_data(
     table: str,
     limit: int = 100,
     offset: int = 0,
+    accept: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Get data from a table."""
+    """
+    Get data from a table.
+    
+    Send Accept: application/vnd.apache.arrow.stream or
+    application/vnd.xbasis.columnar+json for a columnar encoding.
+    """
     await verify_project_access(project_id, current_user, db)
     
+    media_type = negotiate(accept)
+    
     db_manager = get_database_manager()
-    result = await db_manager.get_table_data(project_id, table, limit, offset)
+    result = await db_manager.get_table_data(
+        project_id, table, limit, offset,
+        serialize=media_type is None,
+    )
     
     if result.error:
         raise HTTPException(status_code=400, detail=result.error)
     
+    if media_type:
+        return columnar_response(result, media_type)
+    
     return QueryResponse(
         columns=result.columns,
         rows=result.rows,
@@ -183,28 +391,185 @@ async def get_table_data(
     )
 
 
+@router.post("/{project_id}/database/tables/{table}/import", response_model=ImportResponse)
+async def import_table_data(
+    project_id: int,
+    table: str,
+    request: Request,
+    format: str = "csv",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Bulk load rows into a table via COPY.
+    
+    Request body is the raw file: CSV with header row (format=csv)
+    or one JSON object per line (format=ndjson). Body is streamed, not buffered.
+    """
+    await verify_project_access(project_id, current_user, db)
+    
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    
+    enforce_storage_quota(project_id, current_user)
+    
+    db_manager = get_database_manager()
+    progress = await db_manager.import_data(project_id, table, request.stream(), format)
+    
+    if progress.error:
+        raise HTTPException(status_code=400, detail=progress.error)
+    
+    return import_response(progress)
+
+
+@router.get("/{project_id}/database/import", response_model=ImportResponse)
+async def get_import_progress(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Progress of the current (or last) import."""
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    progress = db_manager.imports.get(project_id)
+    
+    if not progress:
+        raise HTTPException(status_code=404, detail="No import found")
+    
+    return import_response(progress)
+
+
+@router.get("/{project_id}/database/snapshot")
+async def export_snapshot(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Download a snapshot of the database (schema + data), gzip-compressed.
+    
+    Streamed straight from COPY; restore it with POST /database/snapshot/restore.
+    """
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    if not await db_manager.schema_exists(project_id):
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    filename = f"project_{project_id}-{time.strftime('%Y%m%d-%H%M%S')}.xbsnap.gz"
+    return StreamingResponse(
+        db_manager.export_snapshot(project_id),
+        media_type=SNAPSHOT_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/{project_id}/database/snapshot/restore", response_model=SnapshotResponse)
+async def restore_snapshot(
+    project_id: int,
+    request: Request,
+    replace: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Restore a snapshot into this project's database. Request body is the archive.
+    
+    Fails if the database exists, unless replace=true.
+    """
+    await verify_project_access(project_id, current_user, db)
+    enforce_storage_quota(project_id, current_user)
+    
+    db_manager = get_database_manager()
+    progress = await db_manager.restore_snapshot(project_id, request.stream(), replace=replace)
+    
+    if progress.error:
+        raise HTTPException(status_code=400, detail=progress.error)
+    
+    return snapshot_response(progress)
+
+
+@router.post("/{project_id}/database/clone", response_model=SnapshotResponse)
+async def clone_database(
+    project_id: int,
+    data: CloneRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Copy the database of another of your projects into this one."""
+    await verify_project_access(project_id, current_user, db)
+    await verify_project_access(data.source_project_id, current_user, db)
+    enforce_storage_quota(project_id, current_user)
+    
+    db_manager = get_database_manager()
+    if not await db_manager.schema_exists(data.source_project_id):
+        raise HTTPException(status_code=404, detail="Source database not found")
+    
+    progress = await db_manager.clone_database(data.source_project_id, project_id, replace=data.replace)
+    
+    if progress.error:
+        raise HTTPException(status_code=400, detail=progress.error)
+    
+    return snapshot_response(progress)
+
+
+@router.get("/{project_id}/database/snapshot/status", response_model=SnapshotResponse)
+async def get_snapshot_status(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Progress of the current (or last) export or restore."""
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    progress = db_manager.snapshots.get(project_id)
+    
+    if not progress:
+        raise HTTPException(status_code=404, detail="No snapshot found")
+    
+    return snapshot_response(progress)
+
+
 @router.post("/{project_id}/database/query", response_model=QueryResponse)
 async def execute_query(
     project_id: int,
     data: QueryRequest,
+    accept: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Execute SQL query. Use readonly=true for SELECT only mode."""
+    """
+    Execute SQL query. Use readonly=true for SELECT only mode.
+    
+    Expensive SELECTs return needs_confirmation=true; re-send with confirm=true to run them.
+    Columnar encodings are negotiated via Accept like table data.
+    """
     await verify_project_access(project_id, current_user, db)
     
+    media_type = negotiate(accept)
+    
     db_manager = get_database_manager()
     result = await db_manager.execute_sql(
         project_id,
         data.sql,
         readonly=data.readonly,
+        plan=current_user.plan.value,
+        confirmed=data.confirm,
+        serialize=media_type is None,
     )
     
+    if media_type and result.columns and not result.error:
+        return columnar_response(result, media_type)
+    
     return QueryResponse(
         columns=result.columns,
         rows=result.rows,
         affected_rows=result.affected_rows,
         error=result.error,
+        needs_confirmation=result.needs_confirmation,
+        estimated_cost=result.estimated_cost,
     )
 
 
@@ -217,6 +582,7 @@ async def apply_migration(
 ):
     """Apply a migration."""
     await verify_project_access(project_id, current_user, db)
+    enforce_storage_quota(project_id, current_user, [data.sql])
     
     db_manager = get_database_manager()
     result = await db_manager.apply_migration(
@@ -235,6 +601,53 @@ async def apply_migration(
     )
 
 
+@router.post("/{project_id}/database/migrations/batch", response_model=BatchMigrationResponse)
+async def apply_migrations_batch(
+    project_id: int,
+    data: BatchMigrationRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Apply ordered migrations in one transaction.
+    
+    Already applied migrations (same checksum) are skipped. With dry_run=true
+    everything is executed and rolled back, reporting timing and locks per step.
+    """
+    await verify_project_access(project_id, current_user, db)
+    if not data.dry_run:
+        enforce_storage_quota(project_id, current_user, [m.sql for m in data.migrations])
+    
+    db_manager = get_database_manager()
+    result = await db_manager.apply_migrations(
+        project_id,
+        [MigrationStep(sql=m.sql, description=m.description) for m in data.migrations],
+        dry_run=data.dry_run,
+    )
+    
+    response = BatchMigrationResponse(
+        steps=[
+            MigrationStepResponse(
+                description=step.description,
+                checksum=step.checksum,
+                status=step.status,
+                duration_ms=step.duration_ms,
+                locks=step.locks,
+                error=step.error,
+            )
+            for step in result.steps
+        ],
+        dry_run=result.dry_run,
+        duration_ms=result.duration_ms,
+        error=result.error,
+    )
+    
+    if result.error and not data.dry_run:
+        raise HTTPException(status_code=400, detail=response.model_dump())
+    
+    return response
+
+
 @router.get("/{project_id}/database/migrations", response_model=List[MigrationResponse])
 async def get_migrations(
     project_id: int,
@@ -258,6 +671,121 @@ async def get_migrations(
     ]
 
 
+@router.get("/{project_id}/database/stats", response_model=QueryStatsResponse)
+async def get_query_stats(
+    project_id: int,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Top slow / frequent statements and recent slow queries (this API worker)."""
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    stats = db_manager.query_stats
+    if not stats:
+        return QueryStatsResponse(slowest=[], most_time=[], frequent=[], slow_log=[])
+    
+    def summaries(by: str) -> List[StatementStatsSchema]:
+        return [StatementStatsSchema(**s.summary()) for s in stats.top(project_id, by=by, limit=limit)]
+    
+    return QueryStatsResponse(
+        slowest=summaries("p95"),
+        most_time=summaries("total"),
+        frequent=summaries("calls"),
+        slow_log=[
+            SlowQuerySchema(
+                fingerprint=q.fingerprint,
+                sql=q.sql,
+                duration_ms=q.duration_ms,
+                rows=q.rows,
+                error=q.error,
+                at=q.at,
+            )
+            for q in stats.slow_queries(project_id, limit)
+        ],
+    )
+
+
+@router.get("/{project_id}/database/prepared-statements", response_model=PreparedStatementsResponse)
+async def get_prepared_statements(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Prepared-statement cache state (this API worker)."""
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    if not db_manager.prepared:
+        raise HTTPException(status_code=404, detail="Prepared statement cache disabled")
+    
+    await db_manager.prepared.refresh(db_manager.engine)
+    return PreparedStatementsResponse(**db_manager.prepared.stats(project_id))
+
+
+@router.put("/{project_id}/database/prepared-statements", response_model=PreparedStatementsResponse)
+async def set_prepared_statements(
+    project_id: int,
+    data: PreparedStatementsRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Opt in/out of the prepared-statement cache.
+    
+    When enabled, read-only queries run on a pinned connection and repeated
+    statements skip parsing and planning.
+    """
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    if not db_manager.prepared:
+        raise HTTPException(status_code=404, detail="Prepared statement cache disabled")
+    
+    await db_manager.prepared.set_enabled(db_manager.engine, project_id, data.enabled)
+    return PreparedStatementsResponse(**db_manager.prepared.stats(project_id))
+
+
+@router.get("/{project_id}/database/usage", response_model=StorageUsageResponse)
+async def get_storage_usage(
+    project_id: int,
+    hours: int = 24,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Disk used by the project's schema (tables incl. indexes and TOAST).
+    
+    Numbers come from the periodic sampler; history is schema totals over
+    the last `hours`. Over the limit, only reads and deletes are allowed.
+    """
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    storage = db_manager.storage
+    if not storage:
+        raise HTTPException(status_code=404, detail="Storage accounting disabled")
+    
+    usage = storage.usage(project_id)
+    limit = storage.get_limit(current_user.plan.value)
+    total = usage.total_bytes if usage else 0
+    history = await storage.history(db_manager.engine, project_id, hours=min(max(hours, 1), 24 * 30))
+    
+    return StorageUsageResponse(
+        total_bytes=total,
+        limit_bytes=limit,
+        percent=round(total / limit * 100, 2) if limit else 0.0,
+        over_limit=total > limit,
+        sampled_at=usage.sampled_at if usage else None,
+        tables=[
+            TableUsageSchema(name=name, bytes=size)
+            for name, size in sorted((usage.tables if usage else {}).items(), key=lambda t: -t[1])
+        ],
+        history=[UsagePointSchema(**point) for point in history],
+    )
+
+
 @router.get("/{project_id}/database/schema")
 async def get_schema(
     project_id: int,
@@ -331,3 +859,100 @@ Use proper PostgreSQL syntax."""
         "sql": sql,
         "description": data.request,
     }
+
+
+def index_proposal_response(proposal: IndexProposal) -> IndexProposalSchema:
+    return IndexProposalSchema(
+        table=proposal.table,
+        columns=proposal.columns,
+        sql=proposal.sql,
+        description=f"Add index {proposal.name}",
+        reason=proposal.reason,
+        source=proposal.source,
+        queries=proposal.queries,
+        cost_before=proposal.cost_before,
+        cost_after=proposal.cost_after,
+        benefit=proposal.benefit,
+    )
+
+
+@router.post("/{project_id}/database/ai/indexes", response_model=IndexAdviceResponse)
+async def advise_indexes(
+    project_id: int,
+    data: IndexAdviceRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Propose indexes for the slowest recorded queries.
+    
+    Plan heuristics run first; AI then gets the schema, plans and heuristic
+    proposals and may add more. Only single CREATE INDEX CONCURRENTLY
+    statements on existing tables are accepted from AI. Apply a proposal
+    by posting its sql to /database/migrations.
+    """
+    await verify_project_access(project_id, current_user, db)
+    
+    db_manager = get_database_manager()
+    advice = await db_manager.advise_indexes(project_id, limit=min(max(data.limit, 1), 50))
+    proposals: List[IndexProposal] = advice["proposals"]
+    
+    from ..core.config import settings
+    
+    if data.use_ai and advice["plans"] and settings.ANTHROPIC_API_KEY:
+        from ..ai.router import call_anthropic
+        import json
+        
+        current_schema = await db_manager.get_schema_sql(project_id)
+        plans = "\n\n".join(
+            f"-- {advice['queries'][fingerprint]}\n{json.dumps(plan)}"
+            for fingerprint, plan in advice["plans"].items()
+        )
+        proposed = "\n".join(p.sql + ";" for p in proposals) or "(none)"
+        prompt = f"""Current database schema:
+```sql
+{current_schema}
+```
+
+Slowest queries with EXPLAIN (FORMAT JSON) plans:
+{plans}
+
+Already proposed:
+{proposed}
+
+Suggest additional PostgreSQL indexes that would speed up these queries.
+Output ONLY CREATE INDEX CONCURRENTLY statements, one per line, or nothing."""
+        
+        try:
+            result = await call_anthropic(
+                [{"role": "user", "content": prompt}],
+                model="claude-sonnet-4-20250514",
+                max_tokens=1000,
+            )
+        except HTTPException:
+            result = {"content": ""}  # heuristic proposals still stand
+        
+        tables = {table.name for table in await db_manager.get_tables(project_id)}
+        known = {(p.table, tuple(p.columns)) for p in proposals}
+        extra = []
+        for line in result["content"].splitlines():
+            proposal = parse_index_statement(line.strip().strip("`"))
+            if (
+                proposal is None
+                or proposal.table not in tables
+                or (proposal.table, tuple(proposal.columns)) in known
+                or is_covered(proposal, advice["indexes"])
+            ):
+                continue
+            known.add((proposal.table, tuple(proposal.columns)))
+            extra.append(proposal)
+        
+        if extra and advice["hypothetical"]:
+            await db_manager.estimate_indexes(project_id, extra, advice["queries"])
+        proposals += extra
+    
+    return IndexAdviceResponse(
+        proposals=[index_proposal_response(p) for p in proposals],
+        analyzed_queries=len(advice["plans"]),
+        hypothetical=advice["hypothetical"],
+    )
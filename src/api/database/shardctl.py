@@ -0,0 +1,57 @@
+"""
+Shard admin tool.
+
+Usage (from repo root):
+    python -m src.api.database.shardctl where <project_id>
+    python -m src.api.database.shardctl move <project_id> <shard> [--keep-source]
+    python -m src.api.database.shardctl pin-existing
+"""
+
+import argparse
+import asyncio
+import json
+
+from .manager import get_database_manager
+
+
+async def run(args: argparse.Namespace):
+    manager = get_database_manager()
+    shard_map = manager.shard_map
+    await shard_map.refresh(force=True)
+
+    try:
+        if args.command == "where":
+            print(json.dumps({
+                "project_id": args.project_id,
+                "shard": shard_map.shard_for(args.project_id),
+                "hashed": shard_map.hashed_shard(args.project_id),
+            }))
+        elif args.command == "move":
+            result = await manager.move_project(args.project_id, args.shard, keep_source=args.keep_source)
+            print(json.dumps(result))
+        elif args.command == "pin-existing":
+            pinned = await manager.pin_existing_projects()
+            print(json.dumps({"pinned": pinned}))
+    finally:
+        await shard_map.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project database shards")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    where = commands.add_parser("where", help="Show shard of project")
+    where.add_argument("project_id", type=int)
+
+    move = commands.add_parser("move", help="Move project schema to shard")
+    move.add_argument("project_id", type=int)
+    move.add_argument("shard")
+    move.add_argument("--keep-source", action="store_true", help="Don't drop schema on old shard")
+
+    commands.add_parser("pin-existing", help="Pin existing schemas to the shard they are on")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
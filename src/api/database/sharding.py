@@ -0,0 +1,201 @@
+"""
+Shard Map - places project schemas on several PostgreSQL servers.
+
+- Consistent hashing (virtual nodes) picks a shard for each project, so
+  adding a server only remaps ~1/N of projects
+- Explicit overrides win over the hash: from settings, and from the
+  project_shards table on the default shard (written by moves)
+- One engine (connection pool) per shard, created lazily
+
+Overrides are re-read from project_shards every refresh_seconds, so a
+move done by one API worker reaches the others within that interval.
+"""
+
+from bisect import bisect
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import time
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SHARD = "default"
+
+
+class ShardMap:
+    """
+    Project -> shard name -> engine.
+    """
+
+    def __init__(
+        self,
+        shards: Dict[str, str],
+        overrides: Optional[Dict[int, str]] = None,
+        vnodes: int = 128,
+        refresh_seconds: float = 10.0,
+        engine_factory: Callable[[str], AsyncEngine] = create_async_engine,
+    ):
+        if DEFAULT_SHARD not in shards:
+            raise ValueError(f"Shard map needs a '{DEFAULT_SHARD}' shard")
+
+        self.shards = dict(shards)
+        self.static_overrides = dict(overrides or {})
+        self.overrides: Dict[int, str] = dict(self.static_overrides)
+        self.refresh_seconds = refresh_seconds
+        self.engine_factory = engine_factory
+
+        ring: List[Tuple[int, str]] = sorted(
+            (self._hash(f"{name}#{i}"), name)
+            for name in self.shards
+            for i in range(vnodes)
+        )
+        self._ring_keys = [h for h, _ in ring]
+        self._ring_names = [name for _, name in ring]
+        self._engines: Dict[str, AsyncEngine] = {}
+        self._loaded_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def hashed_shard(self, project_id: int) -> str:
+        """Shard chosen by the hash ring alone."""
+        idx = bisect(self._ring_keys, self._hash(f"project:{project_id}"))
+        return self._ring_names[idx % len(self._ring_names)]
+
+    def shard_for(self, project_id: int) -> str:
+        """Shard holding project schema (override or hash)."""
+        return self.overrides.get(project_id) or self.hashed_shard(project_id)
+
+    def engine(self, shard: str) -> AsyncEngine:
+        """Engine (pool) for shard."""
+        if shard not in self.shards:
+            raise ValueError(f"Unknown shard: {shard}")
+        if shard not in self._engines:
+            self._engines[shard] = self.engine_factory(self.shards[shard])
+        return self._engines[shard]
+
+    @property
+    def default_engine(self) -> AsyncEngine:
+        return self.engine(DEFAULT_SHARD)
+
+    async def engine_for(self, project_id: int) -> AsyncEngine:
+        """Engine for project, refreshing overrides if stale."""
+        await self.refresh()
+        return self.engine(self.shard_for(project_id))
+
+    async def refresh(self, force: bool = False):
+        """Reload overrides from project_shards on the default shard."""
+        if len(self.shards) == 1 and not force:
+            return
+        if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+
+        async with self._refresh_lock:
+            if not force and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            try:
+                async with self.default_engine.begin() as conn:
+                    await self._ensure_table(conn)
+                    result = await conn.execute(text('SELECT project_id, shard FROM project_shards'))
+                    stored = {row[0]: row[1] for row in result if row[1] in self.shards}
+                self.overrides = {**self.static_overrides, **stored}
+            except Exception as e:
+                logger.warning(f"Failed to load shard overrides: {e}")
+            self._loaded_at = time.monotonic()
+
+    async def _ensure_table(self, conn):
+        await conn.execute(text('''
+            CREATE TABLE IF NOT EXISTS project_shards (
+                project_id INTEGER PRIMARY KEY,
+                shard TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT NOW()
+            )
+        '''))
+
+    async def set_override(self, project_id: int, shard: str):
+        """Pin project to shard (persisted)."""
+        if shard not in self.shards:
+            raise ValueError(f"Unknown shard: {shard}")
+
+        async with self.default_engine.begin() as conn:
+            await self._ensure_table(conn)
+            await conn.execute(text('''
+                INSERT INTO project_shards (project_id, shard) VALUES (:project_id, :shard)
+                ON CONFLICT (project_id) DO UPDATE SET shard = EXCLUDED.shard, updated_at = NOW()
+            '''), {"project_id": project_id, "shard": shard})
+
+        self.overrides[project_id] = shard
+
+    async def dispose(self):
+        for engine in self._engines.values():
+            await engine.dispose()
+
+
+async def copy_out(
+    source,
+    schema: str,
+    table: str,
+    columns: List[str],
+    queue_size: int = 8,
+) -> AsyncIterator[bytes]:
+    """
+    COPY TO (binary) from an asyncpg connection as an async iterator of chunks.
+
+    A bounded queue sits between COPY and the consumer, so memory stays at a
+    few chunks. Closing the iterator early cancels the COPY.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        try:
+            await source.copy_from_table(
+                table, schema_name=schema, columns=columns, format="binary", output=queue.put,
+            )
+        finally:
+            await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        await producer  # COPY errors
+    finally:
+        if not producer.done():
+            producer.cancel()
+            while not queue.empty():  # make room for producer's end marker
+                queue.get_nowait()
+
+
+async def copy_table(
+    source,
+    target,
+    schema: str,
+    table: str,
+    columns: List[str],
+    target_schema: Optional[str] = None,
+    queue_size: int = 8,
+) -> int:
+    """
+    Stream table between two asyncpg connections (COPY TO -> COPY FROM).
+
+    Returns number of rows copied.
+    """
+    chunks = copy_out(source, schema, table, columns, queue_size)
+    try:
+        status = await target.copy_to_table(
+            table, schema_name=target_schema or schema, columns=columns, format="binary", source=chunks,
+        )
+    finally:
+        await chunks.aclose()
+
+    return int(status.split()[-1])
@@ -0,0 +1,233 @@
+"""
+Snapshots - streaming export / restore of a project schema.
+
+Archive is a gzip stream of frames:
+    b"XBSNAP1\n"
+    kind (1 byte) + payload length (4 bytes, big endian) + payload
+      M  manifest JSON: source schema, tables, COPY columns, pre/post DDL
+      T  table start JSON {"table": ...}
+      D  COPY binary data chunk
+      E  table end
+      Z  end of archive
+
+Export pipes COPY TO through the compressor into the response; restore
+pipes decompressed request chunks into COPY FROM. Neither side holds more
+than a few COPY chunks in memory.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import json
+import re
+import struct
+import time
+import zlib
+
+from .ddl import introspect_schema
+from .sharding import copy_out
+
+MAGIC = b"XBSNAP1\n"
+FORMAT_VERSION = 1
+MEDIA_TYPE = "application/gzip"
+
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+READ_CHUNK_BYTES = 256 * 1024  # decompressed bytes per step (gzip bomb guard)
+
+# Restore runs manifest DDL with search_path set to the target schema, so a
+# statement must stay inside it: statements introspect_schema() builds itself
+# are matched whole; ones carrying pg_get_*def() output are matched by prefix
+# and may not qualify names, chain statements or hide text in comments.
+_IDENT = r'"(?:[^"]|"")+"'
+_IDENT_LITERAL = r"""'"(?:[^"']|""|'')+"'"""
+_LITERAL = r"'(?:[^']|'')*'"
+EXACT_DDL = (
+    re.compile(rf"ALTER SEQUENCE {_IDENT} OWNED BY {_IDENT}\.{_IDENT}"),
+    re.compile(rf"SELECT setval\({_IDENT_LITERAL}, -?\d+, true\)"),
+    re.compile(
+        rf"SELECT setval\(pg_get_serial_sequence\({_IDENT_LITERAL}, {_LITERAL}\), "
+        rf"\(SELECT COALESCE\(MAX\({_IDENT}\), 0\) \+ 1 FROM {_IDENT}\), false\)"
+    ),
+)
+ALLOWED_DDL = ("CREATE TABLE", "CREATE SEQUENCE", "CREATE INDEX", "CREATE UNIQUE INDEX", "ALTER TABLE")
+_QUOTED = re.compile(rf'{_LITERAL}|"(?:[^"]|"")*"')
+_QUALIFIED = re.compile(r"(?<![\w$])([A-Za-z_][\w$]*)\s*\.\s*[A-Za-z_]")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+@dataclass
+class SnapshotProgress:
+    operation: str  # export, restore
+    status: str = "running"  # running, done, failed
+    tables: int = 0
+    rows: int = 0
+    bytes_raw: int = 0  # uncompressed archive bytes
+    bytes_compressed: int = 0
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def mb_per_s(self) -> float:
+        """Throughput over uncompressed bytes."""
+        elapsed = self.elapsed
+        return round(self.bytes_raw / 1024 / 1024 / elapsed, 2) if elapsed > 0 else 0.0
+
+
+def check_ddl(statement: str) -> str:
+    if any(pattern.fullmatch(statement) for pattern in EXACT_DDL):
+        return statement
+    if not statement.startswith(ALLOWED_DDL) or "\\" in statement:
+        raise SnapshotError(f"Unexpected statement in snapshot: {statement[:60]}")
+    
+    # Literals and quoted names blanked out; what is left is plain SQL
+    bare = _QUOTED.sub(lambda m: "0" if m.group().startswith("'") else "_q", statement)
+    if any(token in bare for token in ("'", '"', ";", "$", "--", "/*")):
+        raise SnapshotError(f"Unexpected statement in snapshot: {statement[:60]}")
+    for match in _QUALIFIED.finditer(bare):
+        if match.group(1) != "pg_catalog":
+            raise SnapshotError(f"Schema-qualified name in snapshot: {statement[:60]}")
+    return statement
+
+
+class SnapshotWriter:
+    """Frames into a gzip stream; every method returns compressed bytes (maybe empty)."""
+
+    def __init__(self, progress: SnapshotProgress, compress_level: int = 1):
+        self.progress = progress
+        self.compressor = zlib.compressobj(compress_level, zlib.DEFLATED, 31)
+
+    def _compress(self, data: bytes) -> bytes:
+        self.progress.bytes_raw += len(data)
+        out = self.compressor.compress(data)
+        self.progress.bytes_compressed += len(out)
+        return out
+
+    def start(self, manifest: Dict[str, Any]) -> bytes:
+        return self._compress(MAGIC) + self.frame(b"M", json.dumps(manifest).encode())
+
+    def frame(self, kind: bytes, payload: bytes = b"") -> bytes:
+        return self._compress(kind + struct.pack(">I", len(payload)) + payload)
+
+    def close(self) -> bytes:
+        out = self.frame(b"Z")
+        tail = self.compressor.flush()
+        self.progress.bytes_compressed += len(tail)
+        return out + tail
+
+
+async def write_snapshot(
+    conn,
+    schema: str,
+    progress: SnapshotProgress,
+    compress_level: int = 1,
+    queue_size: int = 8,
+) -> AsyncIterator[bytes]:
+    """
+    Yield compressed archive of schema.
+
+    conn must be in a REPEATABLE READ transaction so that all tables
+    come from the same snapshot.
+    """
+    ddl = await introspect_schema(conn, schema)
+    raw = (await conn.get_raw_connection()).driver_connection
+    writer = SnapshotWriter(progress, compress_level)
+
+    yield writer.start({
+        "version": FORMAT_VERSION,
+        "schema": schema,
+        "created_at": time.time(),
+        "tables": ddl.tables,
+        "copy_columns": ddl.copy_columns,
+        "pre_data": ddl.pre_data,
+        "post_data": ddl.post_data,
+    })
+
+    for table in ddl.tables:
+        out = writer.frame(b"T", json.dumps({"table": table}).encode())
+        async for chunk in copy_out(raw, schema, table, ddl.copy_columns[table], queue_size):
+            out += writer.frame(b"D", chunk)
+            if out:
+                yield out
+                out = b""
+        yield out + writer.frame(b"E")
+        progress.tables += 1
+
+    yield writer.close()
+
+
+class SnapshotReader:
+    """Frames from a stream of compressed chunks."""
+
+    def __init__(self, chunks: AsyncIterator[bytes], progress: SnapshotProgress):
+        self.chunks = chunks
+        self.progress = progress
+        self.decompressor = zlib.decompressobj(31)
+        self.buffer = bytearray()
+
+    async def _step(self) -> bytes:
+        """Decompress the next piece of input, at most READ_CHUNK_BYTES out."""
+        data = self.decompressor.unconsumed_tail
+        if not data:
+            data = await anext(self.chunks, None)
+            if data is None:
+                raise SnapshotError("Unexpected end of snapshot")
+            self.progress.bytes_compressed += len(data)
+        try:
+            out = self.decompressor.decompress(data, READ_CHUNK_BYTES)
+        except zlib.error as e:
+            raise SnapshotError(f"Corrupt snapshot: {e}")
+        self.progress.bytes_raw += len(out)
+        return out
+
+    async def _fill(self, size: int):
+        while len(self.buffer) < size:
+            self.buffer += await self._step()
+
+    async def read(self, size: int) -> bytes:
+        await self._fill(size)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def frame(self) -> Tuple[bytes, bytes]:
+        header = await self.read(5)
+        kind, (length,) = header[:1], struct.unpack(">I", header[1:])
+        if length > MAX_FRAME_BYTES:
+            raise SnapshotError(f"Frame too large: {length} bytes")
+        return kind, await self.read(length)
+
+    async def manifest(self) -> Dict[str, Any]:
+        if await self.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError("Not a snapshot archive")
+        kind, payload = await self.frame()
+        if kind != b"M":
+            raise SnapshotError("Snapshot manifest missing")
+        manifest = json.loads(payload)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot version: {manifest.get('version')}")
+        return manifest
+
+    async def finish(self):
+        """Read to the end of the gzip stream, so its CRC is verified."""
+        while not self.decompressor.eof:
+            if await self._step():
+                raise SnapshotError("Trailing data after snapshot end")
+        if self.buffer or self.decompressor.unused_data or await anext(self.chunks, None):
+            raise SnapshotError("Trailing data after snapshot end")
+
+    async def table_data(self) -> AsyncIterator[bytes]:
+        """COPY chunks of the current table."""
+        while True:
+            kind, payload = await self.frame()
+            if kind == b"E":
+                return
+            if kind != b"D":
+                raise SnapshotError(f"Unexpected frame {kind!r} in table data")
+            yield payload
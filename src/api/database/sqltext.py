@@ -0,0 +1,81 @@
+"""
+SQL text helpers shared by the database module.
+
+Used to build stable cache keys for user SQL, so that the same statement
+typed with different whitespace or a trailing semicolon hits the same entry,
+and to group statements by shape for query statistics.
+
+Whitespace inside string literals, quoted identifiers and dollar-quoted
+bodies is data, so it is left alone.
+"""
+
+import re
+
+
+# A quoted token (kept as is) or a run of whitespace (collapsed)
+_QUOTED_OR_WHITESPACE = re.compile(
+    r"(?P<quoted>[Ee]'(?:[^'\\]|\\.|'')*'"  # E'escape \' string'
+    r"|'(?:[^']|'')*'"  # 'string'
+    r'|"(?:[^"]|"")*"'  # "identifier"
+    r"|\$\$.*?\$\$"  # $$body$$
+    r"|\$(?P<tag>[A-Za-z_]\w*)\$.*?\$(?P=tag)\$)"  # $tag$ body $tag$
+    r"|\s+",
+    re.S,
+)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WORD = re.compile(r'[A-Z_][A-Z0-9_]*')
+# Keywords that make a SELECT / WITH statement write (SELECT ... INTO, data-modifying CTEs)
+_WRITE_WORDS = {'INTO', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'COPY'}
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace outside quotes and drop trailing semicolons."""
+    collapsed = _QUOTED_OR_WHITESPACE.sub(lambda m: m.group('quoted') or ' ', sql)
+    return collapsed.strip().rstrip(';').strip()
+
+
+def is_select(sql: str) -> bool:
+    """Check whether statement is a plain read (SELECT / WITH ... SELECT)."""
+    head = sql.lstrip().upper()
+    return head.startswith('SELECT') or head.startswith('WITH')
+
+
+def is_read_only(sql: str) -> bool:
+    """
+    Whether a SELECT / WITH statement provably only reads.
+
+    Keywords are matched outside quotes; anything that may write (INTO, a
+    data-modifying CTE) counts as a write. Functions with side effects are
+    not detected.
+    """
+    if not is_select(sql):
+        return False
+    unquoted = _QUOTED_OR_WHITESPACE.sub(lambda m: ' ' if m.group('quoted') else m.group(0), sql)
+    words = _WORD.findall(unquoted.upper())
+    for i, word in enumerate(words):
+        if word == 'UPDATE' and i and words[i - 1] in ('FOR', 'KEY'):
+            continue  # row locking clause: FOR [NO KEY] UPDATE
+        if word in _WRITE_WORDS:
+            return False
+    return True
+
+
+def is_ddl(sql: str) -> bool:
+    """Check whether statement changes schema objects."""
+    head = sql.lstrip().upper()
+    return head.startswith(('CREATE', 'ALTER', 'DROP', 'COMMENT', 'GRANT', 'REVOKE'))
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Normalized statement shape: literals become ?, IN lists collapse.
+
+    SELECT * FROM users WHERE id IN (1, 2, 3) AND name = 'x'
+    -> select * from users where id in (?) and name = ?
+    """
+    shape = _STRING_LITERAL.sub('?', normalize_sql(sql))
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?)', shape)
+    return shape.lower()
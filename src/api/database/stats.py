@@ -0,0 +1,279 @@
+"""
+Query Stats - per-project statement statistics and slow-query log.
+
+Every statement DatabaseManager runs for a project is recorded under its
+fingerprint (SQL shape with literals replaced) with latency, rows and
+error class. Latency goes into a sparse log-linear histogram (HDR style,
+~1.5% relative error), so percentiles cost O(buckets) memory, not O(calls).
+
+Deltas are flushed periodically to the query_stats table on the default
+shard, where counters from all API workers add up.
+"""
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+import asyncio
+import hashlib
+import time
+import logging
+
+from sqlalchemy import text
+
+from .sqltext import fingerprint_sql
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    Sparse HDR-style histogram of microsecond values.
+
+    Values below 2 * SUB_BUCKETS are exact; above that each power of two
+    is split into SUB_BUCKETS linear buckets.
+    """
+
+    SUB_BUCKET_BITS = 6
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS - 1)
+        return shift * self.SUB_BUCKETS + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        """Upper bound of bucket."""
+        if index < 2 * self.SUB_BUCKETS:
+            return index
+        shift = index // self.SUB_BUCKETS - 1
+        sub = index - shift * self.SUB_BUCKETS
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_us: int):
+        value_us = max(0, int(value_us))
+        index = self._index(value_us)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total_us += value_us
+        self.max_us = max(self.max_us, value_us)
+
+    def percentile(self, p: float) -> int:
+        """Value at percentile p (0-100), in microseconds."""
+        if not self.count:
+            return 0
+
+        target = max(1, int(self.count * p / 100 + 0.5))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value(index), self.max_us)
+        return self.max_us
+
+    @property
+    def mean_us(self) -> float:
+        return self.total_us / self.count if self.count else 0.0
+
+
+@dataclass
+class StatementStats:
+    fingerprint: str
+    query: str  # normalized shape
+    example: str  # slowest raw statement seen (for EXPLAIN)
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    calls: int = 0
+    rows: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    last_seen: float = 0.0
+    example_us: int = 0
+    # Not yet flushed
+    delta_calls: int = 0
+    delta_rows: int = 0
+    delta_errors: int = 0
+    delta_total_us: int = 0
+
+    def summary(self) -> dict:
+        h = self.histogram
+        return {
+            "fingerprint": self.fingerprint,
+            "query": self.query,
+            "calls": self.calls,
+            "rows": self.rows,
+            "errors": dict(self.errors),
+            "mean_ms": round(h.mean_us / 1000, 3),
+            "p50_ms": round(h.percentile(50) / 1000, 3),
+            "p95_ms": round(h.percentile(95) / 1000, 3),
+            "p99_ms": round(h.percentile(99) / 1000, 3),
+            "max_ms": round(h.max_us / 1000, 3),
+            "total_ms": round(h.total_us / 1000, 3),
+        }
+
+
+@dataclass
+class SlowQuery:
+    fingerprint: str
+    sql: str
+    duration_ms: float
+    rows: int
+    error: Optional[str]
+    at: float
+
+
+class QueryStatsCollector:
+    """
+    In-memory stats per project, bounded by max_statements per project.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float = 500.0,
+        max_statements: int = 500,
+        slow_log_size: int = 100,
+    ):
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self.slow_log_size = slow_log_size
+        self.projects: Dict[int, "OrderedDict[str, StatementStats]"] = {}
+        self.slow_log: Dict[int, Deque[SlowQuery]] = {}
+
+    def record(
+        self,
+        project_id: int,
+        sql: str,
+        duration_ms: float,
+        rows: int = 0,
+        error_class: Optional[str] = None,
+    ):
+        shape = fingerprint_sql(sql)
+        fingerprint = hashlib.sha1(shape.encode()).hexdigest()[:16]
+        duration_us = int(duration_ms * 1000)
+
+        statements = self.projects.setdefault(project_id, OrderedDict())
+        stats = statements.get(fingerprint)
+        if stats is None:
+            stats = StatementStats(fingerprint=fingerprint, query=shape, example=sql)
+            statements[fingerprint] = stats
+            while len(statements) > self.max_statements:
+                statements.popitem(last=False)
+        statements.move_to_end(fingerprint)
+
+        stats.histogram.record(duration_us)
+        stats.calls += 1
+        stats.rows += rows
+        stats.last_seen = time.time()
+        stats.delta_calls += 1
+        stats.delta_rows += rows
+        stats.delta_total_us += duration_us
+        if error_class:
+            stats.errors[error_class] = stats.errors.get(error_class, 0) + 1
+            stats.delta_errors += 1
+        if duration_us >= stats.example_us:
+            stats.example = sql
+            stats.example_us = duration_us
+
+        if duration_ms >= self.slow_ms:
+            log = self.slow_log.setdefault(project_id, deque(maxlen=self.slow_log_size))
+            log.append(SlowQuery(fingerprint, sql, round(duration_ms, 3), rows, error_class, time.time()))
+
+    def top(self, project_id: int, by: str = "p95", limit: int = 10) -> List[StatementStats]:
+        """Top statements by p95 latency, total time or calls."""
+        statements = list(self.projects.get(project_id, {}).values())
+        keys = {
+            "p95": lambda s: s.histogram.percentile(95),
+            "total": lambda s: s.histogram.total_us,
+            "calls": lambda s: s.calls,
+        }
+        return sorted(statements, key=keys[by], reverse=True)[:limit]
+
+    def slow_queries(self, project_id: int, limit: int = 20) -> List[SlowQuery]:
+        """Most recent slow statements first."""
+        return list(reversed(self.slow_log.get(project_id, ())))[:limit]
+
+    def forget(self, project_id: int):
+        self.projects.pop(project_id, None)
+        self.slow_log.pop(project_id, None)
+
+    async def flush(self, engine):
+        """Add unflushed deltas to query_stats (one batched upsert)."""
+        params = []
+        flushed = []
+        for project_id, statements in self.projects.items():
+            for stats in statements.values():
+                if not stats.delta_calls:
+                    continue
+                h = stats.histogram
+                params.append({
+                    "project_id": project_id,
+                    "fingerprint": stats.fingerprint,
+                    "query": stats.query,
+                    "calls": stats.delta_calls,
+                    "rows": stats.delta_rows,
+                    "errors": stats.delta_errors,
+                    "total_ms": stats.delta_total_us / 1000,
+                    "max_ms": h.max_us / 1000,
+                    "p50_ms": h.percentile(50) / 1000,
+                    "p95_ms": h.percentile(95) / 1000,
+                    "p99_ms": h.percentile(99) / 1000,
+                })
+                flushed.append((stats, stats.delta_calls, stats.delta_rows, stats.delta_errors, stats.delta_total_us))
+
+        if not params:
+            return
+
+        async with engine.begin() as conn:
+            await conn.execute(text('''
+                CREATE TABLE IF NOT EXISTS query_stats (
+                    project_id INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    calls BIGINT NOT NULL DEFAULT 0,
+                    rows BIGINT NOT NULL DEFAULT 0,
+                    errors BIGINT NOT NULL DEFAULT 0,
+                    total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    max_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    p50_ms DOUBLE PRECISION,
+                    p95_ms DOUBLE PRECISION,
+                    p99_ms DOUBLE PRECISION,
+                    updated_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (project_id, fingerprint)
+                )
+            '''))
+            await conn.execute(text('''
+                INSERT INTO query_stats
+                    (project_id, fingerprint, query, calls, rows, errors, total_ms, max_ms, p50_ms, p95_ms, p99_ms)
+                VALUES
+                    (:project_id, :fingerprint, :query, :calls, :rows, :errors, :total_ms, :max_ms, :p50_ms, :p95_ms, :p99_ms)
+                ON CONFLICT (project_id, fingerprint) DO UPDATE SET
+                    calls = query_stats.calls + EXCLUDED.calls,
+                    rows = query_stats.rows + EXCLUDED.rows,
+                    errors = query_stats.errors + EXCLUDED.errors,
+                    total_ms = query_stats.total_ms + EXCLUDED.total_ms,
+                    max_ms = GREATEST(query_stats.max_ms, EXCLUDED.max_ms),
+                    p50_ms = EXCLUDED.p50_ms,
+                    p95_ms = EXCLUDED.p95_ms,
+                    p99_ms = EXCLUDED.p99_ms,
+                    updated_at = NOW()
+            '''), params)
+
+        # Subtract what was written; statements recorded meanwhile stay pending
+        for stats, calls, rows, errors, total_us in flushed:
+            stats.delta_calls -= calls
+            stats.delta_rows -= rows
+            stats.delta_errors -= errors
+            stats.delta_total_us -= total_us
+
+        logger.debug(f"Flushed stats for {len(params)} statements")
+
+    async def run_flusher(self, engine, interval: float = 60.0):
+        """Background loop: flush every interval until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(engine)
+            except Exception as e:
+                logger.warning(f"Query stats flush failed: {e}")
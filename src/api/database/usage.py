@@ -0,0 +1,191 @@
+"""
+Storage Usage - per-project disk accounting and quotas.
+
+A background sampler asks every shard for pg_total_relation_size of all
+tables in all project_* schemas in one catalog query (not one per project),
+keeps the latest sample in memory for quota checks and appends schema
+totals to the storage_usage time series on the default shard.
+
+Projects over their plan limit can still read and delete (DELETE, DROP,
+TRUNCATE) but nothing that grows the schema. A read must be provably one:
+SELECT ... INTO and WITH queries with a writing CTE are blocked.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import asyncio
+import json
+import re
+import time
+import logging
+
+from sqlalchemy import text
+
+from .sharding import ShardMap
+from .sqltext import is_read_only
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+PLAN_STORAGE_LIMITS: Dict[str, int] = {
+    "free": 100 * MB,
+    "pro": 1024 * MB,
+    "team": 10 * 1024 * MB,
+    "enterprise": 100 * 1024 * MB,
+}
+
+DEFAULT_STORAGE_LIMIT = PLAN_STORAGE_LIMITS["free"]
+
+# Statements that never grow a schema, allowed over quota (plus reads, see check_write)
+SHRINKING_STATEMENTS = ("DELETE", "DROP", "TRUNCATE", "VACUUM", "SHOW")
+EXPLAIN_PREFIX = re.compile(r"\s*EXPLAIN\s+(?:\([^)]*\)\s*|(?:ANALY[SZ]E|VERBOSE)\s+)*", re.I)
+
+
+def never_grows(sql: str) -> bool:
+    """Whether sql can't grow a schema: deletes and provable reads (no SELECT INTO, no writing CTE)."""
+    explain = EXPLAIN_PREFIX.match(sql)
+    if explain:
+        if "ANALY" not in explain.group(0).upper():
+            return True  # plain EXPLAIN only plans
+        return never_grows(sql[explain.end():])  # EXPLAIN ANALYZE runs the statement
+    return sql.lstrip().upper().startswith(SHRINKING_STATEMENTS) or is_read_only(sql)
+
+
+@dataclass
+class ProjectUsage:
+    project_id: int
+    shard: str
+    total_bytes: int
+    tables: Dict[str, int] = field(default_factory=dict)  # table -> bytes incl. indexes and TOAST
+    sampled_at: float = 0.0
+
+
+class StorageSampler:
+    """
+    Latest usage per project, refreshed every sample().
+    """
+
+    def __init__(self, retention_days: int = 30):
+        self.retention_days = retention_days
+        self.latest: Dict[int, ProjectUsage] = {}
+        self.sampled_at: float = 0.0
+
+    def get_limit(self, plan: Optional[str]) -> int:
+        return PLAN_STORAGE_LIMITS.get(plan or "", DEFAULT_STORAGE_LIMIT)
+
+    def usage(self, project_id: int) -> Optional[ProjectUsage]:
+        return self.latest.get(project_id)
+
+    def over_limit(self, project_id: int, plan: Optional[str]) -> bool:
+        usage = self.latest.get(project_id)
+        return usage is not None and usage.total_bytes > self.get_limit(plan)
+
+    def check_write(self, project_id: int, plan: Optional[str], sql: Optional[str] = None) -> Optional[str]:
+        """Error message if the write must be blocked, None if allowed."""
+        if plan is None or not self.over_limit(project_id, plan):
+            return None
+        if sql is not None and never_grows(sql):
+            return None
+        usage = self.latest[project_id]
+        return (
+            f"Storage limit exceeded: {usage.total_bytes / MB:.1f} MB used of "
+            f"{self.get_limit(plan) / MB:.0f} MB. Delete data or upgrade your plan."
+        )
+
+    async def _sample_shard(self, shard: str, engine) -> Dict[int, ProjectUsage]:
+        async with engine.connect() as conn:
+            result = await conn.execute(text('''
+                SELECT n.nspname, c.relname, COALESCE(pg_total_relation_size(c.oid), 0)
+                FROM pg_namespace n
+                LEFT JOIN pg_class c
+                    ON c.relnamespace = n.oid AND c.relkind IN ('r', 'p', 'm')
+                WHERE n.nspname LIKE 'project\\_%'
+            '''))
+            rows = result.fetchall()
+
+        now = time.time()
+        projects: Dict[int, ProjectUsage] = {}
+        for schema, table, size in rows:
+            suffix = schema[len("project_"):]
+            if not suffix.isdigit():
+                continue
+            project_id = int(suffix)
+            usage = projects.get(project_id)
+            if usage is None:
+                usage = projects[project_id] = ProjectUsage(project_id, shard, 0, sampled_at=now)
+            if table is not None:
+                usage.tables[table] = int(size)
+                usage.total_bytes += int(size)
+        return projects
+
+    async def sample(self, shard_map: ShardMap) -> Dict[int, ProjectUsage]:
+        """One catalog query per shard, then one batched insert."""
+        latest: Dict[int, ProjectUsage] = {}
+        for shard in shard_map.shards:
+            try:
+                latest.update(await self._sample_shard(shard, shard_map.engine(shard)))
+            except Exception as e:
+                logger.warning(f"Storage sample of shard {shard} failed: {e}")
+                # Keep previous numbers for that shard rather than dropping quotas
+                latest.update({pid: u for pid, u in self.latest.items() if u.shard == shard and pid not in latest})
+
+        self.latest = latest
+        self.sampled_at = time.time()
+
+        if latest:
+            await self._store(shard_map.default_engine, list(latest.values()))
+        return latest
+
+    async def _store(self, engine, samples: List[ProjectUsage]):
+        async with engine.begin() as conn:
+            await conn.execute(text('''
+                CREATE TABLE IF NOT EXISTS storage_usage (
+                    project_id INTEGER NOT NULL,
+                    sampled_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    total_bytes BIGINT NOT NULL,
+                    tables JSONB NOT NULL DEFAULT '{}'
+                )
+            '''))
+            await conn.execute(text(
+                'CREATE INDEX IF NOT EXISTS storage_usage_project_time ON storage_usage (project_id, sampled_at)'
+            ))
+            await conn.execute(
+                text('''
+                    INSERT INTO storage_usage (project_id, total_bytes, tables)
+                    VALUES (:project_id, :total_bytes, CAST(:tables AS JSONB))
+                '''),
+                [
+                    {"project_id": u.project_id, "total_bytes": u.total_bytes, "tables": json.dumps(u.tables)}
+                    for u in samples
+                ],
+            )
+            await conn.execute(text(
+                f"DELETE FROM storage_usage WHERE sampled_at < NOW() - INTERVAL '{int(self.retention_days)} days'"
+            ))
+
+    async def history(self, engine, project_id: int, hours: int = 24) -> List[dict]:
+        """Schema totals over the last hours, oldest first."""
+        async with engine.connect() as conn:
+            exists = await conn.execute(text("SELECT to_regclass('storage_usage')"))
+            if exists.scalar() is None:
+                return []  # nothing sampled yet
+            result = await conn.execute(
+                text('''
+                    SELECT sampled_at, total_bytes FROM storage_usage
+                    WHERE project_id = :project_id
+                    AND sampled_at > NOW() - make_interval(hours => :hours)
+                    ORDER BY sampled_at
+                '''),
+                {"project_id": project_id, "hours": hours},
+            )
+            return [{"at": row[0].isoformat(), "bytes": row[1]} for row in result]
+
+    async def run(self, shard_map: ShardMap, interval: float = 300.0):
+        """Background loop: sample now, then every interval until cancelled."""
+        while True:
+            try:
+                await self.sample(shard_map)
+            except Exception as e:
+                logger.warning(f"Storage sample failed: {e}")
+            await asyncio.sleep(interval)
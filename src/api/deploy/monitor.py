@@ -0,0 +1,300 @@
+"""
+Deployment monitor - one background service following all active deployments.
+
+Every tick loads the active Deployment rows in one query, asks Railway
+about the ones that are due in batched GraphQL requests (one aliased
+`deployment` field per row, up to batch_size rows per request) and writes
+all status changes in one UPDATE.
+
+Each deployment is polled on its own adaptive interval: every
+min_interval right after it starts or changes status, backing off while
+Railway keeps reporting the same status, up to max_interval. Deploy
+endpoints call wake() so a new deployment is picked up right away.
+
+With several API workers only one of them polls: the one holding a
+Postgres advisory lock on a connection it keeps open. No connection is
+held while waiting for Railway. Without RAILWAY_API_KEY deployments are
+mocked and go live on their first poll; with it, a deployment Railway gave
+no id for cannot be followed and is marked failed.
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import time
+import logging
+
+import httpx
+from sqlalchemy import case, func, literal, select, update
+
+from ..core.config import settings
+from ..core.database import engine
+from ..models.project import Deployment, Project, ProjectStatus
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ("pending", "building", "deploying")
+MONITOR_LOCK = 0x78626470  # pg advisory lock key ("xbdp")
+NO_RAILWAY_ID = "Railway returned no deployment id to follow"
+
+# Railway deployment status -> ours
+RAILWAY_STATUS: Dict[str, str] = {
+    "QUEUED": "pending",
+    "WAITING": "pending",
+    "INITIALIZING": "building",
+    "BUILDING": "building",
+    "DEPLOYING": "deploying",
+    "SUCCESS": "live",
+    "SLEEPING": "live",
+    "FAILED": "failed",
+    "CRASHED": "failed",
+    "REMOVED": "cancelled",
+    "SKIPPED": "cancelled",
+}
+
+# Final deployment status -> project status
+PROJECT_STATUS: Dict[str, ProjectStatus] = {
+    "live": ProjectStatus.DEPLOYED,
+    "failed": ProjectStatus.FAILED,
+}
+
+
+def batch_query(railway_ids: List[str]) -> Tuple[str, Dict[str, str]]:
+    """One GraphQL query asking for all deployments, aliased d0, d1, ..."""
+    variables = {f"d{i}": railway_id for i, railway_id in enumerate(railway_ids)}
+    params = ", ".join(f"${name}: String!" for name in variables)
+    fields = " ".join(f"{name}: deployment(id: ${name}) {{ id status staticUrl }}" for name in variables)
+    return f"query deployments({params}) {{ {fields} }}", variables
+
+
+@dataclass
+class Tracked:
+    status: str
+    interval: float
+    next_poll: float  # monotonic
+
+
+class DeploymentMonitor:
+    def __init__(
+        self,
+        engine: Any,
+        api_url: str = "https://backboard.railway.app/graphql/v2",
+        api_key: str = "",
+        min_interval: float = 5.0,
+        max_interval: float = 60.0,
+        backoff: float = 1.5,
+        batch_size: int = 50,
+        timeout: float = 30.0,
+    ):
+        self.engine = engine
+        self.api_url = api_url
+        self.api_key = api_key
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.tracked: Dict[int, Tracked] = {}  # deployment id -> polling state
+        self.ticks = 0
+        self.requests = 0
+        self.updated = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._leader: Any = None  # connection holding MONITOR_LOCK
+        self._wake = asyncio.Event()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            )
+        return self._client
+
+    def wake(self):
+        """Poll now (a deployment was just started)."""
+        self._wake.set()
+
+    async def fetch(self, railway_ids: List[str]) -> Dict[str, dict]:
+        """Railway deployment nodes by id; ids Railway did not answer for are left out."""
+        nodes: Dict[str, dict] = {}
+        for start in range(0, len(railway_ids), self.batch_size):
+            chunk = railway_ids[start:start + self.batch_size]
+            query, variables = batch_query(chunk)
+            self.requests += 1
+            try:
+                response = await self.client.post(self.api_url, json={"query": query, "variables": variables})
+                response.raise_for_status()
+                data = response.json().get("data") or {}
+            except Exception as e:
+                logger.warning(f"Railway status query for {len(chunk)} deployments failed: {e}")
+                continue
+            for name, railway_id in variables.items():
+                if data.get(name):
+                    nodes[railway_id] = data[name]
+        return nodes
+
+    def _schedule(self, deployment_id: int, status: str, now: float):
+        tracked = self.tracked.get(deployment_id)
+        if tracked is None or tracked.status != status:
+            interval = self.min_interval
+        else:
+            interval = min(tracked.interval * self.backoff, self.max_interval)
+        self.tracked[deployment_id] = Tracked(status, interval, now + interval)
+
+    async def _lead(self) -> bool:
+        """Whether this worker is the one polling (always, outside Postgres)."""
+        if self.engine.dialect.name != "postgresql":
+            return True
+        try:
+            if self._leader is None:
+                conn = await self.engine.connect()
+                if not await conn.scalar(select(func.pg_try_advisory_lock(MONITOR_LOCK))):
+                    await conn.close()
+                    return False
+                self._leader = conn
+            else:
+                await self._leader.execute(select(1))  # lock goes with the connection
+            await self._leader.commit()  # session-level lock outlives the transaction
+            return True
+        except Exception as e:
+            logger.warning(f"Deployment monitor lost its lock connection: {e}")
+            await self._release()
+            return False
+
+    async def _release(self):
+        if self._leader is not None:
+            try:
+                await self._leader.close()
+            except Exception:
+                pass
+            self._leader = None
+
+    async def tick(self) -> float:
+        """Poll due deployments and store changes; returns seconds until the next one is due."""
+        if not await self._lead():
+            self.tracked.clear()  # another worker is polling
+            return self.max_interval
+        now = time.monotonic()
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                select(Deployment.id, Deployment.project_id, Deployment.status, Deployment.railway_deployment_id)
+                .where(Deployment.status.in_(ACTIVE))
+            )).all()
+        for deployment_id in set(self.tracked) - {row.id for row in rows}:
+            del self.tracked[deployment_id]  # finished or cancelled elsewhere
+
+        due = [row for row in rows if row.id not in self.tracked or self.tracked[row.id].next_poll <= now]
+        if due:
+            self.ticks += 1
+            changes = await self._poll(due)
+            for row in due:
+                status = changes[row.id][0] if row.id in changes else row.status
+                if status in ACTIVE:
+                    self._schedule(row.id, status, now)
+                else:
+                    self.tracked.pop(row.id, None)
+            if changes:
+                async with self.engine.begin() as conn:
+                    await self._store(conn, changes, {row.id: row for row in due})
+
+        if not self.tracked:
+            return self.max_interval
+        return max(min(t.next_poll for t in self.tracked.values()) - time.monotonic(), 0.0)
+
+    async def _poll(self, due: List[Any]) -> Dict[int, Tuple[str, Optional[str], Optional[str]]]:
+        """New (status, url, reason) of due deployments whose status changed."""
+        if not self.api_key:
+            return {row.id: ("live", None, None) for row in due}  # mocked
+        followed = {row.id: row.railway_deployment_id for row in due if row.railway_deployment_id}
+        nodes = await self.fetch(list(followed.values())) if followed else {}
+        changes = {}
+        for row in due:
+            if row.id not in followed:
+                changes[row.id] = ("failed", None, NO_RAILWAY_ID)
+                continue
+            node = nodes.get(row.railway_deployment_id)
+            if node is None:
+                continue
+            status = RAILWAY_STATUS.get(node.get("status", ""), row.status)
+            if status != row.status:
+                changes[row.id] = (status, node.get("staticUrl"), None)
+        return changes
+
+    async def _store(self, conn, changes: Dict[int, Tuple[str, Optional[str], Optional[str]]], rows: Dict[int, Any]):
+        """All status changes in one UPDATE, then the projects whose deployment finished."""
+        now = datetime.utcnow()
+        finished = [deployment_id for deployment_id, (status, _, _) in changes.items() if status not in ACTIVE]
+        urls = {deployment_id: f"https://{url}" for deployment_id, (_, url, _) in changes.items() if url}
+        reasons = {deployment_id: reason for deployment_id, (_, _, reason) in changes.items() if reason}
+        values: Dict[str, Any] = {
+            "status": case({i: status for i, (status, _, _) in changes.items()}, value=Deployment.id),
+        }
+        if finished:
+            values["finished_at"] = case({i: now for i in finished}, value=Deployment.id, else_=Deployment.finished_at)
+        if urls:
+            values["url"] = case(urls, value=Deployment.id, else_=Deployment.url)
+        if reasons:
+            values["build_logs"] = case(reasons, value=Deployment.id, else_=Deployment.build_logs)
+        updated = set((await conn.execute(
+            update(Deployment)
+            .where(Deployment.id.in_(list(changes)))
+            .where(Deployment.status.in_(ACTIVE))  # not cancelled meanwhile
+            .values(**values)
+            .returning(Deployment.id)
+        )).scalars())
+        self.updated += len(updated)
+
+        projects = {
+            rows[i].project_id: PROJECT_STATUS[changes[i][0]]
+            for i in finished if i in updated and changes[i][0] in PROJECT_STATUS
+        }
+        if projects:
+            values = {
+                "status": case({p: literal(s, Project.status.type) for p, s in projects.items()}, value=Project.id),
+            }
+            deployed = [p for p, s in projects.items() if s == ProjectStatus.DEPLOYED]
+            if deployed:
+                values["last_deployed_at"] = case(
+                    {p: now for p in deployed}, value=Project.id, else_=Project.last_deployed_at,
+                )
+            await conn.execute(update(Project).where(Project.id.in_(list(projects))).values(**values))
+        logger.info(f"Deployment monitor: {len(changes)} status changes, {len(finished)} finished")
+
+    async def run(self):
+        """Background loop until cancelled (started in the app lifespan)."""
+        while True:
+            self._wake.clear()
+            try:
+                delay = await self.tick()
+            except Exception as e:
+                logger.warning(f"Deployment monitor tick failed: {e}")
+                delay = self.max_interval
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        await self._release()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self.tracked),
+            "ticks": self.ticks,
+            "requests": self.requests,
+            "updated": self.updated,
+        }
+
+
+deployment_monitor = DeploymentMonitor(
+    engine,
+    api_url=settings.RAILWAY_API_URL,
+    api_key=settings.RAILWAY_API_KEY,
+    min_interval=settings.DEPLOY_POLL_MIN_SECONDS,
+    max_interval=settings.DEPLOY_POLL_MAX_SECONDS,
+    batch_size=settings.DEPLOY_POLL_BATCH,
+)
@@ -0,0 +1,274 @@
+"""
+Deploy queue - durable jobs for webhook-triggered deploys.
+
+The GitHub webhook only verifies the push, inserts a DeployJob row and
+answers 202; deploying happens here, in a pool of worker tasks per API
+process. Jobs are rows in Postgres, so a crash or restart loses nothing.
+
+- Dedup: (repo, commit sha) is unique whatever the job's status; a
+  redelivered push is not queued twice, nor deployed again once done.
+- Claiming: a worker takes the oldest due job with FOR UPDATE SKIP LOCKED,
+  so workers of all processes share the table without blocking each other.
+- Per-project ordering: only a project's oldest unfinished job can be
+  claimed, so one project's pushes deploy one at a time, in order.
+- Retries: a failed job is queued again with exponential backoff until
+  max_attempts. While running, run_after is the lease end: a job whose
+  worker died is claimed again once it passes.
+- Coalescing: a push waits coalesce_seconds before it is deployed, and a
+  newer push of the same project supersedes it (taking over its start
+  time). Newer means pushed later, not delivered later: a late redelivery
+  of an older push is superseded on arrival. A push arriving while the project is deploying is deferred by
+  the handler until that deploy is done, so a burst of pushes ends in
+  one follow-up deploy of the newest commit.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, List, Optional
+import asyncio
+import logging
+
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+
+from ..models.project import DeployJob
+
+logger = logging.getLogger(__name__)
+
+OPEN = ("queued", "running")
+
+
+class SkipJob(Exception):
+    """Raised by a handler when the job needs no deploy (done, nothing to retry)."""
+
+
+class DeferJob(Exception):
+    """Raised by a handler when the job cannot run yet; queued again without using an attempt."""
+
+
+# handler(session, job) -> deployment id; runs in the claiming transaction's session
+Handler = Callable[[Any, DeployJob], Awaitable[Optional[int]]]
+
+
+class DeployQueue:
+    def __init__(
+        self,
+        session_factory: Callable[[], Any],
+        handler: Handler,
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_seconds: float = 10.0,
+        max_backoff_seconds: float = 600.0,
+        lease_seconds: float = 120.0,
+        poll_seconds: float = 5.0,
+        coalesce_seconds: float = 0.0,
+        defer_seconds: float = 10.0,
+        on_done: Optional[Callable[[DeployJob], None]] = None,
+    ):
+        self.session_factory = session_factory
+        self.handler = handler
+        self.on_done = on_done  # called after a job's deploy was committed
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.coalesce_seconds = coalesce_seconds
+        self.defer_seconds = defer_seconds
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.deferred = 0
+        self.coalesced = 0  # pushes superseded before they were deployed: builds saved
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def enqueue(
+        self,
+        session,
+        project_id: int,
+        repo: str,
+        commit_sha: str,
+        commit_message: str = "",
+        pushed_at: Optional[datetime] = None,
+    ) -> Optional[int]:
+        """
+        Insert a job in the caller's transaction; None if (repo, commit_sha) is already queued.
+
+        The project's queued jobs pushed before this one are superseded by
+        it, and it keeps the earliest of their start times. If the project
+        has a job pushed after it, the new job is superseded instead.
+        """
+        now = datetime.utcnow()
+        pushed_at = pushed_at or now
+        run_after = now + timedelta(seconds=self.coalesce_seconds)
+        insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+        job_id = await session.scalar(
+            insert(DeployJob)
+            .values(
+                project_id=project_id,
+                repo=repo,
+                commit_sha=commit_sha,
+                commit_message=commit_message[:255],
+                pushed_at=pushed_at,
+                status="queued",
+                attempts=0,
+                run_after=run_after,
+                created_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=["repo", "commit_sha"])
+            .returning(DeployJob.id)
+        )
+        if job_id is None:
+            self.duplicates += 1
+            return None
+
+        newer = await session.scalar(
+            select(DeployJob.id)
+            .where(DeployJob.project_id == project_id)
+            .where(DeployJob.id != job_id)
+            .where(DeployJob.pushed_at > pushed_at)
+            .order_by(DeployJob.pushed_at.desc())
+            .limit(1)
+        )
+        if newer is not None:
+            self.coalesced += 1
+            await session.execute(
+                update(DeployJob)
+                .where(DeployJob.id == job_id)
+                .values(status="superseded", finished_at=now, last_error=f"Superseded by job {newer}")
+            )
+            return job_id
+
+        superseded = (await session.execute(
+            update(DeployJob)
+            .where(DeployJob.project_id == project_id)
+            .where(DeployJob.status == "queued")
+            .where(DeployJob.id != job_id)
+            .where(or_(
+                DeployJob.pushed_at < pushed_at,
+                and_(DeployJob.pushed_at == pushed_at, DeployJob.id < job_id),  # same second: arrival order
+            ))
+            .values(status="superseded", finished_at=now, last_error=f"Superseded by job {job_id}")
+            .returning(DeployJob.run_after)
+        )).scalars().all()
+        if superseded:
+            self.coalesced += len(superseded)
+            await session.execute(
+                update(DeployJob).where(DeployJob.id == job_id).values(run_after=min(run_after, *superseded))
+            )
+        return job_id
+
+    def wake(self):
+        """A job was queued (call after its transaction committed)."""
+        self._wake.set()
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_seconds * 2 ** (attempts - 1), self.max_backoff_seconds)
+
+    async def claim(self) -> Optional[int]:
+        """Take the oldest due job that is first in its project's line; its id, or None."""
+        now = datetime.utcnow()
+        earlier = aliased(DeployJob)
+        async with self.session_factory() as session:
+            async with session.begin():
+                job = await session.scalar(
+                    select(DeployJob)
+                    .where(DeployJob.status.in_(OPEN))
+                    .where(DeployJob.run_after <= now)
+                    .where(~exists().where(
+                        earlier.project_id == DeployJob.project_id,
+                        earlier.id < DeployJob.id,
+                        earlier.status.in_(OPEN),
+                    ))
+                    .order_by(DeployJob.id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True, of=DeployJob)
+                )
+                if job is None:
+                    return None
+                job.status = "running"
+                job.attempts += 1
+                job.run_after = now + timedelta(seconds=self.lease_seconds)
+                return job.id
+
+    async def process(self, job_id: int):
+        """Run a claimed job's handler and record the outcome."""
+        async with self.session_factory() as session:
+            job = await session.get(DeployJob, job_id)
+            try:
+                job.deployment_id = await self.handler(session, job)
+                job.status = "done"
+            except SkipJob as e:
+                job.status, job.last_error = "skipped", str(e)
+            except DeferJob as e:
+                job.status, job.last_error = "queued", str(e)
+                job.attempts -= 1
+                job.run_after = datetime.utcnow() + timedelta(seconds=self.defer_seconds)
+                self.deferred += 1
+            except Exception as e:
+                await session.rollback()
+                job = await session.get(DeployJob, job_id)
+                job.last_error = f"{type(e).__name__}: {e}"[:2000]
+                if job.attempts >= self.max_attempts:
+                    job.status = "failed"
+                    self.failed += 1
+                    logger.warning(f"Deploy job {job_id} failed after {job.attempts} attempts: {e}")
+                else:
+                    job.status = "queued"
+                    job.run_after = datetime.utcnow() + timedelta(seconds=self.backoff(job.attempts))
+                    self.retried += 1
+                    logger.info(f"Deploy job {job_id} failed (attempt {job.attempts}), retrying: {e}")
+            outcome = job.status
+            if outcome != "queued":
+                job.finished_at = datetime.utcnow()
+            await session.commit()
+        self.processed += 1
+        if outcome == "done" and self.on_done:
+            self.on_done(job)
+        if outcome != "queued":
+            self.wake()  # the project's next job may be claimable now
+
+    async def run_once(self) -> bool:
+        """Claim and process one job; False if none was due."""
+        job_id = await self.claim()
+        if job_id is None:
+            return False
+        await self.process(job_id)
+        return True
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except Exception as e:
+                logger.warning(f"Deploy queue worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def start(self):
+        """Start the worker pool (app startup)."""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "deferred": self.deferred,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,98 @@
+"""
+Repository index - which project a GitHub push belongs to.
+
+Projects carry a normalized `owner/name` repo_key (unique, indexed, kept
+in sync with repo_url by the model). Webhooks look the key up here first:
+an in-process LRU from repo key to project id, including repositories
+that have no project, so repeated pushes cost no query at all.
+
+Project updates invalidate the keys they touch in their own worker; other
+workers pick changes up when their entry expires (ttl).
+"""
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+import time
+import logging
+
+from sqlalchemy import bindparam, select, update
+
+from ..core.config import settings
+from ..models.project import Project, repo_key
+
+logger = logging.getLogger(__name__)
+
+
+class RepoIndex:
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[int], float]]" = OrderedDict()  # key -> (project id, expires)
+        self.hits = 0
+        self.misses = 0
+
+    async def lookup(self, session: Any, url: str) -> Optional[int]:
+        """Id of the project connected to repository url (or owner/name), if any."""
+        key = repo_key(url)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+        self.misses += 1
+        project_id = await session.scalar(select(Project.id).where(Project.repo_key == key))
+        self._entries[key] = (project_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return project_id
+
+    def invalidate(self, *keys: Optional[str]):
+        """Forget keys whose project changed (call after the change is committed)."""
+        for key in keys:
+            if key:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+async def backfill_repo_keys(engine: Any) -> int:
+    """
+    Set repo_key of projects created before the column existed.
+
+    A repository connected to several projects stays with the oldest one;
+    the others keep repo_key NULL and are logged. Returns projects updated.
+    """
+    async with engine.begin() as conn:
+        taken = set((await conn.execute(
+            select(Project.repo_key).where(Project.repo_key.is_not(None))
+        )).scalars())
+        rows = (await conn.execute(
+            select(Project.id, Project.repo_url)
+            .where(Project.repo_key.is_(None))
+            .where(Project.repo_url.is_not(None))
+            .order_by(Project.id)
+        )).all()
+        keys = []
+        for row in rows:
+            key = repo_key(row.repo_url)
+            if key is None:
+                continue
+            if key in taken:
+                logger.warning(f"Project {row.id}: repository {key} already belongs to another project")
+                continue
+            taken.add(key)
+            keys.append({"project_id": row.id, "key": key})
+        if keys:
+            await conn.execute(
+                update(Project)
+                .where(Project.id == bindparam("project_id"))
+                .values(repo_key=bindparam("key"), updated_at=Project.updated_at),
+                keys,
+            )
+    return len(keys)
+
+
+repo_index = RepoIndex(ttl=settings.REPO_CACHE_SECONDS)
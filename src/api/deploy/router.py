@@ -4,17 +4,20 @@ Deploy router - trigger deployments via Railway.
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Response
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
 
 from ..core.config import settings
-from ..core.database import get_db
+from ..core.database import async_session, get_db
 from ..models.user import User
-from ..models.project import Project, ProjectStatus, Deployment
+from ..models.project import Project, ProjectStatus, Deployment, DeployJob, repo_key
 from ..auth.router import get_current_user
+from .monitor import deployment_monitor
+from .queue import DeferJob, DeployQueue, SkipJob
+from .repos import repo_index
 
 
 router = APIRouter()
@@ -90,7 +93,7 @@ async def trigger_railway_deploy(project: Project, environment: str) -> dict:
         }
         
         response = await client.post(
-            "https://backboard.railway.app/graphql/v2",
+            settings.RAILWAY_API_URL,
             json=payload,
             headers=headers,
             timeout=30.0,
@@ -106,25 +109,6 @@ async def trigger_railway_deploy(project: Project, environment: str) -> dict:
         return data.get("data", {}).get("deploymentCreate", {})
 
 
-async def check_deployment_status(deployment_id: str) -> str:
-    """Check deployment status from Railway."""
-    # Mock for development
-    return "live"
-
-
-# ════════════════════════════════════════════
-# Background Tasks
-# ════════════════════════════════════════════
-
-async def monitor_deployment(deployment_id: int, db_url: str):
-    """
-    Background task to monitor deployment status.
-    
-    In production, this would poll Railway API and update status.
-    """
-    pass
-
-
 # ════════════════════════════════════════════
 # Endpoints
 # ════════════════════════════════════════════
@@ -174,6 +158,7 @@ async def deploy_project(
         environment=data.environment,
         status="building",
         url=railway_result.get("url"),
+        railway_deployment_id=railway_result.get("id"),
     )
     
     db.add(deployment)
@@ -187,11 +172,7 @@ async def deploy_project(
     await db.flush()
     await db.refresh(deployment)
     
-    background_tasks.add_task(
-        monitor_deployment,
-        deployment.id,
-        str(settings.DATABASE_URL)
-    )
+    background_tasks.add_task(deployment_monitor.wake)  # after commit
     
     return DeploymentResponse.model_validate(deployment)
 
@@ -311,6 +292,7 @@ class WebhookResponse(BaseModel):
     status: str
     message: str
     deployment_id: Optional[int] = None
+    job_id: Optional[int] = None
 
 
 # ════════════════════════════════════════════
@@ -339,6 +321,7 @@ def verify_github_signature(payload: bytes, signature: str, secret: str) -> bool
 @router.post("/webhook/github", response_model=WebhookResponse)
 async def github_webhook(
     request: Request,
+    response: Response,
     background_tasks: BackgroundTasks,
     x_hub_signature_256: Optional[str] = Header(None),
     x_github_event: Optional[str] = Header(None),
@@ -348,6 +331,9 @@ async def github_webhook(
     GitHub webhook handler for auto-deploy.
     
     FUNC-DEP-005: Auto-deploy on push to main/master
+    
+    Only verifies and queues the push (202); deploy_queue workers deploy it,
+    one deploy per burst of pushes.
     """
     body = await request.body()
     
@@ -382,33 +368,58 @@ async def github_webhook(
     
     repo_url = payload.get("repository", {}).get("html_url", "")
     repo_full_name = payload.get("repository", {}).get("full_name", "")
+    repo = repo_key(repo_full_name) or repo_key(repo_url)
     
-    result = await db.execute(
-        select(Project)
-        .where(Project.repo_url == repo_url)
-        .where(Project.auto_deploy == True)
-    )
-    project = result.scalar_one_or_none()
+    project_id = await repo_index.lookup(db, repo or "")
+    project = await db.get(Project, project_id) if project_id else None
     
-    if not project:
+    if not project or not project.auto_deploy:
         return WebhookResponse(
             status="skipped",
             message=f"No project found for repository '{repo_full_name}' or auto-deploy disabled"
         )
     
+    commit_sha = payload.get("after", "")
+    commit_message = (payload.get("head_commit") or {}).get("message", "")[:100]
+    pushed_at = payload.get("repository", {}).get("pushed_at")  # unix time of the push
+    
+    job_id = await deploy_queue.enqueue(
+        db, project.id, repo, commit_sha, commit_message,
+        pushed_at=datetime.utcfromtimestamp(pushed_at) if isinstance(pushed_at, (int, float)) else None,
+    )
+    if job_id is None:
+        return WebhookResponse(
+            status="duplicate",
+            message=f"Commit {commit_sha[:7]} already queued"
+        )
+    
+    background_tasks.add_task(deploy_queue.wake)  # after commit
+    response.status_code = status.HTTP_202_ACCEPTED
+    return WebhookResponse(
+        status="queued",
+        message=f"Deployment queued for commit {commit_sha[:7]}",
+        job_id=job_id
+    )
+
+
+# ════════════════════════════════════════════
+# Deploy Queue
+# ════════════════════════════════════════════
+
+async def deploy_push(db: AsyncSession, job: DeployJob) -> int:
+    """Deploy a queued push to production; the queue commits and retries on errors."""
+    project = await db.get(Project, job.project_id)
+    if not project or not project.auto_deploy:
+        raise SkipJob("Project deleted or auto-deploy disabled")
+    
     result = await db.execute(
-        select(Deployment)
+        select(Deployment.id)
         .where(Deployment.project_id == project.id)
         .where(Deployment.status.in_(["pending", "building", "deploying"]))
+        .limit(1)
     )
     if result.scalar_one_or_none():
-        return WebhookResponse(
-            status="skipped",
-            message="Deployment already in progress"
-        )
-    
-    commit_sha = payload.get("after", "")[:7]
-    commit_message = payload.get("head_commit", {}).get("message", "")[:100]
+        raise DeferJob("Deployment already in progress")  # newer pushes supersede this job meanwhile
     
     railway_result = await trigger_railway_deploy(project, "production")
     
@@ -417,8 +428,9 @@ async def github_webhook(
         environment="production",
         status="building",
         url=railway_result.get("url"),
-        commit_sha=commit_sha,
-        commit_message=commit_message,
+        railway_deployment_id=railway_result.get("id"),
+        commit_sha=job.commit_sha[:7],
+        commit_message=job.commit_message,
     )
     
     db.add(deployment)
@@ -427,16 +439,17 @@ async def github_webhook(
     project.production_url = railway_result.get("url")
     
     await db.flush()
-    await db.refresh(deployment)
-    
-    background_tasks.add_task(
-        monitor_deployment,
-        deployment.id,
-        str(settings.DATABASE_URL)
-    )
-    
-    return WebhookResponse(
-        status="triggered",
-        message=f"Deployment triggered for commit {commit_sha}",
-        deployment_id=deployment.id
-    )
+    return deployment.id
+
+
+deploy_queue = DeployQueue(
+    async_session,
+    deploy_push,
+    workers=settings.DEPLOY_QUEUE_WORKERS,
+    max_attempts=settings.DEPLOY_JOB_MAX_ATTEMPTS,
+    backoff_seconds=settings.DEPLOY_JOB_BACKOFF_SECONDS,
+    lease_seconds=settings.DEPLOY_JOB_LEASE_SECONDS,
+    coalesce_seconds=settings.DEPLOY_COALESCE_SECONDS,
+    defer_seconds=settings.DEPLOY_POLL_MIN_SECONDS,
+    on_done=lambda job: deployment_monitor.wake(),
+)
@@ -3,12 +3,13 @@ xBasis API
 ~~~~~~~~~~~
 Main FastAPI application entry point.
 """
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from .core.config import settings
-from .core.database import init_db
+from .core.database import engine, init_db
 from .auth.router import router as auth_router
 from .projects.router import router as projects_router
 from .ai.router import router as ai_router
@@ -16,13 +17,52 @@ from .deploy.router import router as deploy_router
 from .billing.router import router as billing_router
 from .sandbox.router import router as sandbox_router
 from .database.router import router as database_router
+from .database.manager import get_database_manager
+from .sandbox.manager import sandbox_manager
+from .deploy.monitor import deployment_monitor
+from .deploy.router import deploy_queue
+from .deploy.repos import backfill_repo_keys, repo_index
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events."""
     await init_db()
+    await backfill_repo_keys(engine)
+    
+    db_manager = get_database_manager()
+    background = []
+    if db_manager.query_stats:
+        background.append(asyncio.create_task(
+            db_manager.query_stats.run_flusher(db_manager.engine, settings.QUERY_STATS_FLUSH_SECONDS)
+        ))
+    if db_manager.storage:
+        background.append(asyncio.create_task(
+            db_manager.storage.run(db_manager.shard_map, settings.STORAGE_SAMPLE_SECONDS)
+        ))
+    await sandbox_manager.start()
+    background.append(asyncio.create_task(sandbox_manager.run_reaper(settings.SANDBOX_REAP_SECONDS)))
+    if sandbox_manager.telemetry:
+        background.append(asyncio.create_task(sandbox_manager.run_sampler(settings.SANDBOX_TELEMETRY_SECONDS)))
+    background.append(asyncio.create_task(deployment_monitor.run()))
+    deploy_queue.start()
+    
     yield
+    
+    # Loops stop before what they work on shuts down
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await sandbox_manager.shutdown()
+    await deploy_queue.stop()
+    await deployment_monitor.close()
+    if db_manager.query_stats:
+        try:
+            await db_manager.query_stats.flush(db_manager.engine)
+        except Exception:
+            pass  # stats are best effort
+    if db_manager.prepared:
+        await db_manager.prepared.close()
 
 
 app = FastAPI(
@@ -58,4 +98,14 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "database": "connected"}
\ No newline at end of file
+    return {"status": "healthy", "database": "connected"}
+
+
+@app.get("/metrics/sandboxes")
+async def sandbox_metrics():
+    return sandbox_manager.metrics()
+
+
+@app.get("/metrics/deployments")
+async def deployment_metrics():
+    return {"monitor": deployment_monitor.stats(), "queue": deploy_queue.stats(), "repos": repo_index.stats()}
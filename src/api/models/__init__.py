@@ -1,3 +1,3 @@
 """Models package."""
 from .user import User, PlanType
-from .project import Project, Deployment, AISession, ProjectStatus, ProjectType
\ No newline at end of file
+from .project import Project, Deployment, DeployJob, AISession, ProjectStatus, ProjectType
\ No newline at end of file
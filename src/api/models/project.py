@@ -4,8 +4,9 @@ Project model.
 from datetime import datetime
 from enum import Enum
 from typing import Optional, TYPE_CHECKING
-from sqlalchemy import String, Integer, DateTime, Enum as SQLEnum, ForeignKey, Text, JSON
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+import re
+from sqlalchemy import String, Integer, DateTime, Enum as SQLEnum, ForeignKey, Text, JSON, Index, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates
 
 from ..core.database import Base
 
@@ -28,6 +29,24 @@ class ProjectType(str, Enum):
     STATIC = "static"
 
 
+def repo_key(url: Optional[str]) -> Optional[str]:
+    """
+    Normalized "owner/name" of a repository URL or full name.
+    
+    https://github.com/Owner/Name/, git@github.com:owner/name.git and
+    owner/name all give "owner/name"; None if url names no repository.
+    """
+    if not url:
+        return None
+    path = re.split(r"[?#]", url.strip())[0].rstrip("/")
+    path = re.sub(r"\.git$", "", path)
+    path = re.sub(r"^[a-z][a-z0-9+.-]*://", "", path, flags=re.I)
+    parts = [part for part in re.split(r"[/:]", path) if part]
+    if len(parts) < 2:
+        return None
+    return f"{parts[-2]}/{parts[-1]}".lower()
+
+
 class Project(Base):
     __tablename__ = "projects"
     
@@ -43,6 +62,7 @@ class Project(Base):
     status: Mapped[ProjectStatus] = mapped_column(SQLEnum(ProjectStatus), default=ProjectStatus.DRAFT)
     
     repo_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    repo_key: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, unique=True, index=True)  # set from repo_url
     branch: Mapped[str] = mapped_column(String(100), default="main")
     
     preview_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
@@ -62,6 +82,11 @@ class Project(Base):
     
     deployments: Mapped[list["Deployment"]] = relationship("Deployment", back_populates="project", cascade="all, delete-orphan")
     ai_sessions: Mapped[list["AISession"]] = relationship("AISession", back_populates="project", cascade="all, delete-orphan")
+    
+    @validates("repo_url")
+    def _set_repo_key(self, key: str, value: Optional[str]) -> Optional[str]:
+        self.repo_key = repo_key(value)
+        return value
 
 
 class Deployment(Base):
@@ -73,6 +98,7 @@ class Deployment(Base):
     environment: Mapped[str] = mapped_column(String(50), default="preview")
     status: Mapped[str] = mapped_column(String(50), default="pending")
     url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    railway_deployment_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
     commit_sha: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
     commit_message: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     build_logs: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
@@ -80,6 +106,29 @@ class Deployment(Base):
     finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
 
+class DeployJob(Base):
+    """A push to deploy, queued by the GitHub webhook and run by the deploy queue workers."""
+    __tablename__ = "deploy_jobs"
+    __table_args__ = (
+        UniqueConstraint("repo", "commit_sha", name="uq_deploy_jobs_repo_commit"),  # GitHub redeliveries
+        Index("ix_deploy_jobs_open", "status", "project_id", "id"),
+    )
+    
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    project_id: Mapped[int] = mapped_column(ForeignKey("projects.id", ondelete="CASCADE"))
+    repo: Mapped[str] = mapped_column(String(255))  # owner/name
+    commit_sha: Mapped[str] = mapped_column(String(40))
+    commit_message: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    pushed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # when GitHub got the push
+    status: Mapped[str] = mapped_column(String(20), default="queued")  # queued, running, done, skipped, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    run_after: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)  # retry time, or lease end while running
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    deployment_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 class AISession(Base):
     __tablename__ = "ai_sessions"
     
@@ -0,0 +1,66 @@
+"""
+Project pre-warming - schema and sandbox ready before the IDE asks.
+
+Right after a project is created the user opens the IDE, which creates
+the project's database schema and then its sandbox. With PROJECT_PREWARM
+both start in the background as soon as create_project has responded:
+the schema is created (the IDE's create_database is then a no-op) and a
+warm container of the project's type is reserved for its first sandbox.
+
+An unused reservation expires after SANDBOX_RESERVE_SECONDS. Deleting
+the project cancels the warm-up, releases the reservation and drops the
+schema if it is still empty (nothing but what pre-warming created). A
+container start in flight is not interrupted: its reservation is then
+cancelled by expiry, so no half-started container is left behind.
+"""
+from typing import Dict
+import asyncio
+import logging
+
+from ..database.manager import get_database_manager
+from ..sandbox.manager import sandbox_manager
+
+logger = logging.getLogger(__name__)
+
+_tasks: Dict[int, asyncio.Task] = {}  # project id -> warm-up in flight
+
+
+async def _create_schema(project_id: int):
+    await get_database_manager().create_database(project_id)
+
+
+async def prewarm(project_id: int, project_type: str):
+    results = await asyncio.gather(
+        _create_schema(project_id),
+        asyncio.shield(sandbox_manager.reserve(project_id, project_type)),
+        return_exceptions=True,
+    )
+    for step, result in zip(("schema", "sandbox"), results):
+        if isinstance(result, Exception):
+            logger.warning(f"Pre-warming {step} of project {project_id} failed: {result}")
+
+
+async def start_prewarm(project_id: int, project_type: str):
+    """Run prewarm in the background (called as a response background task)."""
+    task = asyncio.create_task(prewarm(project_id, project_type))
+    _tasks[project_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(project_id, None))
+
+
+async def _drop_unused_schema(project_id: int):
+    databases = get_database_manager()
+    if await databases.schema_exists(project_id) and not await databases.get_tables(project_id):
+        await databases.drop_database(project_id)
+
+
+async def cancel_prewarm(project_id: int):
+    """Undo a deleted project's warm-up (background task, after the delete is committed)."""
+    task = _tasks.get(project_id)
+    if task:
+        task.cancel()
+        await asyncio.wait([task])
+    await sandbox_manager.cancel_reservation(project_id)
+    try:
+        await _drop_unused_schema(project_id)
+    except Exception as e:
+        logger.warning(f"Dropping pre-warmed schema of project {project_id} failed: {e}")
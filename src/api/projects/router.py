@@ -5,15 +5,18 @@ from datetime import datetime
 from typing import List, Optional
 import re
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.config import settings
 from ..core.database import get_db
 from ..models.user import User
-from ..models.project import Project, ProjectStatus, ProjectType
+from ..models.project import Project, ProjectStatus, ProjectType, repo_key
 from ..auth.router import get_current_user
+from ..deploy.repos import repo_index
+from .prewarm import cancel_prewarm, start_prewarm
 
 
 router = APIRouter()
@@ -29,6 +32,8 @@ class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     custom_domain: Optional[str] = None
+    repo_url: Optional[str] = None  # "" disconnects the repository
+    auto_deploy: Optional[bool] = None
 
 
 class ProjectResponse(BaseModel):
@@ -41,6 +46,8 @@ class ProjectResponse(BaseModel):
     preview_url: Optional[str]
     production_url: Optional[str]
     custom_domain: Optional[str]
+    repo_url: Optional[str] = None
+    auto_deploy: bool = False
     created_at: datetime
     updated_at: datetime
     last_deployed_at: Optional[datetime]
@@ -68,6 +75,7 @@ async def list_projects(
 @router.post("", response_model=ProjectResponse, status_code=201)
 async def create_project(
     data: ProjectCreate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -95,6 +103,8 @@ async def create_project(
     db.add(project)
     await db.flush()
     await db.refresh(project)
+    if settings.PROJECT_PREWARM:
+        background_tasks.add_task(start_prewarm, project.id, project.type.value)
     return ProjectResponse.model_validate(project)
 
 
@@ -117,6 +127,7 @@ async def get_project(
 async def update_project(
     project_id: int,
     data: ProjectUpdate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -132,6 +143,21 @@ async def update_project(
         project.description = data.description
     if data.custom_domain is not None:
         project.custom_domain = data.custom_domain
+    if data.repo_url is not None:
+        # Checked before project changes: the query would autoflush the clash into the unique index
+        new_key = repo_key(data.repo_url)
+        if data.repo_url and new_key is None:
+            raise HTTPException(status_code=400, detail="Invalid repository URL")
+        if new_key:
+            result = await db.execute(
+                select(Project.id).where(Project.repo_key == new_key).where(Project.id != project.id)
+            )
+            if result.scalar_one_or_none():
+                raise HTTPException(status_code=409, detail="Repository is connected to another project")
+        background_tasks.add_task(repo_index.invalidate, project.repo_key, new_key)  # after commit
+        project.repo_url = data.repo_url or None
+    if data.auto_deploy is not None:
+        project.auto_deploy = data.auto_deploy
     await db.flush()
     await db.refresh(project)
     return ProjectResponse.model_validate(project)
@@ -140,6 +166,7 @@ async def update_project(
 @router.delete("/{project_id}", status_code=204)
 async def delete_project(
     project_id: int,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -149,7 +176,10 @@ async def delete_project(
     project = result.scalar_one_or_none()
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    repo = project.repo_key
     await db.delete(project)
+    background_tasks.add_task(repo_index.invalidate, repo)  # after commit
+    background_tasks.add_task(cancel_prewarm, project_id)
 
 
 @router.get("/{project_id}/env")
@@ -0,0 +1,192 @@
+"""
+Dependency cache - content-addressed volumes of installed dependencies.
+
+A project's lockfile (package-lock.json, requirements.txt) is hashed with
+the runtime image; the hash names a Docker volume on the sandbox host
+holding the installed packages. Sandboxes mount it read-only, so a cold
+start skips `npm ci` / `pip install` entirely once any project with the
+same lockfile has been built on that host.
+
+On a miss the volume is built by a short-lived builder container. Builds
+of one volume are serialized in-process, and across processes by flock on
+a lock file inside the volume itself; a marker file written last makes
+finished volumes a no-op to "build" again. Volumes are evicted least
+recently used first when the host's cache exceeds its disk budget.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Tuple
+import asyncio
+import time
+import logging
+
+from .runtimes import BUILD_DIR, BUILD_MOUNT, IDLE_COMMAND, Runtime
+from .sync import stream_tar
+
+logger = logging.getLogger(__name__)
+
+LABEL = "xbasis.deps"  # lockfile hash
+READY_MARKER = f"{BUILD_MOUNT}/.xbasis-ready"
+BUILD_LOCK = f"{BUILD_MOUNT}/.xbasis-lock"
+
+
+class DependencyBuildError(RuntimeError):
+    pass
+
+
+@dataclass
+class DepVolume:
+    name: str
+    key: str
+    size_bytes: int = 0
+    ready: bool = False  # built (or verified) by this process
+    users: int = 0  # sandboxes mounting it
+    last_used: float = field(default_factory=time.time)
+
+
+def volume_name(project_type: str, key: str) -> str:
+    return f"xbasis-deps-{project_type}-{key[:24]}"
+
+
+def build_script(runtime: Runtime) -> str:
+    """Install once per volume; print the volume size in KB."""
+    inner = f"[ -f {READY_MARKER} ] || {{ {runtime.build} && touch {READY_MARKER}; }}"
+    return f"cd {BUILD_DIR} && flock {BUILD_LOCK} sh -c '{inner}' && du -sk {BUILD_MOUNT} | cut -f1"
+
+
+class DependencyCache:
+    def __init__(self, budget_mb: int = 20 * 1024, build_timeout: float = 600.0):
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.build_timeout = build_timeout
+        self.volumes: Dict[str, "OrderedDict[str, DepVolume]"] = {}  # host -> LRU of volumes
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def _host_volumes(self, host_name: str) -> "OrderedDict[str, DepVolume]":
+        return self.volumes.setdefault(host_name, OrderedDict())
+
+    def has(self, host_name: str, project_type: str, key: str) -> bool:
+        return volume_name(project_type, key) in self._host_volumes(host_name)
+
+    async def load(self, host_name: str, client: Any):
+        """
+        Pick up volumes built before a restart, with sizes from docker df.
+
+        They count against the budget right away; the first use re-runs the
+        build, which returns at once if the volume was finished.
+        """
+        usage = await asyncio.to_thread(client.df)
+        volumes = self._host_volumes(host_name)
+        for info in usage.get("Volumes") or []:
+            key = (info.get("Labels") or {}).get(LABEL)
+            if key and info["Name"] not in volumes:
+                size = (info.get("UsageData") or {}).get("Size", 0)
+                volumes[info["Name"]] = DepVolume(info["Name"], key, size_bytes=max(size, 0), last_used=0.0)
+
+    async def acquire(
+        self,
+        host_name: str,
+        client: Any,
+        project_type: str,
+        runtime: Runtime,
+        key: str,
+        files: Dict[str, str],
+    ) -> DepVolume:
+        """Ready volume for key on host, built on a miss. Caller must release() it."""
+        name = volume_name(project_type, key)
+        volumes = self._host_volumes(host_name)
+        lock = self._locks.setdefault((host_name, name), asyncio.Lock())
+        async with lock:
+            volume = volumes.get(name)
+            if volume is not None and volume.ready:
+                self.hits += 1
+            else:
+                self.misses += 1
+                started = time.perf_counter()
+                try:
+                    size = await self._build(client, runtime, name, key, runtime.deps_files(files))
+                except Exception:
+                    self.failures += 1
+                    raise
+                volume = volume or DepVolume(name, key)
+                volume.size_bytes = size
+                volume.ready = True
+                volumes[name] = volume
+                logger.info(
+                    f"Built dependency volume {name} on {host_name} "
+                    f"({size // (1024 * 1024)} MB, {time.perf_counter() - started:.1f} s)"
+                )
+            volume.users += 1
+            volume.last_used = time.time()
+            volumes.move_to_end(name)
+        await self.evict(host_name, client)
+        return volume
+
+    def release(self, host_name: str, name: str):
+        volume = self._host_volumes(host_name).get(name)
+        if volume and volume.users:
+            volume.users -= 1
+            volume.last_used = time.time()
+
+    async def _build(self, client: Any, runtime: Runtime, name: str, key: str, files: Dict[str, str]) -> int:
+        def build() -> int:
+            client.volumes.create(name=name, labels={LABEL: key})  # no-op if it exists
+            builder = client.containers.run(
+                runtime.image,
+                IDLE_COMMAND,
+                detach=True,
+                working_dir=BUILD_DIR,
+                volumes={name: {"bind": BUILD_MOUNT, "mode": "rw"}},
+                labels={LABEL: key},
+            )
+            try:
+                builder.put_archive(BUILD_DIR, stream_tar(files))
+                exit_code, output = builder.exec_run(["sh", "-c", build_script(runtime)])
+                output = output.decode(errors="replace").strip() if output else ""
+                if exit_code != 0:
+                    raise DependencyBuildError(f"Dependency build failed ({exit_code}): {output[-500:]}")
+                return int(output.splitlines()[-1]) * 1024
+            finally:
+                builder.remove(force=True)
+
+        return await asyncio.wait_for(asyncio.to_thread(build), self.build_timeout)
+
+    async def evict(self, host_name: str, client: Any):
+        """Remove least recently used idle volumes while the host is over budget."""
+        volumes = self._host_volumes(host_name)
+        total = sum(volume.size_bytes for volume in volumes.values())
+        for name in list(volumes):
+            if total <= self.budget_bytes:
+                return
+            volume = volumes[name]
+            if volume.users:
+                continue
+            try:
+                docker_volume = await asyncio.to_thread(client.volumes.get, name)
+                await asyncio.to_thread(docker_volume.remove)
+            except Exception as e:
+                logger.debug(f"Cannot evict dependency volume {name}: {e}")  # in use by another worker
+                continue
+            del volumes[name]
+            total -= volume.size_bytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "evictions": self.evictions,
+            "budget_mb": self.budget_bytes // (1024 * 1024),
+            "hosts": {
+                host_name: {
+                    "volumes": len(volumes),
+                    "size_mb": sum(v.size_bytes for v in volumes.values()) // (1024 * 1024),
+                }
+                for host_name, volumes in self.volumes.items()
+            },
+        }
@@ -0,0 +1,113 @@
+"""
+Sandbox hosts - Docker hosts and sandbox placement across them.
+
+Each host has its own Docker client, port allocator and warm pools.
+Capacity (CPUs, memory) comes from configuration or from `docker info`;
+usage is what we reserved: every sandbox and warm container on a host
+counts its CPU and memory limit.
+
+Placement is bin-packing with spread: hosts are filled most-loaded first
+(so whole hosts stay free for big bursts and can be drained) until they
+pass spread_above utilization; past that point new sandboxes go to the
+least loaded host instead of piling onto a nearly full one.
+"""
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+import logging
+
+from .ports import PortAllocator
+from .runtimes import RUNTIMES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DockerHost:
+    name: str
+    url: str  # Docker API, e.g. unix:///var/run/docker.sock or tcp://10.0.0.2:2376
+    address: str  # where published sandbox ports are reached from the preview proxy
+    ports: PortAllocator
+    cpus: float = 0.0  # 0 = from docker info
+    memory_mb: int = 0  # 0 = from docker info
+    available: bool = True
+    sandboxes: Set[int] = field(default_factory=set)  # project ids placed here
+    reserved: Set[int] = field(default_factory=set)  # project ids holding a pre-warmed container here
+    pools: Dict[str, Deque[Any]] = field(default_factory=lambda: {t: deque() for t in RUNTIMES})
+    _client: Any = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import docker
+                self._client = docker.DockerClient(base_url=self.url)
+            except Exception as e:
+                logger.warning(f"Docker host {self.name} not available: {e}")
+        return self._client
+
+    @property
+    def containers(self) -> int:
+        """Sandboxes, reserved and warm containers on this host."""
+        return len(self.sandboxes) + len(self.reserved) + sum(len(pool) for pool in self.pools.values())
+
+    def utilization(self, cpu: float, memory_mb: int, extra: int = 0) -> float:
+        """Highest of CPU and memory reservation ratio with extra containers added."""
+        count = self.containers + extra
+        cpu_ratio = count * cpu / self.cpus if self.cpus else 1.0
+        memory_ratio = count * memory_mb / self.memory_mb if self.memory_mb else 1.0
+        return max(cpu_ratio, memory_ratio)
+
+    def fits(self, cpu: float, memory_mb: int) -> bool:
+        return self.available and self.utilization(cpu, memory_mb, extra=1) <= 1.0
+
+    def info(self) -> dict:
+        return {
+            "name": self.name,
+            "address": self.address,
+            "available": self.available,
+            "cpus": self.cpus,
+            "memory_mb": self.memory_mb,
+            "sandboxes": len(self.sandboxes),
+            "warm": sum(len(pool) for pool in self.pools.values()),
+            "reserved": len(self.reserved),
+            "ports_used": self.ports.used,
+            "ports_total": self.ports.size,
+        }
+
+
+def choose_host(
+    hosts: Iterable[DockerHost],
+    cpu: float,
+    memory_mb: int,
+    spread_above: float = 0.7,
+    warm_type: Optional[str] = None,
+    max_sandboxes: int = 0,
+) -> Optional[DockerHost]:
+    """
+    Host for a new sandbox, or None if no host has room.
+
+    With warm_type, hosts holding a warm container of that type win: the
+    container is already reserved, so claiming it adds no load. Hosts with
+    max_sandboxes project sandboxes (0 = no limit) take no more.
+    """
+    hosts = [
+        host for host in hosts
+        if host.available and not (max_sandboxes and len(host.sandboxes) >= max_sandboxes)
+    ]
+    if warm_type:
+        warm = [host for host in hosts if host.pools.get(warm_type)]
+        if warm:
+            return _pick(warm, cpu, memory_mb, spread_above, extra=0)
+    return _pick([host for host in hosts if host.fits(cpu, memory_mb)], cpu, memory_mb, spread_above, extra=1)
+
+
+def _pick(hosts: List[DockerHost], cpu: float, memory_mb: int, spread_above: float, extra: int) -> Optional[DockerHost]:
+    if not hosts:
+        return None
+    load = {host.name: host.utilization(cpu, memory_mb, extra) for host in hosts}
+    packable = [host for host in hosts if load[host.name] <= spread_above]
+    if packable:
+        return max(packable, key=lambda host: (load[host.name], host.name))
+    return min(hosts, key=lambda host: (load[host.name], host.name))
@@ -0,0 +1,164 @@
+"""
+Sandbox logs - bounded ring buffer fed from container output.
+
+Every line gets a monotonically increasing offset. The buffer keeps the
+newest lines within both a line and a byte budget, so memory per sandbox
+is capped no matter how much a dev server prints; readers resume from an
+offset and learn how many lines they missed if it was already dropped.
+
+Container output is read with a blocking Docker stream and handed to the
+event loop line by line. Each followed container gets its own daemon
+thread, not one of the default executor's: those are shared with every
+other Docker call and would all end up blocked on log streams. Cancelling
+the follow closes the stream, which ends the thread's blocking read.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Deque, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_BYTES = 4096
+
+
+@dataclass
+class LogLine:
+    offset: int
+    timestamp: float
+    stream: str  # stdout, stderr, system
+    text: str
+
+    def event(self) -> str:
+        """Server-sent event; id is the offset, so Last-Event-ID resumes after it."""
+        data = json.dumps({"offset": self.offset, "ts": self.timestamp, "stream": self.stream, "text": self.text})
+        return f"id: {self.offset}\ndata: {data}\n\n"
+
+
+class LogBuffer:
+    def __init__(self, max_lines: int = 2000, max_bytes: int = 1024 * 1024):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines: Deque[LogLine] = deque()
+        self.size = 0  # characters of text held
+        self.next_offset = 0
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    @property
+    def first_offset(self) -> int:
+        return self.lines[0].offset if self.lines else self.next_offset
+
+    def append(self, text: str, stream: str = "system"):
+        if len(text) > MAX_LINE_BYTES:
+            text = text[:MAX_LINE_BYTES] + "…"
+        self.lines.append(LogLine(self.next_offset, time.time(), stream, text))
+        self.next_offset += 1
+        self.size += len(text)
+        while len(self.lines) > self.max_lines or self.size > self.max_bytes:
+            self.size -= len(self.lines.popleft().text)
+        self._notify()
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def since(self, offset: int) -> Tuple[List[LogLine], int]:
+        """Lines from offset on, and how many lines before them were already dropped."""
+        first = self.first_offset
+        start = max(offset, first)
+        skipped = start - offset if offset < first else 0
+        return list(islice(self.lines, start - first, None)), skipped
+
+    async def wait(self, offset: int, timeout: float) -> bool:
+        """Wait until a line at offset exists; False on timeout or close."""
+        if offset < self.next_offset:
+            return True
+        if self.closed:
+            return False
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return offset < self.next_offset
+
+
+def split_lines(pending: bytes, chunk: bytes) -> Tuple[List[str], bytes]:
+    """Complete lines of pending + chunk, and the incomplete rest."""
+    data = pending + chunk
+    *lines, rest = data.split(b"\n")
+    if len(rest) > MAX_LINE_BYTES:  # no newline in sight: flush as a line anyway
+        lines.append(rest)
+        rest = b""
+    return [line.rstrip(b"\r").decode(errors="replace") for line in lines], rest
+
+
+def _close(stream: Any):
+    try:
+        stream.close()  # docker's CancellableStream: shuts the socket
+    except Exception as e:
+        logger.debug(f"Closing log stream failed: {e}")
+
+
+async def follow_container(container: Any, buffer: LogBuffer):
+    """Feed buffer from the container's stdout/stderr until the container goes away or the task is cancelled."""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    lock = threading.Lock()
+    state = {"stream": None, "stopped": False}
+
+    def finish():
+        if not done.done():
+            done.set_result(None)
+
+    def pump(chunks: Iterable[Tuple[Optional[bytes], Optional[bytes]]]):
+        pending = {"stdout": b"", "stderr": b""}
+        for stdout, stderr in chunks:
+            for stream, chunk in (("stdout", stdout), ("stderr", stderr)):
+                if chunk:
+                    lines, pending[stream] = split_lines(pending[stream], chunk)
+                    for line in lines:
+                        loop.call_soon_threadsafe(buffer.append, line, stream)
+        for stream, rest in pending.items():
+            if rest:
+                loop.call_soon_threadsafe(buffer.append, rest.decode(errors="replace"), stream)
+
+    def run():
+        try:
+            chunks = container.attach(stdout=True, stderr=True, stream=True, logs=True, demux=True)
+            with lock:
+                state["stream"] = chunks
+                stopped = state["stopped"]
+            if stopped:
+                _close(chunks)
+                return
+            pump(chunks)
+        except Exception as e:
+            if not state["stopped"]:
+                logger.debug(f"Log stream of container {container.id} ended: {e}")
+        finally:
+            try:
+                loop.call_soon_threadsafe(finish)
+            except RuntimeError:
+                pass  # event loop already closed
+
+    threading.Thread(target=run, name=f"sandbox-logs-{container.id[:12]}", daemon=True).start()
+    try:
+        await done
+    except asyncio.CancelledError:
+        with lock:
+            state["stopped"] = True
+            stream = state["stream"]
+        if stream is not None:
+            _close(stream)
+        raise
@@ -1,12 +1,83 @@
 """
 Sandbox Manager - Docker containers for Live Preview.
+
+A pool of pre-started generic containers is kept per ProjectType, so
+creating a sandbox means claiming a warm container, copying the project
+files in and launching the dev server - no image pull or container boot
+on the request path. Pools are refilled in the background.
+
+Containers are spread over one or more Docker hosts (see hosts.py); each
+host leases published ports from its own allocator (see ports.py), and
+with a shared registry also in Redis, so workers never share a port.
+
+Projects with a lockfile get their dependencies from a shared read-only
+volume keyed by the lockfile hash (see deps.py) instead of installing them.
+
+Container CPU, memory, network and PID usage is sampled in the background
+(see telemetry.py) and kept per sandbox and per host.
+
+Stopped sandboxes can be committed to a snapshot image (see snapshots.py);
+creating the sandbox again with unchanged files resumes from it.
+
+A project can reserve a warm container ahead of its first sandbox (right
+after the project is created); create_sandbox then uses it, and unused
+reservations go back to the pool when they expire.
+
+Sandboxes that see no activity (file updates, preview hits) for their
+plan's idle timeout are stopped by a background reaper, and the least
+recently used ones are evicted when the container or memory budget is
+exceeded.
+
+With a shared registry (SANDBOX_SHARED_REGISTRY, see registry.py) every
+API worker sees every sandbox: the worker that created one owns it, the
+others work on its container directly through the registry record.
+
+Docker SDK calls are blocking and run in a thread.
 """
-from dataclasses import dataclass
-from typing import Optional, Dict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import os
+import socket
+import time
 import logging
 
+from ..core.config import settings
+from .deps import DependencyCache
+from .hosts import DockerHost, choose_host
+from .logs import LogBuffer, follow_container
+from .ports import PortAllocator, PortsExhausted
+from .registry import SandboxRegistry
+from .runtimes import RUNTIMES, Runtime
+from .snapshots import SnapshotStore, manifest_hash
+from .telemetry import Telemetry
+from .sync import FileChanges, diff_files, missing_paths, stale_paths, stream_tar
+
 logger = logging.getLogger(__name__)
 
+LABEL = "xbasis.sandbox"  # "warm" or project id
+TYPE_LABEL = "xbasis.type"
+PORT_LABEL = "xbasis.port"  # host port leased from the host's allocator
+WORKER_LABEL = "xbasis.worker"  # worker that started the container
+
+IDLE_AFTER_SECONDS = 60  # no activity for this long -> counted as idle in metrics
+TOUCH_WRITE_SECONDS = 10  # min interval between shared last_active writes
+
+PLAN_IDLE_TIMEOUTS: Dict[str, int] = {
+    "free": 10 * 60,
+    "pro": 30 * 60,
+    "team": 60 * 60,
+    "enterprise": 4 * 60 * 60,
+}
+
+
+class SandboxError(RuntimeError):
+    pass
+
+
+class RestartRequired(SandboxError):
+    """A change the running sandbox can't pick up (its dependency volume is read-only)."""
+
 
 @dataclass
 class Sandbox:
@@ -15,61 +86,1082 @@ class Sandbox:
     container_id: str
     preview_url: str
     status: str
-    port: int
-    logs_buffer: list
+    port: int  # published port on host
+    logs: LogBuffer
+    host: str = "local"
+    project_type: str = "web"
+    created_at: float = field(default_factory=time.time)
+    startup_ms: Optional[float] = None  # request -> preview URL
+    manifest: Dict[str, str] = field(default_factory=dict)  # path -> sha256 of files in container
+    plan: str = "free"
+    last_active: float = field(default_factory=time.time)
+    deps_volume: Optional[str] = None  # shared dependency cache volume mounted read-only
+    resumed: bool = False  # started from a snapshot; startup_ms is the resume latency
+
+
+@dataclass
+class Reservation:
+    project_id: int
+    project_type: str
+    host: DockerHost
+    container: Any
+    expires_at: float
+
+
+def container_port(container) -> int:
+    return int(container.labels[PORT_LABEL])
+
+
+def sandbox_record(sandbox: Sandbox) -> Dict[str, str]:
+    """Registry hash of sandbox (manifest and logs are kept elsewhere)."""
+    return {
+        "id": sandbox.id,
+        "container_id": sandbox.container_id,
+        "preview_url": sandbox.preview_url,
+        "status": sandbox.status,
+        "port": str(sandbox.port),
+        "host": sandbox.host,
+        "project_type": sandbox.project_type,
+        "created_at": repr(sandbox.created_at),
+        "startup_ms": "" if sandbox.startup_ms is None else repr(sandbox.startup_ms),
+        "plan": sandbox.plan,
+        "last_active": repr(sandbox.last_active),
+        "deps_volume": sandbox.deps_volume or "",
+        "resumed": "1" if sandbox.resumed else "",
+    }
+
+
+def sandbox_from_record(project_id: int, record: Dict[str, str], logs: LogBuffer) -> Sandbox:
+    return Sandbox(
+        id=record["id"],
+        project_id=project_id,
+        container_id=record["container_id"],
+        preview_url=record["preview_url"],
+        status=record["status"],
+        port=int(record["port"]),
+        logs=logs,
+        host=record["host"],
+        project_type=record["project_type"],
+        created_at=float(record["created_at"]),
+        startup_ms=float(record["startup_ms"]) if record.get("startup_ms") else None,
+        plan=record["plan"],
+        last_active=float(record["last_active"]),
+        deps_volume=record.get("deps_volume") or None,
+        resumed=record.get("resumed") == "1",
+    )
 
 
 class SandboxManager:
-    def __init__(self, docker_host: str = "unix:///var/run/docker.sock", preview_domain: str = "preview.localhost", base_port: int = 10000):
-        self.docker_host = docker_host
+    def __init__(
+        self,
+        docker_host: str = "unix:///var/run/docker.sock",
+        preview_domain: str = "preview.localhost",
+        hosts: Optional[List[Dict[str, Any]]] = None,
+        port_range: Tuple[int, int] = (10000, 20000),
+        port_lease_seconds: float = 600.0,
+        spread_above: float = 0.7,
+        warm_pool: Optional[Dict[str, int]] = None,
+        memory_limit_mb: int = 512,
+        cpu_limit: float = 1.0,
+        start_timeout: float = 30.0,
+        idle_timeouts: Optional[Dict[str, int]] = None,
+        max_containers: int = 0,
+        memory_budget_mb: int = 0,
+        log_lines: int = 2000,
+        log_bytes: int = 1024 * 1024,
+        registry: Optional[SandboxRegistry] = None,
+        deps: Optional[DependencyCache] = None,
+        snapshots: Optional[SnapshotStore] = None,
+        telemetry: Optional[Telemetry] = None,
+        reserve_seconds: float = 300.0,
+    ):
         self.preview_domain = preview_domain
-        self.base_port = base_port
-        self.sandboxes: Dict[int, Sandbox] = {}
-        self._docker_client = None
+        self.spread_above = spread_above
+        self.warm_pool = warm_pool or {}
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit = cpu_limit
+        self.start_timeout = start_timeout
+        self.idle_timeouts = {**PLAN_IDLE_TIMEOUTS, **(idle_timeouts or {})}
+        self.max_containers = max_containers  # project sandboxes per host, 0 = unlimited
+        self.memory_budget_mb = memory_budget_mb  # 0 = unlimited
+        self.log_lines = log_lines
+        self.log_bytes = log_bytes
+        self.reserve_seconds = reserve_seconds
+        self.reaped = 0
+        self.evicted = 0
+        self.reservations: Dict[int, Reservation] = {}  # project id -> pre-warmed container
+        self.reservations_used = 0
+        self.reservations_expired = 0
+        self.reservations_cancelled = 0
+        self.registry = registry  # shared between API workers; None = this process only
+        self.deps = deps  # dependency cache volumes; None = install in every sandbox
+        self.snapshots = snapshots  # None = stopped sandboxes start from scratch
+        self.telemetry = telemetry  # None = no usage sampling
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.sandboxes: Dict[int, Sandbox] = {}  # owned by this worker
+        self.remote: Dict[int, Sandbox] = {}  # owned by other workers, from the registry
+        self._touched: Dict[int, float] = {}
+        self.hosts: Dict[str, DockerHost] = {}
+        for spec in hosts or [{"name": "local", "url": docker_host, "address": "127.0.0.1"}]:
+            self.hosts[spec["name"]] = DockerHost(
+                name=spec["name"],
+                url=spec.get("url", docker_host),
+                address=spec.get("address", "127.0.0.1"),
+                cpus=float(spec.get("cpus", 0)),
+                memory_mb=int(spec.get("memory_mb", 0)),
+                ports=PortAllocator(*port_range, lease_seconds=port_lease_seconds),
+            )
+        self._refills: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._log_tasks: Dict[int, asyncio.Task] = {}
+    
+    def _client(self, host: DockerHost):
+        client = host.client
+        if client is None:
+            raise SandboxError(f"Docker not available on host {host.name}")
+        return client
+    
+    async def _run(self, fn, *args, **kwargs):
+        """Blocking Docker SDK call in a thread, bounded by start_timeout."""
+        return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), self.start_timeout)
     
-    @property
-    def docker_client(self):
-        if self._docker_client is None:
+    def _runtime(self, project_type: str) -> Runtime:
+        runtime = RUNTIMES.get(project_type)
+        if runtime is None:
+            raise SandboxError(f"Unknown project type: {project_type}")
+        return runtime
+    
+    async def _probe(self, host: DockerHost):
+        """Fill in host capacity from docker info when not configured."""
+        try:
+            info = await self._run(self._client(host).info)
+        except Exception as e:
+            logger.warning(f"Docker host {host.name} unavailable: {e}")
+            host.available = False
+            return
+        host.cpus = host.cpus or float(info["NCPU"])
+        host.memory_mb = host.memory_mb or int(info["MemTotal"]) // (1024 * 1024)
+        host.available = True
+    
+    # ── Warm pools ───────────────────────────────
+    
+    async def _start_container(
+        self,
+        host: DockerHost,
+        project_type: str,
+        deps_volume: Optional[str] = None,
+        image: Optional[str] = None,
+    ):
+        runtime = self._runtime(project_type)
+        client = self._client(host)
+        options: Dict[str, Any] = {}
+        if deps_volume:
+            options["volumes"] = {deps_volume: {"bind": runtime.deps_mount, "mode": "ro"}}
+            options["tmpfs"] = {path: "" for path in runtime.deps_writable}
+            options["environment"] = runtime.deps_env
+        
+        for attempt in range(3):
+            port = await self._lease_port(host, project_type)
             try:
-                import docker
-                self._docker_client = docker.DockerClient(base_url=self.docker_host)
+                return await self._run(
+                    client.containers.run,
+                    image or runtime.image,
+                    runtime.warm_command,
+                    detach=True,
+                    working_dir=runtime.workdir,
+                    labels={LABEL: "warm", TYPE_LABEL: project_type, PORT_LABEL: str(port), WORKER_LABEL: self.worker_id},
+                    ports={f"{runtime.port}/tcp": port},
+                    mem_limit=f"{self.memory_limit_mb}m",
+                    nano_cpus=int(self.cpu_limit * 1_000_000_000),
+                    **options,
+                )
             except Exception as e:
-                logger.warning(f"Docker not available: {e}")
-        return self._docker_client
+                if "port is already allocated" in str(e) and attempt < 2:
+                    # Taken outside our allocator; keep it leased until the lease runs out
+                    host.ports.reserve(port, "external")
+                    continue
+                await self._free_port(host, port)
+                raise
+    
+    async def _lease_port(self, host: DockerHost, owner: str) -> int:
+        """Free port on host, also leased in the shared registry when there is one."""
+        while True:
+            try:
+                port = host.ports.allocate(owner)
+            except PortsExhausted as e:
+                raise SandboxError(f"{e} on host {host.name}")
+            if not self.registry or not await self.registry.lease_ports(host.name, [port], self.worker_id):
+                return port
+            # Another worker has it; keep it out of our allocator until its lease would run out
+            host.ports.reserve(port, "remote")
+    
+    async def _free_port(self, host: DockerHost, port: int):
+        host.ports.release(port)
+        if self.registry:
+            try:
+                await self.registry.release_port(host.name, port, self.worker_id)
+            except Exception as e:
+                logger.warning(f"Failed to release port {port} on {host.name}: {e}")  # the lease runs out
+    
+    async def _refill(self, host: DockerHost, project_type: str):
+        target = self.warm_pool.get(project_type, 0)
+        pool = host.pools[project_type]
+        while len(pool) < target and host.fits(self.cpu_limit, self.memory_limit_mb):
+            try:
+                pool.append(await self._start_container(host, project_type))
+            except Exception as e:
+                logger.warning(f"Failed to start warm {project_type} container on {host.name}: {e}")
+                return
+    
+    def refill(self, host: DockerHost, project_type: str):
+        """Top up host's pool in the background (one refill task per host and type)."""
+        key = (host.name, project_type)
+        task = self._refills.get(key)
+        if self.warm_pool.get(project_type) and (task is None or task.done()):
+            self._refills[key] = asyncio.create_task(self._refill(host, project_type))
+    
+    async def _sweep(self):
+        """
+        Remove sandbox containers a previous process left behind.
+        
+        Containers the registry knows stay: their owner keeps them, or they
+        are adopted once its lease runs out. So do those of workers that are
+        still alive (warm pools, sandboxes being created). Without a shared
+        registry this process is the only user of its hosts.
+        """
+        known: Dict[str, int] = {}
+        if self.registry:
+            await self.registry.heartbeat(self.worker_id)
+            known = await self.registry.containers()
+        for host in self.hosts.values():
+            if not host.available:
+                continue
+            try:
+                containers = await self._run(self._client(host).containers.list, all=True, filters={"label": LABEL})
+            except Exception as e:
+                logger.warning(f"Failed to list sandbox containers on {host.name}: {e}")
+                continue
+            alive = set()
+            if self.registry:
+                alive = await self.registry.live_workers({c.labels.get(WORKER_LABEL, "") for c in containers} - {""})
+            for container in containers:
+                if container.id in known or container.labels.get(WORKER_LABEL) in alive:
+                    continue
+                logger.info(f"Removing leftover sandbox container {container.id} on {host.name}")
+                try:
+                    await self._run(container.remove, force=True)
+                except Exception as e:
+                    logger.warning(f"Failed to remove container {container.id} on {host.name}: {e}")
+    
+    async def start(self):
+        """Probe hosts, clean up after a previous process and fill all warm pools (call on app startup)."""
+        for host in self.hosts.values():
+            if not (host.cpus and host.memory_mb):
+                await self._probe(host)
+        await self._sweep()
+        if self.registry:
+            await self._sync_registry()  # adopt what a previous process owned
+        for host in self.hosts.values():
+            if self.deps and host.available:
+                try:
+                    await self.deps.load(host.name, self._client(host))
+                except Exception as e:
+                    logger.warning(f"Failed to list dependency volumes on {host.name}: {e}")
+            if self.snapshots and host.available:
+                try:
+                    await self.snapshots.load(host.name, self._client(host))
+                except Exception as e:
+                    logger.warning(f"Failed to list sandbox snapshots on {host.name}: {e}")
+            for project_type in self.warm_pool:
+                if project_type in RUNTIMES and host.available:
+                    self.refill(host, project_type)
+    
+    async def shutdown(self):
+        """Stop refills and remove warm containers. Project sandboxes keep running."""
+        for task in self._refills.values():
+            task.cancel()
+        for host in self.hosts.values():
+            for pool in host.pools.values():
+                while pool:
+                    await self._remove(host, pool.popleft())
+        for reservation in list(self.reservations.values()):
+            host = reservation.host
+            host.reserved.discard(reservation.project_id)
+            await self._remove(host, reservation.container)
+        self.reservations.clear()
+        for task in self._log_tasks.values():
+            task.cancel()
+        if self.registry:
+            await self.registry.close()
+    
+    async def _claim(self, project_type: str) -> Tuple[DockerHost, Any]:
+        """Host and container for a new sandbox: a warm one if any host has it, else cold-started."""
+        while True:
+            host = choose_host(
+                self.hosts.values(), self.cpu_limit, self.memory_limit_mb, self.spread_above,
+                warm_type=project_type, max_sandboxes=self.max_containers,
+            )
+            if host is None:
+                raise SandboxError("No sandbox host has capacity")
+            pool = host.pools[project_type]
+            if not pool:
+                break
+            container = pool.popleft()
+            self.refill(host, project_type)
+            try:
+                await self._run(container.reload)
+            except Exception:
+                await self._free_port(host, container_port(container))
+                continue  # removed behind our back
+            if container.status == "running":
+                return host, container
+            await self._remove(host, container)
+        
+        logger.info(f"No warm {project_type} container, cold-starting one on {host.name}")
+        container = await self._start_container(host, project_type)
+        self.refill(host, project_type)
+        return host, container
+    
+    async def _claim_with_deps(
+        self,
+        project_type: str,
+        runtime: Runtime,
+        key: str,
+        files: Dict[str, str],
+    ) -> Optional[Tuple[DockerHost, Any, str]]:
+        """
+        Fresh container with the dependency volume for key mounted (volumes
+        can't be added to a running warm container). None if the volume
+        could not be built: the caller falls back to installing in place.
+        """
+        args = (self.cpu_limit, self.memory_limit_mb, self.spread_above)
+        cached = [host for host in self.hosts.values() if self.deps.has(host.name, project_type, key)]
+        host = (
+            choose_host(cached, *args, max_sandboxes=self.max_containers)
+            or choose_host(self.hosts.values(), *args, max_sandboxes=self.max_containers)
+        )
+        if host is None:
+            raise SandboxError("No sandbox host has capacity")
+        try:
+            volume = await self.deps.acquire(host.name, self._client(host), project_type, runtime, key, files)
+        except SandboxError:
+            raise
+        except Exception as e:
+            logger.warning(f"Dependency cache miss for {project_type} could not be built: {e}")
+            return None
+        try:
+            container = await self._start_container(host, project_type, deps_volume=volume.name)
+        except BaseException:
+            self.deps.release(host.name, volume.name)
+            raise
+        return host, container, volume.name
+    
+    async def _resume(
+        self,
+        project_id: int,
+        project_type: str,
+        runtime: Runtime,
+        key: Optional[str],
+        changes: FileChanges,
+    ) -> Optional[Tuple[DockerHost, Any, Optional[str]]]:
+        """
+        Container started from the project's snapshot if its files match,
+        with the dependency volume mounted again if it had one. None if
+        there is no usable snapshot: the caller starts from scratch.
+        """
+        snapshot = self.snapshots.find(project_id, project_type, manifest_hash(changes.hashes))
+        if snapshot is None:
+            return None
+        host = self.hosts.get(snapshot.host)
+        if host is None or not host.fits(self.cpu_limit, self.memory_limit_mb):
+            return None
+        if snapshot.deps and not key:
+            return None
+        volume = None
+        try:
+            if snapshot.deps:
+                volume = await self.deps.acquire(
+                    host.name, self._client(host), project_type, runtime, key, changes.files,
+                )
+            container = await self._start_container(
+                host, project_type, deps_volume=volume.name if volume else None, image=snapshot.image,
+            )
+        except Exception as e:
+            logger.warning(f"Cannot resume project {project_id} from snapshot {snapshot.image}: {e}")
+            if volume:
+                self.deps.release(host.name, volume.name)
+            self.snapshots.drop(project_id)
+            return None
+        return host, container, volume.name if volume else None
+    
+    async def _snapshot(self, sandbox: Sandbox, container, manifest: Dict[str, str]):
+        """Commit a stopping sandbox's container and remove the snapshots it displaces."""
+        host = self.hosts[sandbox.host]
+        try:
+            displaced = await self.snapshots.take(
+                host.name,
+                self._client(host),
+                container,
+                sandbox.project_id,
+                sandbox.project_type,
+                manifest,
+                deps=bool(sandbox.deps_volume),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to snapshot sandbox of project {sandbox.project_id}: {e}")
+            return
+        for snapshot in displaced:
+            other = self.hosts.get(snapshot.host)
+            if other and other.client:
+                await self.snapshots.remove(other.client, snapshot)
+    
+    # ── Reservations ─────────────────────────────
+    
+    async def reserve(self, project_id: int, project_type: str) -> bool:
+        """
+        Hold a warm container for a project's first sandbox (speculative:
+        never evicts anything for it). False if the project has a sandbox or
+        reservation already, or there is no room.
+        """
+        self._runtime(project_type)
+        if project_id in self.sandboxes or project_id in self.reservations or self._over_budget(extra=1):
+            return False
+        async with self._lock(project_id):
+            if project_id in self.sandboxes or project_id in self.reservations:
+                return False
+            host, container = await self._claim(project_type)
+            host.reserved.add(project_id)
+            self.reservations[project_id] = Reservation(
+                project_id, project_type, host, container, time.time() + self.reserve_seconds,
+            )
+        logger.info(f"Reserved a {project_type} container on {host.name} for project {project_id}")
+        return True
+    
+    async def _take_reservation(self, project_id: int, project_type: str) -> Optional[Reservation]:
+        """The project's reservation if its container is still usable."""
+        reservation = self.reservations.pop(project_id, None)
+        if reservation is None:
+            return None
+        reservation.host.reserved.discard(project_id)
+        if reservation.project_type != project_type:
+            await self._unreserve(reservation)
+            return None
+        try:
+            await self._run(reservation.container.reload)
+        except Exception:
+            await self._free_port(reservation.host, container_port(reservation.container))
+            return None
+        if reservation.container.status != "running":
+            await self._remove(reservation.host, reservation.container)
+            return None
+        return reservation
     
-    async def create_sandbox(self, project_id: int, project_type: str, files: Dict[str, str], db_url: Optional[str] = None) -> Sandbox:
-        if project_id in self.sandboxes:
-            existing = self.sandboxes[project_id]
-            if existing.status == "running":
+    async def _unreserve(self, reservation: Reservation):
+        """Give a reserved container back to its pool if that is short, else remove it."""
+        host = reservation.host
+        host.reserved.discard(reservation.project_id)
+        pool = host.pools[reservation.project_type]
+        if len(pool) < self.warm_pool.get(reservation.project_type, 0):
+            pool.append(reservation.container)
+        else:
+            await self._remove(host, reservation.container)
+    
+    async def cancel_reservation(self, project_id: int):
+        """Drop a project's reservation (the project was deleted, or started another way)."""
+        reservation = self.reservations.pop(project_id, None)
+        if reservation:
+            self.reservations_cancelled += 1
+            await self._unreserve(reservation)
+    
+    async def _expire_reservations(self):
+        now = time.time()
+        for reservation in [r for r in self.reservations.values() if r.expires_at <= now]:
+            del self.reservations[reservation.project_id]
+            self.reservations_expired += 1
+            logger.info(f"Reservation for project {reservation.project_id} expired unused")
+            await self._unreserve(reservation)
+    
+    # ── Sandboxes ────────────────────────────────
+    
+    def _lock(self, project_id: int) -> asyncio.Lock:
+        return self._locks.setdefault(project_id, asyncio.Lock())
+    
+    async def create_sandbox(
+        self,
+        project_id: int,
+        project_type: str,
+        files: Dict[str, str],
+        db_url: Optional[str] = None,
+        plan: str = "free",
+    ) -> Sandbox:
+        existing = await self.get_sandbox(project_id)
+        if existing and existing.status == "running":
+            await self.touch(project_id)
+            return existing
+        await self._make_room(project_id)  # before taking our lock: eviction takes others'
+        
+        async with self._lock(project_id):
+            existing = self.sandboxes.get(project_id)
+            if existing and existing.status == "running":
                 return existing
+            keeper = None
+            if self.registry:
+                existing = await self._reserve(project_id)
+                if existing:
+                    return existing
+                keeper = asyncio.create_task(self._keep_creating(project_id))
+            
+            try:
+                sandbox = await self._launch(project_id, project_type, files, db_url, plan)
+            except BaseException:
+                if self.registry:
+                    await self.registry.delete(project_id)  # drop our "creating" placeholder
+                raise
+            finally:
+                if keeper:
+                    keeper.cancel()
+            if self.registry:
+                await self.registry.put(project_id, sandbox_record(sandbox), sandbox.manifest, self.worker_id)
+            return sandbox
+    
+    async def _reserve(self, project_id: int) -> Optional[Sandbox]:
+        """Sandbox another worker created, or None once we hold the creation lease."""
+        # The creating worker renews its placeholder for as long as a dependency build may take
+        wait = 2 * self.start_timeout + (self.deps.build_timeout if self.deps else 0)
+        deadline = time.monotonic() + wait
+        while True:
+            record = await self.registry.create_or_get(project_id)
+            if record is None:
+                return None
+            sandbox = self._remote(project_id, record)
+            if sandbox:
+                return sandbox
+            if time.monotonic() > deadline:
+                raise SandboxError(f"Sandbox of project {project_id} is being created by another worker")
+            await asyncio.sleep(0.2)
+    
+    async def _keep_creating(self, project_id: int):
+        """Renew our "creating" placeholder until cancelled, so it outlives a slow build."""
+        while True:
+            await asyncio.sleep(self.registry.create_lease_seconds / 3)
+            try:
+                if not await self.registry.renew_creating(project_id):
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to renew creation lease of project {project_id}: {e}")
+    
+    async def _launch(
+        self,
+        project_id: int,
+        project_type: str,
+        files: Dict[str, str],
+        db_url: Optional[str],
+        plan: str,
+    ) -> Sandbox:
+        started = time.perf_counter()
+        runtime = self._runtime(project_type)
+        changes = diff_files({}, files)  # validates paths before a container is claimed
+        key = runtime.deps_key(changes.files) if self.deps else None
+        claimed = None
+        if self.snapshots:
+            claimed = await self._resume(project_id, project_type, runtime, key, changes)
+        resumed = claimed is not None
+        if not claimed and key:
+            claimed = await self._claim_with_deps(project_type, runtime, key, changes.files)
+        if claimed:
+            host, container, deps_volume = claimed
+            command = f"exec {runtime.run}" if runtime.run else None  # dependencies are in place
+            await self.cancel_reservation(project_id)  # not needed after all
+        else:
+            reservation = await self._take_reservation(project_id, project_type)
+            if reservation:
+                host, container = reservation.host, reservation.container
+                self.reservations_used += 1
+            else:
+                host, container = await self._claim(project_type)
+            deps_volume, command = None, runtime.start
         
-        port = self.base_port + project_id
-        preview_url = f"https://p{project_id}.{self.preview_domain}"
+        try:
+            if changes.files and not resumed:  # a snapshot has them already
+                await self._put_files(container, runtime, changes.files)
+            if command:
+                environment = {"PORT": str(runtime.port)}
+                if db_url:
+                    environment["DATABASE_URL"] = db_url
+                # Output goes to PID 1's stdout/stderr, i.e. the container log
+                await self._run(
+                    container.exec_run,
+                    ["sh", "-c", f"({command}) >/proc/1/fd/1 2>/proc/1/fd/2"],
+                    environment=environment,
+                    workdir=runtime.workdir,
+                    detach=True,
+                )
+        except BaseException:
+            await self._remove(host, container)
+            if deps_volume:
+                self.deps.release(host.name, deps_volume)
+            raise
         
+        port = container_port(container)
+        host.sandboxes.add(project_id)
+        logs = LogBuffer(self.log_lines, self.log_bytes)
+        
+        startup_ms = round((time.perf_counter() - started) * 1000, 1)
         sandbox = Sandbox(
             id=f"sandbox-{project_id}",
             project_id=project_id,
-            container_id="mock",
-            preview_url=preview_url,
+            container_id=container.id,
+            preview_url=f"https://p{project_id}.{self.preview_domain}",
             status="running",
             port=port,
-            logs_buffer=["Sandbox running"],
+            logs=logs,
+            project_type=project_type,
+            startup_ms=startup_ms,
+            manifest=changes.hashes,
+            plan=plan,
+            host=host.name,
+            deps_volume=deps_volume,
+            resumed=resumed,
         )
+        if resumed:
+            self.snapshots.resumed(startup_ms)
+            logs.append(f"Sandbox resumed from snapshot on {host.name} ({startup_ms} ms)")
+        else:
+            logs.append(f"Sandbox running on {host.name} ({startup_ms} ms)")
         self.sandboxes[project_id] = sandbox
+        self._log_tasks[project_id] = asyncio.create_task(follow_container(container, logs))
+        logger.info(f"Sandbox for project {project_id} ready in {startup_ms} ms on {host.name}:{port}")
         return sandbox
     
     async def get_sandbox(self, project_id: int) -> Optional[Sandbox]:
-        return self.sandboxes.get(project_id)
-    
-    async def update_files(self, project_id: int, files: Dict[str, str]):
         sandbox = self.sandboxes.get(project_id)
+        if sandbox or not self.registry:
+            return sandbox
+        record = await self.registry.get(project_id)
+        if not record:
+            self._forget_remote(project_id)
+            return None
+        return self._remote(project_id, record)
+    
+    def _remote(self, project_id: int, record: Dict[str, str]) -> Optional[Sandbox]:
+        """Sandbox owned by another worker, from its registry record (None while creating)."""
+        if record.get("status") != "running":
+            return None
+        sandbox = self.remote.get(project_id)
+        if sandbox is None or sandbox.container_id != record["container_id"]:
+            self._forget_remote(project_id)
+            sandbox = sandbox_from_record(project_id, record, LogBuffer(self.log_lines, self.log_bytes))
+            self.remote[project_id] = sandbox
+        else:
+            sandbox.last_active = max(sandbox.last_active, float(record["last_active"]))
+        return sandbox
+    
+    def _forget_remote(self, project_id: int):
+        sandbox = self.remote.pop(project_id, None)
+        if sandbox:
+            self._stop_logs(sandbox)
+    
+    async def logs(self, project_id: int) -> Optional[LogBuffer]:
+        """Log buffer of sandbox; for one owned by another worker, follow its container here."""
+        sandbox = await self.get_sandbox(project_id)
+        if sandbox is None:
+            return None
+        if project_id not in self._log_tasks:
+            container = await self._container(sandbox)
+            self._log_tasks[project_id] = asyncio.create_task(follow_container(container, sandbox.logs))
+        return sandbox.logs
+    
+    def _stop_logs(self, sandbox: Sandbox):
+        task = self._log_tasks.pop(sandbox.project_id, None)
+        if task:
+            task.cancel()
+        sandbox.logs.close()
+    
+    async def _release(self, sandbox: Sandbox, port: bool = False):
+        """Drop local state of a sandbox this worker no longer owns."""
+        host = self.hosts[sandbox.host]
+        host.sandboxes.discard(sandbox.project_id)
+        if port:
+            await self._free_port(host, sandbox.port)
+        if sandbox.deps_volume and self.deps:
+            self.deps.release(host.name, sandbox.deps_volume)
+        self._stop_logs(sandbox)
+    
+    async def _container(self, sandbox: Sandbox):
+        host = self.hosts.get(sandbox.host)
+        if host is None:
+            raise SandboxError(f"Unknown sandbox host {sandbox.host}")
+        return await self._run(self._client(host).containers.get, sandbox.container_id)
+    
+    async def _remove(self, host: DockerHost, container):
+        """Remove container and return its port; on failure the port lease just runs out."""
+        try:
+            await self._run(container.remove, force=True)
+        except Exception as e:
+            logger.warning(f"Failed to remove container {container.id} on {host.name}: {e}")
+            return
+        await self._free_port(host, container_port(container))
+    
+    async def _put_files(self, container, runtime: Runtime, files: Dict[str, str]) -> int:
+        """Stream files into the runtime workdir as one tar; returns archive bytes sent."""
+        sent = 0
+        
+        def chunks() -> Iterator[bytes]:
+            nonlocal sent
+            for chunk in stream_tar(files):
+                sent += len(chunk)
+                yield chunk
+        
+        if not await self._run(container.put_archive, runtime.workdir, chunks()):
+            raise SandboxError(f"Failed to copy files into container {container.short_id}")
+        return sent
+    
+    async def _manifest(self, sandbox: Sandbox) -> Dict[str, str]:
+        if self.registry:  # any worker may have written files since
+            sandbox.manifest = await self.registry.manifest(sandbox.project_id)
+        return sandbox.manifest
+    
+    async def update_files(self, project_id: int, files: Dict[str, str], deleted: Iterable[str] = ()) -> dict:
+        """
+        Sync changed files into the sandbox.
+        
+        files may be the whole project or just the changed paths: content
+        matching the manifest is skipped either way. Changing the lockfile of
+        a sandbox that runs on a dependency volume raises RestartRequired and
+        writes nothing: the volume is keyed by the old lockfile.
+        """
+        async with self._lock(project_id):
+            sandbox = await self.get_sandbox(project_id)
+            if not sandbox:
+                raise ValueError(f"Sandbox {project_id} not found")
+            
+            await self.touch(project_id)
+            runtime = self._runtime(sandbox.project_type)
+            changes = diff_files(await self._manifest(sandbox), files, deleted)
+            if sandbox.deps_volume:
+                locked = [
+                    path for path in (runtime.lockfile, *runtime.lock_inputs)
+                    if path in changes.files or path in changes.deleted
+                ]
+                if locked:
+                    raise RestartRequired(
+                        f"Dependency files changed ({', '.join(locked)}); restart the sandbox to install them"
+                    )
+            sent = 0
+            if changes.files or changes.deleted:
+                container = await self._container(sandbox)
+                if changes.files:
+                    sent = await self._put_files(container, runtime, changes.files)
+                    sandbox.manifest.update(changes.hashes)
+                if changes.deleted:
+                    await self._run(container.exec_run, ["rm", "-f", "--", *changes.deleted], workdir=runtime.workdir)
+                    for path in changes.deleted:
+                        sandbox.manifest.pop(path, None)
+                if self.registry:
+                    await self.registry.update_manifest(project_id, changes.hashes, changes.deleted)
+            
+            sandbox.logs.append(
+                f"Updated {len(changes.files)} files, deleted {len(changes.deleted)} ({sent} bytes)"
+            )
+            return {
+                "written": len(changes.files),
+                "unchanged": changes.unchanged,
+                "deleted": len(changes.deleted),
+                "bytes_sent": sent,
+            }
+    
+    async def missing_files(self, project_id: int, hashes: Dict[str, str]) -> dict:
+        """Which of the client's files must be uploaded, and which the client no longer has."""
+        sandbox = await self.get_sandbox(project_id)
         if not sandbox:
             raise ValueError(f"Sandbox {project_id} not found")
-        sandbox.logs_buffer.append(f"Updated {len(files)} files")
+        manifest = await self._manifest(sandbox)
+        return {
+            "missing": missing_paths(manifest, hashes),
+            "stale": stale_paths(manifest, hashes),
+        }
+    
+    async def destroy_sandbox(self, project_id: int, snapshot: bool = False):
+        """Stop a sandbox; with snapshot (and a snapshot store) commit it first for a later resume."""
+        async with self._lock(project_id):
+            sandbox = self.sandboxes.pop(project_id, None)
+            owned = sandbox is not None
+            if not owned and self.registry:
+                sandbox = await self.get_sandbox(project_id)
+                self._forget_remote(project_id)
+            snapshot = snapshot and bool(self.snapshots) and sandbox is not None
+            manifest = await self._manifest(sandbox) if snapshot else None  # before the record goes
+            if self.registry:
+                await self.registry.delete(project_id)
+            if sandbox is None:
+                return
+            
+            if owned:
+                await self._release(sandbox)
+            try:
+                container = await self._container(sandbox)
+            except Exception as e:
+                logger.debug(f"Container of sandbox {sandbox.id} already gone: {e}")
+                if owned:
+                    await self._free_port(self.hosts[sandbox.host], sandbox.port)
+                return
+            if snapshot:
+                await self._snapshot(sandbox, container, manifest)
+            if owned:
+                await self._remove(self.hosts[sandbox.host], container)
+            else:
+                # The owner releases the port once it sees the record gone
+                try:
+                    await self._run(container.remove, force=True)
+                except Exception as e:
+                    logger.warning(f"Failed to remove container {container.id}: {e}")
+    
+    # ── Shared registry ──────────────────────────
+    
+    async def _sync_registry(self):
+        """Pick up activity seen by other workers, renew owner leases, adopt orphans."""
+        await self.registry.heartbeat(self.worker_id)
+        shared = await self.registry.last_active(list(self.sandboxes))
+        for project_id, last_active in shared.items():
+            sandbox = self.sandboxes[project_id]
+            if last_active is None:  # destroyed through another worker
+                del self.sandboxes[project_id]
+                await self._release(sandbox, port=True)
+            else:
+                sandbox.last_active = max(sandbox.last_active, last_active)
+        
+        for project_id in await self.registry.renew(list(self.sandboxes), self.worker_id):
+            # Lease ran out and another worker adopted it; it reserved the port on its side
+            logger.warning(f"Lost ownership of sandbox of project {project_id}")
+            await self._release(self.sandboxes.pop(project_id), port=True)
+        
+        for project_id in await self.registry.orphans():
+            if project_id in self.sandboxes:
+                continue
+            record = await self.registry.adopt(project_id, self.worker_id)
+            if record:
+                await self._adopt(project_id, record)
+    
+    async def _adopt(self, project_id: int, record: Dict[str, str]):
+        host = self.hosts.get(record.get("host", ""))
+        if host is None:
+            logger.warning(f"Cannot adopt sandbox of project {project_id}: unknown host {record.get('host')}")
+            return
+        self._forget_remote(project_id)
+        sandbox = sandbox_from_record(project_id, record, LogBuffer(self.log_lines, self.log_bytes))
+        sandbox.manifest = await self.registry.manifest(project_id)
+        host.ports.reserve(sandbox.port, f"project:{project_id}")
+        await self.registry.take_port(host.name, sandbox.port, self.worker_id)
+        host.sandboxes.add(project_id)
+        self.sandboxes[project_id] = sandbox
+        logger.info(f"Adopted sandbox of project {project_id} on {host.name}")
+        try:
+            container = await self._container(sandbox)
+        except Exception as e:
+            logger.warning(f"Adopted sandbox of project {project_id} has no container: {e}")
+            return
+        self._log_tasks[project_id] = asyncio.create_task(follow_container(container, sandbox.logs))
+    
+    # ── Idle reaping & eviction ──────────────────
+    
+    async def touch(self, project_id: int):
+        """Record activity (preview hit, file update, API access)."""
+        sandbox = self.sandboxes.get(project_id) or self.remote.get(project_id)
+        if sandbox is None:
+            return
+        sandbox.last_active = now = time.time()
+        # Shared with the owner's reaper, at most once per TOUCH_WRITE_SECONDS
+        if self.registry and now - self._touched.get(project_id, 0) > TOUCH_WRITE_SECONDS:
+            self._touched[project_id] = now
+            await self.registry.touch(project_id, now)
+    
+    def idle_timeout(self, sandbox: Sandbox) -> int:
+        return self.idle_timeouts.get(sandbox.plan, self.idle_timeouts["free"])
+    
+    def _reserved_mb(self, extra: int = 0) -> int:
+        """Memory reserved by project sandboxes and warm containers on all hosts."""
+        containers = sum(host.containers for host in self.hosts.values())
+        return (containers + extra) * self.memory_limit_mb
+    
+    def _crowded(self, extra: int = 0) -> List[DockerHost]:
+        """
+        Hosts past max_containers project sandboxes. With extra new ones
+        only when every host is: otherwise they are placed where there is room.
+        """
+        if not self.max_containers:
+            return []
+        hosts = [host for host in self.hosts.values() if host.available]
+        crowded = [host for host in hosts if len(host.sandboxes) + extra > self.max_containers]
+        if extra and len(crowded) < len(hosts):
+            return []
+        return crowded
+    
+    def _over_budget(self, extra: int = 0) -> bool:
+        if self._crowded(extra):
+            return True
+        return bool(self.memory_budget_mb) and self._reserved_mb(extra) > self.memory_budget_mb
+    
+    async def _evict_lru(self, extra: int = 0, keep: Optional[int] = None):
+        """Destroy least recently active sandboxes (on crowded hosts if any) until within budget."""
+        while self._over_budget(extra):
+            crowded = {host.name for host in self._crowded(extra)}
+            candidates = [
+                s for s in self.sandboxes.values()
+                if s.project_id != keep and (not crowded or s.host in crowded)
+            ]
+            if not candidates:
+                return
+            victim = min(candidates, key=lambda s: s.last_active)
+            logger.info(f"Evicting sandbox of project {victim.project_id} (over budget)")
+            await self.destroy_sandbox(victim.project_id, snapshot=True)
+            self.evicted += 1
+    
+    async def _make_room(self, project_id: int):
+        await self._evict_lru(extra=1, keep=project_id)
+    
+    async def reap(self) -> int:
+        """Stop sandboxes idle past their plan's timeout, then enforce budgets."""
+        if self.registry:
+            await self._sync_registry()
+        now = time.time()
+        idle = [s for s in self.sandboxes.values() if now - s.last_active > self.idle_timeout(s)]
+        for sandbox in idle:
+            logger.info(f"Stopping idle sandbox of project {sandbox.project_id}")
+            await self.destroy_sandbox(sandbox.project_id, snapshot=True)
+        self.reaped += len(idle)
+        await self._evict_lru()
+        await self._expire_reservations()
+        await self._renew_ports()
+        return len(idle)
+    
+    async def _renew_ports(self):
+        """Renew leases of ports in use; leaked ones (e.g. failed removals) expire."""
+        in_use: Dict[str, List[int]] = {name: [] for name in self.hosts}
+        for sandbox in self.sandboxes.values():
+            in_use[sandbox.host].append(sandbox.port)
+        for host in self.hosts.values():
+            for pool in host.pools.values():
+                in_use[host.name].extend(container_port(container) for container in pool)
+        for reservation in self.reservations.values():
+            in_use[reservation.host.name].append(container_port(reservation.container))
+        for name, ports in in_use.items():
+            host = self.hosts[name]
+            for port in ports:
+                host.ports.renew(port)
+            host.ports.expire()
+            if self.registry and ports:
+                for port in await self.registry.lease_ports(name, ports, self.worker_id):
+                    logger.error(f"Port {port} on {name} is leased by another worker")
+    
+    async def run_reaper(self, interval: float = 30.0):
+        """Background loop: reap every interval until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.warning(f"Sandbox reaper failed: {e}")
+    
+    # ── Telemetry ────────────────────────────────
+    
+    async def sample(self):
+        """One telemetry pass: all sandboxes and warm containers, hosts in parallel."""
+        passes, sampled = [], []
+        for host in self.hosts.values():
+            if not host.available or host.client is None:
+                continue
+            container_ids = [
+                sandbox.container_id for sandbox in self.sandboxes.values() if sandbox.host == host.name
+            ] + [container.id for pool in host.pools.values() for container in pool]
+            passes.append(self.telemetry.sample(host.name, host.client, container_ids))
+            sampled.extend(container_ids)
+        await asyncio.gather(*passes)
+        self.telemetry.forget(sampled)
+    
+    async def run_sampler(self, interval: float = 10.0):
+        """Background loop: sample usage every interval until cancelled."""
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.warning(f"Sandbox telemetry failed: {e}")
+            await asyncio.sleep(interval)
+    
+    async def usage(self, project_id: int, since: float = 0.0) -> Optional[dict]:
+        """Usage samples of a sandbox (empty if another worker owns it), None if there is none."""
+        sandbox = await self.get_sandbox(project_id)
+        if sandbox is None:
+            return None
+        latest = self.telemetry.latest(sandbox.container_id) if self.telemetry else None
+        history = self.telemetry.history(sandbox.container_id, since) if self.telemetry else []
+        return {
+            "project_id": project_id,
+            "host": sandbox.host,
+            "cpu_limit_percent": self.cpu_limit * 100,
+            "memory_limit_mb": self.memory_limit_mb,
+            "latest": latest.point() if latest else None,
+            "samples": [usage.point() for usage in history],
+        }
     
-    async def destroy_sandbox(self, project_id: int):
-        if project_id in self.sandboxes:
-            del self.sandboxes[project_id]
+    def metrics(self) -> dict:
+        now = time.time()
+        idle = sum(1 for s in self.sandboxes.values() if now - s.last_active > IDLE_AFTER_SECONDS)
+        return {
+            "worker": self.worker_id,
+            "live": len(self.sandboxes) - idle,
+            "idle": idle,
+            "warm": {
+                project_type: sum(len(host.pools[project_type]) for host in self.hosts.values())
+                for project_type in RUNTIMES
+            },
+            "reserved": len(self.reservations),
+            "reservations": {
+                "used": self.reservations_used,
+                "expired": self.reservations_expired,
+                "cancelled": self.reservations_cancelled,
+            },
+            "reaped": self.reaped,
+            "evicted": self.evicted,
+            "remote": len(self.remote),  # owned by other workers, seen here
+            "memory_reserved_mb": self._reserved_mb(),
+            "memory_budget_mb": self.memory_budget_mb,
+            "max_containers": self.max_containers,
+            "hosts": [host.info() for host in self.hosts.values()],
+            "deps": self.deps.stats() if self.deps else None,
+            "snapshots": self.snapshots.stats() if self.snapshots else None,
+            "usage": self.telemetry.summary() if self.telemetry else None,  # per host, last sample pass
+        }
 
 
-sandbox_manager = SandboxManager()
\ No newline at end of file
+sandbox_manager = SandboxManager(
+    docker_host=settings.SANDBOX_DOCKER_HOST,
+    preview_domain=settings.SANDBOX_PREVIEW_DOMAIN,
+    hosts=settings.SANDBOX_HOSTS,
+    port_range=(settings.SANDBOX_PORT_RANGE_START, settings.SANDBOX_PORT_RANGE_END),
+    port_lease_seconds=settings.SANDBOX_PORT_LEASE_SECONDS,
+    spread_above=settings.SANDBOX_SPREAD_ABOVE,
+    warm_pool=settings.SANDBOX_WARM_POOL,
+    memory_limit_mb=settings.SANDBOX_MEMORY_LIMIT_MB,
+    cpu_limit=settings.SANDBOX_CPU_LIMIT,
+    start_timeout=settings.SANDBOX_TIMEOUT_SECONDS,
+    idle_timeouts=settings.SANDBOX_IDLE_TIMEOUTS,
+    max_containers=settings.SANDBOX_MAX_CONTAINERS,
+    memory_budget_mb=settings.SANDBOX_MEMORY_BUDGET_MB,
+    log_lines=settings.SANDBOX_LOG_LINES,
+    log_bytes=settings.SANDBOX_LOG_BYTES,
+    registry=SandboxRegistry(
+        settings.REDIS_URL,
+        create_lease_seconds=2 * settings.SANDBOX_TIMEOUT_SECONDS,
+        owner_lease_seconds=settings.SANDBOX_OWNER_LEASE_SECONDS,
+    ) if settings.SANDBOX_SHARED_REGISTRY else None,
+    deps=DependencyCache(
+        budget_mb=settings.SANDBOX_DEPS_BUDGET_MB,
+        build_timeout=settings.SANDBOX_DEPS_BUILD_TIMEOUT_SECONDS,
+    ) if settings.SANDBOX_DEPS_CACHE else None,
+    snapshots=SnapshotStore(
+        max_per_host=settings.SANDBOX_SNAPSHOTS_PER_HOST,
+        commit_timeout=settings.SANDBOX_SNAPSHOT_TIMEOUT_SECONDS,
+    ) if settings.SANDBOX_SNAPSHOTS else None,
+    reserve_seconds=settings.SANDBOX_RESERVE_SECONDS,
+    telemetry=Telemetry(points=settings.SANDBOX_TELEMETRY_POINTS) if settings.SANDBOX_TELEMETRY_SECONDS else None,
+)
@@ -0,0 +1,107 @@
+"""
+Port allocator - bitmap free-list of host ports with leases.
+
+One bit per port in [start, end). Allocation is next-fit from a rotating
+cursor, so a just-released port is not handed out again right away (the
+preview proxy may still hold connections to it). Every allocated port
+has a lease that its owner renews; leases that run out (a removal failed
+or a release was forgotten) are reclaimed when the range is exhausted or
+on expire().
+
+An allocator lives in one API worker and only knows that worker's ports.
+It is not shared: with several workers, exclusivity comes from the port
+leases in the shared registry (see registry.py), and ports another worker
+holds are reserve()d here so they are skipped until their lease runs out.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import time
+
+
+class PortsExhausted(RuntimeError):
+    pass
+
+
+@dataclass
+class Lease:
+    owner: str
+    expires_at: float
+
+
+class PortAllocator:
+    def __init__(self, start: int = 10000, end: int = 20000, lease_seconds: float = 600.0):
+        if not 0 < start < end <= 65536:
+            raise ValueError(f"Invalid port range {start}-{end}")
+        self.start = start
+        self.end = end
+        self.lease_seconds = lease_seconds
+        self.bitmap = bytearray((end - start + 7) // 8)
+        self.leases: Dict[int, Lease] = {}
+        self._cursor = 0  # byte index where the next search starts
+        # Bits past the end of the range are permanently taken
+        tail = (end - start) % 8
+        if tail:
+            self.bitmap[-1] = 0xFF & ~((1 << tail) - 1)
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+    @property
+    def used(self) -> int:
+        return len(self.leases)
+
+    def _find_free(self) -> Optional[int]:
+        count = len(self.bitmap)
+        for step in range(count):
+            index = (self._cursor + step) % count
+            byte = self.bitmap[index]
+            if byte != 0xFF:
+                bit = (~byte & (byte + 1)).bit_length() - 1  # lowest zero bit
+                self._cursor = index
+                return index * 8 + bit
+        return None
+
+    def _set(self, offset: int, taken: bool):
+        if taken:
+            self.bitmap[offset >> 3] |= 1 << (offset & 7)
+        else:
+            self.bitmap[offset >> 3] &= ~(1 << (offset & 7))
+
+    def allocate(self, owner: str) -> int:
+        offset = self._find_free()
+        if offset is None and self.expire():
+            offset = self._find_free()
+        if offset is None:
+            raise PortsExhausted(f"No free ports in {self.start}-{self.end}")
+        self._set(offset, True)
+        port = self.start + offset
+        self.leases[port] = Lease(owner, time.monotonic() + self.lease_seconds)
+        return port
+
+    def reserve(self, port: int, owner: str):
+        """Take a specific port (e.g. found in use on the host)."""
+        if not self.start <= port < self.end:
+            return
+        self._set(port - self.start, True)
+        self.leases[port] = Lease(owner, time.monotonic() + self.lease_seconds)
+
+    def renew(self, port: int) -> bool:
+        lease = self.leases.get(port)
+        if lease is None:
+            return False
+        lease.expires_at = time.monotonic() + self.lease_seconds
+        return True
+
+    def release(self, port: int):
+        if self.leases.pop(port, None) is not None:
+            self._set(port - self.start, False)
+
+    def expire(self) -> List[int]:
+        """Release ports whose lease ran out."""
+        now = time.monotonic()
+        expired = [port for port, lease in self.leases.items() if lease.expires_at <= now]
+        for port in expired:
+            self.release(port)
+        return expired
@@ -0,0 +1,272 @@
+"""
+Sandbox registry - sandbox records shared by all API workers in Redis.
+
+Keys (prefix xbasis:sandbox):
+    :{project_id}          hash: the Sandbox record (status, host, container, port, ...)
+    :{project_id}:files    hash: path -> content hash (the sync manifest)
+    :{project_id}:owner    worker id, with a lease TTL
+    :port:{host}:{port}    worker id holding the host port, with a lease TTL
+    :worker:{worker_id}    set while the worker is alive, with the owner lease TTL
+
+Creating is create-or-get in one script: the first worker writes a
+"creating" placeholder that expires after the creation lease, everyone
+else gets the existing record and waits for it to turn "running". The
+creating worker renews the placeholder for as long as it is still at it
+(a cold dependency build takes minutes). The
+worker that created a sandbox owns it (log follower, idle reaping, port
+lease) for as long as it renews the owner lease; a sandbox whose owner
+stopped renewing is adopted by another worker.
+
+Host ports are leased here too: each worker picks candidates from its
+own allocator, and a port is only used once its key was set for that
+worker, so two workers never publish the same port on a host.
+
+Reads go through a short-lived local cache; local writes invalidate it.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "xbasis:sandbox"
+
+# KEYS[1] record; ARGV[1] creation lease ms. Returns existing record, or {} if placeholder was written.
+CREATE_OR_GET = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HGETALL', KEYS[1])
+end
+redis.call('HSET', KEYS[1], 'status', 'creating')
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return {}
+"""
+
+# KEYS[1] owner key; ARGV[1] worker id, ARGV[2] lease ms. Renews only our own lease.
+RENEW_OWNER = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] record; ARGV[1] creation lease ms. Extends the placeholder while it is one.
+RENEW_CREATING = """
+if redis.call('HGET', KEYS[1], 'status') == 'creating' then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# KEYS[1] port key; ARGV[1] worker id, ARGV[2] lease ms. Takes a free port or renews our own.
+LEASE_PORT = """
+local holder = redis.call('GET', KEYS[1])
+if not holder or holder == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# KEYS[1] port key; ARGV[1] worker id. Frees the port if we hold it.
+RELEASE_PORT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def record_key(project_id: int) -> str:
+    return f"{PREFIX}:{project_id}"
+
+
+def files_key(project_id: int) -> str:
+    return f"{PREFIX}:{project_id}:files"
+
+
+def owner_key(project_id: int) -> str:
+    return f"{PREFIX}:{project_id}:owner"
+
+
+def port_key(host_name: str, port: int) -> str:
+    return f"{PREFIX}:port:{host_name}:{port}"
+
+
+def worker_key(worker_id: str) -> str:
+    return f"{PREFIX}:worker:{worker_id}"
+
+
+class SandboxRegistry:
+    def __init__(
+        self,
+        redis_url: str = "redis://localhost:6379",
+        create_lease_seconds: float = 60.0,
+        owner_lease_seconds: float = 90.0,
+        port_lease_seconds: float = 600.0,
+        cache_seconds: float = 2.0,
+        client: Any = None,
+    ):
+        self.redis_url = redis_url
+        self.create_lease_seconds = create_lease_seconds
+        self.create_lease_ms = int(create_lease_seconds * 1000)
+        self.owner_lease_ms = int(owner_lease_seconds * 1000)
+        self.port_lease_ms = int(port_lease_seconds * 1000)
+        self.cache_seconds = cache_seconds
+        self._client = client
+        self._cache: Dict[int, Tuple[float, Optional[Dict[str, str]]]] = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis.asyncio as redis
+            self._client = redis.from_url(self.redis_url, decode_responses=True)
+        return self._client
+
+    def invalidate(self, project_id: int):
+        self._cache.pop(project_id, None)
+
+    async def get(self, project_id: int) -> Optional[Dict[str, str]]:
+        cached = self._cache.get(project_id)
+        if cached and time.monotonic() - cached[0] < self.cache_seconds:
+            return cached[1]
+        record = await self.client.hgetall(record_key(project_id)) or None
+        self._cache[project_id] = (time.monotonic(), record)
+        return record
+
+    async def create_or_get(self, project_id: int) -> Optional[Dict[str, str]]:
+        """Existing record, or None if the caller now holds the creation lease."""
+        self.invalidate(project_id)
+        result = await self.client.eval(CREATE_OR_GET, 1, record_key(project_id), self.create_lease_ms)
+        if not result:
+            return None
+        return dict(zip(result[::2], result[1::2]))
+
+    async def renew_creating(self, project_id: int) -> bool:
+        """Extend our "creating" placeholder; False once it is gone or no longer a placeholder."""
+        return bool(await self.client.eval(RENEW_CREATING, 1, record_key(project_id), self.create_lease_ms))
+
+    async def put(self, project_id: int, record: Dict[str, str], manifest: Dict[str, str], worker_id: str):
+        """Publish a created sandbox (no expiry) and take its owner lease."""
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(record_key(project_id), files_key(project_id))
+            pipe.hset(record_key(project_id), mapping=record)
+            if manifest:
+                pipe.hset(files_key(project_id), mapping=manifest)
+            pipe.set(owner_key(project_id), worker_id, px=self.owner_lease_ms)
+            await pipe.execute()
+        self.invalidate(project_id)
+
+    async def delete(self, project_id: int):
+        await self.client.delete(record_key(project_id), files_key(project_id), owner_key(project_id))
+        self.invalidate(project_id)
+
+    async def touch(self, project_id: int, last_active: float):
+        await self.client.hset(record_key(project_id), "last_active", repr(last_active))
+
+    async def last_active(self, project_ids: List[int]) -> Dict[int, Optional[float]]:
+        """Shared last activity of sandboxes; None if the record is gone."""
+        if not project_ids:
+            return {}
+        async with self.client.pipeline(transaction=False) as pipe:
+            for project_id in project_ids:
+                pipe.hget(record_key(project_id), "last_active")
+            values = await pipe.execute()
+        return {project_id: float(value) if value else None for project_id, value in zip(project_ids, values)}
+
+    async def manifest(self, project_id: int) -> Dict[str, str]:
+        return await self.client.hgetall(files_key(project_id))
+
+    async def update_manifest(self, project_id: int, changed: Dict[str, str], deleted: Iterable[str]):
+        deleted = list(deleted)
+        async with self.client.pipeline(transaction=True) as pipe:
+            if changed:
+                pipe.hset(files_key(project_id), mapping=changed)
+            if deleted:
+                pipe.hdel(files_key(project_id), *deleted)
+            await pipe.execute()
+
+    async def renew(self, project_ids: List[int], worker_id: str) -> List[int]:
+        """Renew owner leases; returns the projects we no longer own."""
+        lost = []
+        for project_id in project_ids:
+            if not await self.client.eval(RENEW_OWNER, 1, owner_key(project_id), worker_id, self.owner_lease_ms):
+                lost.append(project_id)
+        return lost
+
+    async def _project_ids(self) -> List[int]:
+        project_ids = []
+        async for key in self.client.scan_iter(match=f"{PREFIX}:*", count=500):
+            suffix = key[len(PREFIX) + 1:]
+            if suffix.isdigit():
+                project_ids.append(int(suffix))
+        return project_ids
+
+    async def orphans(self) -> List[int]:
+        """Running sandboxes whose owner lease ran out."""
+        project_ids = await self._project_ids()
+        if not project_ids:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for project_id in project_ids:
+                pipe.exists(owner_key(project_id))
+                pipe.hget(record_key(project_id), "status")
+            results = await pipe.execute()
+        return [
+            project_id for project_id, owned, status in zip(project_ids, results[::2], results[1::2])
+            if not owned and status == "running"
+        ]
+
+    async def containers(self) -> Dict[str, int]:
+        """Container id -> project id of every published sandbox."""
+        project_ids = await self._project_ids()
+        if not project_ids:
+            return {}
+        async with self.client.pipeline(transaction=False) as pipe:
+            for project_id in project_ids:
+                pipe.hget(record_key(project_id), "container_id")
+            results = await pipe.execute()
+        return {container_id: project_id for project_id, container_id in zip(project_ids, results) if container_id}
+
+    async def heartbeat(self, worker_id: str):
+        """Mark worker_id alive for another owner lease."""
+        await self.client.set(worker_key(worker_id), "1", px=self.owner_lease_ms)
+
+    async def live_workers(self, worker_ids: Iterable[str]) -> Set[str]:
+        worker_ids = list(worker_ids)
+        if not worker_ids:
+            return set()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                pipe.exists(worker_key(worker_id))
+            results = await pipe.execute()
+        return {worker_id for worker_id, alive in zip(worker_ids, results) if alive}
+
+    async def adopt(self, project_id: int, worker_id: str) -> Optional[Dict[str, str]]:
+        """Take the owner lease of an orphaned sandbox; its record if we got it."""
+        if not await self.client.set(owner_key(project_id), worker_id, nx=True, px=self.owner_lease_ms):
+            return None
+        self.invalidate(project_id)
+        return await self.get(project_id)
+
+    async def lease_ports(self, host_name: str, ports: Iterable[int], worker_id: str) -> List[int]:
+        """Lease (or renew) host ports for worker_id; returns the ports another worker holds."""
+        ports = list(ports)
+        if not ports:
+            return []
+        async with self.client.pipeline(transaction=False) as pipe:
+            for port in ports:
+                pipe.eval(LEASE_PORT, 1, port_key(host_name, port), worker_id, self.port_lease_ms)
+            results = await pipe.execute()
+        return [port for port, leased in zip(ports, results) if not leased]
+
+    async def take_port(self, host_name: str, port: int, worker_id: str):
+        """Take over the lease of a port in use by an adopted sandbox."""
+        await self.client.set(port_key(host_name, port), worker_id, px=self.port_lease_ms)
+
+    async def release_port(self, host_name: str, port: int, worker_id: str):
+        await self.client.eval(RELEASE_PORT, 1, port_key(host_name, port), worker_id)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
@@ -1,8 +1,11 @@
 """
 Sandbox API endpoints for Live Preview.
 """
-from typing import Dict
-from fastapi import APIRouter, Depends, HTTPException
+from typing import AsyncIterator, Dict, List, Optional
+import json
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,7 +14,9 @@ from ..core.database import get_db
 from ..models.user import User
 from ..models.project import Project
 from ..auth.router import get_current_user
-from .manager import sandbox_manager
+from .logs import LogBuffer
+from .manager import RestartRequired, Sandbox, SandboxError, sandbox_manager
+from .sync import SyncError
 
 router = APIRouter()
 
@@ -26,10 +31,36 @@ class SandboxResponse(BaseModel):
     preview_url: str
     status: str
     port: int
+    host: str
+    startup_ms: Optional[float] = None
+    resumed: bool = False  # started from a snapshot
+
+
+def sandbox_response(sandbox: Sandbox) -> SandboxResponse:
+    return SandboxResponse(
+        id=sandbox.id,
+        project_id=sandbox.project_id,
+        preview_url=sandbox.preview_url,
+        status=sandbox.status,
+        port=sandbox.port,
+        host=sandbox.host,
+        startup_ms=sandbox.startup_ms,
+        resumed=sandbox.resumed,
+    )
 
 
 class UpdateFilesRequest(BaseModel):
-    files: Dict[str, str]
+    files: Dict[str, str]  # changed files only, or the whole project
+    deleted: List[str] = []
+
+
+class FileHashesRequest(BaseModel):
+    hashes: Dict[str, str]  # path -> sha256 hex of content
+
+
+class MissingFilesResponse(BaseModel):
+    missing: List[str]  # upload these
+    stale: List[str]  # in sandbox, not in client's hashes
 
 
 @router.post("/{project_id}/sandbox", response_model=SandboxResponse)
@@ -44,13 +75,19 @@ async def create_sandbox(
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    sandbox = await sandbox_manager.create_sandbox(
-        project_id=project_id,
-        project_type=project.type.value,
-        files=data.files,
-        db_url=f"postgresql://project_{project_id}@localhost/xbasis",
-    )
-    return SandboxResponse(id=sandbox.id, project_id=sandbox.project_id, preview_url=sandbox.preview_url, status=sandbox.status, port=sandbox.port)
+    try:
+        sandbox = await sandbox_manager.create_sandbox(
+            project_id=project_id,
+            project_type=project.type.value,
+            files=data.files,
+            db_url=f"postgresql://project_{project_id}@localhost/xbasis",
+            plan=current_user.plan.value,
+        )
+    except SandboxError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except SyncError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return sandbox_response(sandbox)
 
 
 @router.get("/{project_id}/sandbox", response_model=SandboxResponse)
@@ -65,7 +102,24 @@ async def get_sandbox(
     sandbox = await sandbox_manager.get_sandbox(project_id)
     if not sandbox:
         raise HTTPException(status_code=404, detail="Sandbox not found")
-    return SandboxResponse(id=sandbox.id, project_id=sandbox.project_id, preview_url=sandbox.preview_url, status=sandbox.status, port=sandbox.port)
+    await sandbox_manager.touch(project_id)
+    return sandbox_response(sandbox)
+
+
+@router.post("/{project_id}/sandbox/activity")
+async def sandbox_activity(
+    project_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Heartbeat from the open preview, keeps the sandbox from being reaped as idle."""
+    result = await db.execute(select(Project).where(Project.id == project_id).where(Project.owner_id == current_user.id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not await sandbox_manager.get_sandbox(project_id):
+        raise HTTPException(status_code=404, detail="Sandbox not found")
+    await sandbox_manager.touch(project_id)
+    return {"status": "ok"}
 
 
 @router.put("/{project_id}/sandbox/files")
@@ -79,20 +133,117 @@ async def update_sandbox_files(
     if not result.scalar_one_or_none():
         raise HTTPException(status_code=404, detail="Project not found")
     try:
-        await sandbox_manager.update_files(project_id, data.files)
-        return {"status": "updated", "files_count": len(data.files)}
+        stats = await sandbox_manager.update_files(project_id, data.files, data.deleted)
+        return {"status": "updated", "files_count": len(data.files), **stats}
+    except RestartRequired as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SandboxError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except SyncError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/{project_id}/sandbox/files/missing", response_model=MissingFilesResponse)
+async def missing_sandbox_files(
+    project_id: int,
+    data: FileHashesRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Compare client hashes with the sandbox manifest; upload only what is missing."""
+    result = await db.execute(select(Project).where(Project.id == project_id).where(Project.owner_id == current_user.id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        return await sandbox_manager.missing_files(project_id, data.hashes)
+    except SyncError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
+@router.get("/{project_id}/sandbox/usage")
+async def sandbox_usage(
+    project_id: int,
+    since: float = Query(0.0, ge=0, description="Only samples after this Unix time"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """CPU, memory, network and PID usage of the sandbox over time."""
+    result = await db.execute(select(Project).where(Project.id == project_id).where(Project.owner_id == current_user.id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Project not found")
+    usage = await sandbox_manager.usage(project_id, since)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Sandbox not found")
+    return usage
+
+
+KEEPALIVE_SECONDS = 15.0
+
+
+async def log_events(logs: LogBuffer, offset: int, follow: bool) -> AsyncIterator[str]:
+    """SSE stream of log lines from offset; a "gap" event reports lines already dropped."""
+    while True:
+        lines, skipped = logs.since(offset)
+        if skipped:
+            yield f"event: gap\ndata: {json.dumps({'skipped': skipped})}\n\n"
+        for line in lines:
+            yield line.event()
+        offset = logs.next_offset
+        if not follow or logs.closed:
+            return
+        if not await logs.wait(offset, KEEPALIVE_SECONDS):
+            if logs.closed:
+                return
+            yield ": keepalive\n\n"
+
+
+@router.get("/{project_id}/sandbox/logs")
+async def sandbox_logs(
+    project_id: int,
+    offset: Optional[int] = Query(None, ge=0, description="First line to send; default: everything buffered"),
+    follow: bool = True,
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Tail sandbox output as server-sent events.
+    
+    Each event's id is the line offset: reconnecting with Last-Event-ID (or
+    ?offset=) resumes right after the last line received.
+    """
+    result = await db.execute(select(Project).where(Project.id == project_id).where(Project.owner_id == current_user.id))
+    if not result.scalar_one_or_none():
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        logs = await sandbox_manager.logs(project_id)
+    except SandboxError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if logs is None:
+        raise HTTPException(status_code=404, detail="Sandbox not found")
+    
+    if offset is None:
+        offset = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    return StreamingResponse(
+        log_events(logs, offset, follow),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.delete("/{project_id}/sandbox")
 async def stop_sandbox(
     project_id: int,
+    snapshot: bool = Query(False, description="Commit the sandbox for a fast resume"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     result = await db.execute(select(Project).where(Project.id == project_id).where(Project.owner_id == current_user.id))
     if not result.scalar_one_or_none():
         raise HTTPException(status_code=404, detail="Project not found")
-    await sandbox_manager.destroy_sandbox(project_id)
+    await sandbox_manager.destroy_sandbox(project_id, snapshot=snapshot)
     return {"status": "stopped"}
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Sandbox runtimes - container spec per ProjectType.
+
+Warm containers are started with the idle command (or the image's own
+command when it serves files as is, like nginx) and turned into a project
+preview by copying files in and running `start`.
+
+Runtimes with a lockfile can take their dependencies from a shared cache
+volume (see deps.py): the volume is built once per lockfile hash with
+`build`, mounted read-only at `deps_mount`, and the sandbox then runs
+only `run`.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import hashlib
+
+
+IDLE_COMMAND = ["tail", "-f", "/dev/null"]
+
+BUILD_DIR = "/build"  # lockfiles are copied here in the builder container
+BUILD_MOUNT = "/deps"  # cache volume mount point in the builder container
+
+
+@dataclass(frozen=True)
+class Runtime:
+    image: str
+    port: int  # port the app listens on inside the container
+    workdir: str
+    run: Optional[str] = None  # dev server command; None = image serves workdir itself
+    install: Optional[str] = None  # dependency install in workdir, when not cached
+    command: Optional[List[str]] = None  # warm container command; None = image default
+    lockfile: Optional[str] = None  # its content keys the dependency cache
+    lock_inputs: Tuple[str, ...] = ()  # other files hashed with the lockfile if present
+    build: Optional[str] = None  # installs dependencies into BUILD_MOUNT, run in BUILD_DIR
+    deps_mount: Optional[str] = None  # where the cache volume is mounted in the sandbox
+    deps_env: Dict[str, str] = field(default_factory=dict)
+    deps_writable: Tuple[str, ...] = ()  # paths under deps_mount the dev server writes to (tmpfs)
+
+    @property
+    def warm_command(self) -> Optional[List[str]]:
+        if self.command is not None:
+            return self.command
+        return IDLE_COMMAND if self.run else None
+
+    @property
+    def start(self) -> Optional[str]:
+        """Shell command run on claim (without cached dependencies)."""
+        if not self.run:
+            return None
+        return f"{self.install}; exec {self.run}" if self.install else f"exec {self.run}"
+
+    def deps_key(self, files: Dict[str, str]) -> Optional[str]:
+        """Content hash of the lockfile and its inputs, None if the project has no lockfile."""
+        if not (self.lockfile and self.build) or self.lockfile not in files:
+            return None
+        digest = hashlib.sha256(self.image.encode())
+        for path in (self.lockfile, *self.lock_inputs):
+            if path in files:
+                digest.update(f"\0{path}\0".encode())
+                digest.update(files[path].encode())
+        return digest.hexdigest()
+
+    def deps_files(self, files: Dict[str, str]) -> Dict[str, str]:
+        return {path: files[path] for path in (self.lockfile, *self.lock_inputs) if path in files}
+
+
+RUNTIMES: Dict[str, Runtime] = {
+    "web": Runtime(
+        image="node:20-alpine",
+        port=3000,
+        workdir="/app",
+        run="npm run dev -- --host 0.0.0.0 --port 3000",
+        install="npm install --no-audit --no-fund",
+        lockfile="package-lock.json",
+        lock_inputs=("package.json",),
+        build=f"npm ci --no-audit --no-fund && cp -a node_modules/. {BUILD_MOUNT}/ && mkdir -p {BUILD_MOUNT}/.vite",
+        deps_mount="/app/node_modules",
+        deps_writable=("/app/node_modules/.vite",),  # Vite's dependency pre-bundling cache
+    ),
+    "api": Runtime(
+        image="python:3.12-slim",
+        port=8000,
+        workdir="/app",
+        run="python -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload",
+        install="pip install -q -r requirements.txt",
+        lockfile="requirements.txt",
+        build=f"pip install -q --target {BUILD_MOUNT} -r requirements.txt",
+        deps_mount="/deps",
+        deps_env={"PYTHONPATH": "/deps"},
+    ),
+    "bot": Runtime(
+        image="python:3.12-slim",
+        port=8000,
+        workdir="/app",
+        run="python main.py",
+        install="pip install -q -r requirements.txt",
+        lockfile="requirements.txt",
+        build=f"pip install -q --target {BUILD_MOUNT} -r requirements.txt",
+        deps_mount="/deps",
+        deps_env={"PYTHONPATH": "/deps"},
+    ),
+    "static": Runtime(
+        image="nginx:alpine",
+        port=80,
+        workdir="/usr/share/nginx/html",
+    ),
+}
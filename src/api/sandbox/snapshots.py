@@ -0,0 +1,183 @@
+"""
+Sandbox snapshots - committed containers for fast resume.
+
+When a sandbox is stopped (reaped, evicted, or on request) its container
+is committed to an image on its host, keyed by project and the hash of
+its file manifest. Creating the sandbox again with the same files starts
+from that image: installed dependencies, build caches and files are all
+in place, so only the dev server is launched.
+
+Images are labelled, so the index is rebuilt from `docker images` after a
+restart. Each project keeps its newest snapshot only; past the per-host
+limit the oldest snapshots are removed. Mounted volumes (the dependency
+cache) and tmpfs are not part of a commit and are mounted again on resume.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPOSITORY = "xbasis-snapshot"
+LABEL = "xbasis.snapshot"  # project id
+MANIFEST_LABEL = "xbasis.snapshot.manifest"
+TYPE_LABEL = "xbasis.snapshot.type"
+CREATED_LABEL = "xbasis.snapshot.created"
+DEPS_LABEL = "xbasis.snapshot.deps"  # "1" if dependencies were mounted, not committed
+
+
+def manifest_hash(manifest: Dict[str, str]) -> str:
+    """Hash of a path -> content hash manifest, independent of order."""
+    digest = hashlib.sha256()
+    for path in sorted(manifest):
+        digest.update(f"{path}\0{manifest[path]}\n".encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class Snapshot:
+    project_id: int
+    host: str
+    image: str  # image id
+    manifest_hash: str
+    project_type: str
+    deps: bool = False  # needs the dependency cache volume mounted
+    size_bytes: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+class SnapshotStore:
+    def __init__(self, max_per_host: int = 20, commit_timeout: float = 120.0):
+        self.max_per_host = max_per_host
+        self.commit_timeout = commit_timeout
+        self.snapshots: Dict[int, Snapshot] = {}  # project id -> newest snapshot
+        self.taken = 0
+        self.restored = 0
+        self.stale = 0  # snapshot found, but files or type changed since
+        self.failures = 0
+        self.resume_ms_total = 0.0
+
+    def find(self, project_id: int, project_type: str, files_hash: str) -> Optional[Snapshot]:
+        snapshot = self.snapshots.get(project_id)
+        if snapshot is None:
+            return None
+        if snapshot.project_type != project_type or snapshot.manifest_hash != files_hash:
+            self.stale += 1
+            return None
+        return snapshot
+
+    def resumed(self, resume_ms: float):
+        self.restored += 1
+        self.resume_ms_total += resume_ms
+
+    async def load(self, host_name: str, client: Any):
+        """Index snapshot images found on host (newest per project wins)."""
+        images = await asyncio.to_thread(client.images.list, filters={"label": LABEL})
+        for image in images:
+            labels = image.labels or {}
+            try:
+                snapshot = Snapshot(
+                    project_id=int(labels[LABEL]),
+                    host=host_name,
+                    image=image.id,
+                    manifest_hash=labels[MANIFEST_LABEL],
+                    project_type=labels[TYPE_LABEL],
+                    deps=labels.get(DEPS_LABEL) == "1",
+                    size_bytes=image.attrs.get("Size", 0),
+                    created_at=float(labels.get(CREATED_LABEL, 0)),
+                )
+            except (KeyError, ValueError):
+                continue
+            current = self.snapshots.get(snapshot.project_id)
+            if current is None or current.created_at < snapshot.created_at:
+                self.snapshots[snapshot.project_id] = snapshot
+
+    async def take(
+        self,
+        host_name: str,
+        client: Any,
+        container: Any,
+        project_id: int,
+        project_type: str,
+        manifest: Dict[str, str],
+        deps: bool = False,
+    ) -> List[Snapshot]:
+        """
+        Commit container as the project's snapshot.
+
+        Returns the snapshots it displaces (the project's previous one and
+        the oldest on host past max_per_host); the caller removes their
+        images with remove().
+        """
+        files_hash = manifest_hash(manifest)
+        created_at = time.time()
+        labels = {
+            LABEL: str(project_id),
+            MANIFEST_LABEL: files_hash,
+            TYPE_LABEL: project_type,
+            CREATED_LABEL: repr(created_at),
+            DEPS_LABEL: "1" if deps else "",
+        }
+        try:
+            image = await asyncio.wait_for(
+                asyncio.to_thread(
+                    container.commit,
+                    repository=REPOSITORY,
+                    tag=f"p{project_id}-{files_hash[:16]}",
+                    conf={"Labels": labels},
+                ),
+                self.commit_timeout,
+            )
+        except Exception:
+            self.failures += 1
+            raise
+        self.taken += 1
+
+        snapshot = Snapshot(
+            project_id=project_id,
+            host=host_name,
+            image=image.id,
+            manifest_hash=files_hash,
+            project_type=project_type,
+            deps=deps,
+            size_bytes=image.attrs.get("Size", 0),
+            created_at=created_at,
+        )
+        displaced = []
+        previous = self.snapshots.get(project_id)
+        if previous and previous.image != snapshot.image:
+            displaced.append(previous)
+        self.snapshots[project_id] = snapshot
+
+        on_host = sorted(
+            (s for s in self.snapshots.values() if s.host == host_name),
+            key=lambda s: s.created_at,
+        )
+        for oldest in on_host[:max(len(on_host) - self.max_per_host, 0)]:
+            del self.snapshots[oldest.project_id]
+            displaced.append(oldest)
+        return displaced
+
+    def drop(self, project_id: int) -> Optional[Snapshot]:
+        return self.snapshots.pop(project_id, None)
+
+    async def remove(self, client: Any, snapshot: Snapshot):
+        try:
+            await asyncio.to_thread(client.images.remove, image=snapshot.image, force=True)
+        except Exception as e:
+            logger.warning(f"Failed to remove snapshot {snapshot.image} of project {snapshot.project_id}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "snapshots": len(self.snapshots),
+            "size_mb": sum(s.size_bytes for s in self.snapshots.values()) // (1024 * 1024),
+            "taken": self.taken,
+            "restored": self.restored,
+            "stale": self.stale,
+            "failures": self.failures,
+            "avg_resume_ms": round(self.resume_ms_total / self.restored, 1) if self.restored else None,
+        }
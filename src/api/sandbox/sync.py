@@ -0,0 +1,101 @@
+"""
+File sync - content-hash manifests and streamed tar archives.
+
+Each sandbox keeps a manifest {path: sha256} of what is in its container.
+An update is diffed against it, so only files whose content changed are
+written, as one tar streamed to the Docker API (no archive in memory).
+Clients can also send just hashes and get back the paths to upload.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List
+import hashlib
+import posixpath
+import tarfile
+import time
+
+BLOCK = tarfile.BLOCKSIZE
+CHUNK_BYTES = 64 * 1024
+
+
+class SyncError(ValueError):
+    pass
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def safe_path(path: str) -> str:
+    """Normalize project-relative path; reject absolute paths and escapes."""
+    normalized = posixpath.normpath(path.replace("\\", "/"))
+    if normalized.startswith(("/", "../")) or normalized in ("..", "."):
+        raise SyncError(f"Invalid file path: {path}")
+    return normalized
+
+
+@dataclass
+class FileChanges:
+    files: Dict[str, str] = field(default_factory=dict)  # normalized path -> content to write
+    hashes: Dict[str, str] = field(default_factory=dict)  # hashes of files
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+
+def diff_files(manifest: Dict[str, str], files: Dict[str, str], deleted: Iterable[str] = ()) -> FileChanges:
+    """Changes needed to bring a container with manifest up to date."""
+    changes = FileChanges()
+    for path, content in files.items():
+        path = safe_path(path)
+        digest = content_hash(content)
+        if manifest.get(path) == digest:
+            changes.unchanged += 1
+        else:
+            changes.files[path] = content
+            changes.hashes[path] = digest
+    for path in deleted:
+        path = safe_path(path)
+        if path in manifest and path not in changes.files:
+            changes.deleted.append(path)
+    return changes
+
+
+def missing_paths(manifest: Dict[str, str], hashes: Dict[str, str]) -> List[str]:
+    """Paths whose hash differs from the manifest, i.e. what the client must upload."""
+    return sorted(path for path, digest in hashes.items() if manifest.get(safe_path(path)) != digest)
+
+
+def stale_paths(manifest: Dict[str, str], hashes: Dict[str, str]) -> List[str]:
+    """Paths in the manifest the client no longer has."""
+    current = {safe_path(path) for path in hashes}
+    return sorted(path for path in manifest if path not in current)
+
+
+def _member(path: str, size: int, mtime: int) -> bytes:
+    info = tarfile.TarInfo(path)
+    info.size = size
+    info.mtime = mtime
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.PAX_FORMAT)
+
+
+def stream_tar(files: Dict[str, str], chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """
+    Tar archive of files as a stream of chunks.
+
+    Members are encoded one at a time; only the current file is held in
+    memory besides the caller's dict.
+    """
+    now = int(time.time())
+    buffer = bytearray()
+    for path, content in files.items():
+        data = content.encode()
+        buffer += _member(safe_path(path), len(data), now)
+        buffer += data
+        buffer += b"\0" * (-len(data) % BLOCK)
+        while len(buffer) >= chunk_bytes:
+            yield bytes(buffer[:chunk_bytes])
+            del buffer[:chunk_bytes]
+    buffer += b"\0" * (2 * BLOCK)  # end-of-archive marker
+    yield bytes(buffer)
+
@@ -0,0 +1,176 @@
+"""
+Sandbox telemetry - CPU, memory, network and PID usage of containers.
+
+Every interval all managed containers of a host are sampled in one pass
+(one thread, one-shot `docker stats` per container). CPU and network
+counters are cumulative, so rates come from the difference to the
+previous sample of the same container.
+
+Samples go into a fixed-size ring per container backed by typed arrays,
+about 30 bytes per point, so an hour at 10 s is ~10 KB per sandbox.
+"""
+
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+@dataclass
+class Usage:
+    timestamp: float
+    cpu_percent: float  # of one CPU; 200 = two CPUs busy
+    memory_bytes: int  # without page cache
+    rx_bytes_per_s: float
+    tx_bytes_per_s: float
+    pids: int
+
+    def point(self) -> dict:
+        return {
+            "ts": round(self.timestamp, 3),
+            "cpu_percent": round(self.cpu_percent, 1),
+            "memory_mb": round(self.memory_bytes / MB, 1),
+            "rx_kbps": round(self.rx_bytes_per_s / 1024, 1),
+            "tx_kbps": round(self.tx_bytes_per_s / 1024, 1),
+            "pids": self.pids,
+        }
+
+
+class Series:
+    """Ring of the newest `capacity` usage samples of one container."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamp = array("d", bytes(8 * capacity))
+        self.cpu = array("f", bytes(4 * capacity))
+        self.memory = array("Q", bytes(8 * capacity))
+        self.rx = array("f", bytes(4 * capacity))
+        self.tx = array("f", bytes(4 * capacity))
+        self.pids = array("I", bytes(4 * capacity))
+        self.count = 0  # samples ever added
+
+    def add(self, usage: Usage):
+        i = self.count % self.capacity
+        self.timestamp[i] = usage.timestamp
+        self.cpu[i] = usage.cpu_percent
+        self.memory[i] = usage.memory_bytes
+        self.rx[i] = usage.rx_bytes_per_s
+        self.tx[i] = usage.tx_bytes_per_s
+        self.pids[i] = usage.pids
+        self.count += 1
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def _at(self, i: int) -> Usage:
+        return Usage(self.timestamp[i], self.cpu[i], self.memory[i], self.rx[i], self.tx[i], self.pids[i])
+
+    def latest(self) -> Optional[Usage]:
+        return self._at((self.count - 1) % self.capacity) if self.count else None
+
+    def points(self, since: float = 0.0) -> List[Usage]:
+        """Samples oldest first, newer than since."""
+        start = self.count - len(self)
+        samples = (self._at(n % self.capacity) for n in range(start, self.count))
+        return [usage for usage in samples if usage.timestamp > since]
+
+
+def _counters(stats: dict) -> Tuple[int, int, int, int, int, int, int]:
+    """Cumulative CPU, system CPU, online CPUs, rx, tx; current memory and PIDs."""
+    cpu = stats.get("cpu_stats") or {}
+    memory = stats.get("memory_stats") or {}
+    networks = (stats.get("networks") or {}).values()
+    cache = (memory.get("stats") or {}).get("inactive_file", (memory.get("stats") or {}).get("cache", 0))
+    return (
+        (cpu.get("cpu_usage") or {}).get("total_usage", 0),
+        cpu.get("system_cpu_usage", 0),
+        cpu.get("online_cpus") or 1,
+        sum(network.get("rx_bytes", 0) for network in networks),
+        sum(network.get("tx_bytes", 0) for network in networks),
+        max(memory.get("usage", 0) - cache, 0),
+        (stats.get("pids_stats") or {}).get("current", 0),
+    )
+
+
+class Telemetry:
+    def __init__(self, points: int = 360):
+        self.points = points
+        self.series: Dict[str, Series] = {}  # container id -> samples
+        self._previous: Dict[str, Tuple[float, Tuple[int, ...]]] = {}  # container id -> (time, counters)
+        self.hosts: Dict[str, dict] = {}  # host -> summary of the last pass
+
+    def _usage(self, container_id: str, now: float, stats: dict) -> Optional[Usage]:
+        counters = _counters(stats)
+        previous = self._previous.get(container_id)
+        self._previous[container_id] = (now, counters)
+        if previous is None:
+            return None  # rates need two samples
+        then, (cpu, system, _, rx, tx, _, _) = previous
+        elapsed = max(now - then, 1e-3)
+        cpu_delta, system_delta = counters[0] - cpu, counters[1] - system
+        cpu_percent = cpu_delta / system_delta * counters[2] * 100 if system_delta > 0 and cpu_delta >= 0 else 0.0
+        return Usage(
+            timestamp=now,
+            cpu_percent=cpu_percent,
+            memory_bytes=counters[5],
+            rx_bytes_per_s=max(counters[3] - rx, 0) / elapsed,
+            tx_bytes_per_s=max(counters[4] - tx, 0) / elapsed,
+            pids=counters[6],
+        )
+
+    async def sample(self, host_name: str, client: Any, container_ids: Iterable[str]):
+        """One pass over a host's containers."""
+        container_ids = list(container_ids)
+
+        def collect() -> Dict[str, dict]:
+            stats = {}
+            for container_id in container_ids:
+                try:
+                    stats[container_id] = client.api.stats(container_id, stream=False, one_shot=True)
+                except Exception as e:
+                    logger.debug(f"No stats for container {container_id} on {host_name}: {e}")
+            return stats
+
+        started = time.perf_counter()
+        collected = await asyncio.to_thread(collect)
+        now = time.time()
+        for container_id, stats in collected.items():
+            usage = self._usage(container_id, now, stats)
+            if usage is not None:
+                self.series.setdefault(container_id, Series(self.points)).add(usage)
+
+        current = [self.series[c].latest() for c in collected if c in self.series]
+        self.hosts[host_name] = {
+            "containers": len(collected),
+            "cpu_percent": round(sum(u.cpu_percent for u in current), 1),
+            "memory_mb": round(sum(u.memory_bytes for u in current) / MB, 1),
+            "rx_kbps": round(sum(u.rx_bytes_per_s for u in current) / 1024, 1),
+            "tx_kbps": round(sum(u.tx_bytes_per_s for u in current) / 1024, 1),
+            "pids": sum(u.pids for u in current),
+            "sampled_at": now,
+            "sample_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+
+    def forget(self, keep: Iterable[str]):
+        """Drop series of containers that are gone."""
+        keep = set(keep)
+        for container_id in [c for c in self._previous if c not in keep]:
+            self._previous.pop(container_id, None)
+            self.series.pop(container_id, None)
+
+    def latest(self, container_id: str) -> Optional[Usage]:
+        series = self.series.get(container_id)
+        return series.latest() if series else None
+
+    def history(self, container_id: str, since: float = 0.0) -> List[Usage]:
+        series = self.series.get(container_id)
+        return series.points(since) if series else []
+
+    def summary(self) -> Dict[str, dict]:
+        return dict(self.hosts)
@@ -14,13 +14,10 @@ from httpx import AsyncClient, ASGITransport
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import StaticPool
 
-import sys
-sys.path.insert(0, 'src/api')
-
-from main import app
-from core.database import Base, get_db
-from models.user import User
-from auth.utils import hash_password, create_access_token
+from src.api.main import app
+from src.api.core.database import Base, get_db
+from src.api.models.user import User
+from src.api.auth.router import hash_password, create_token
 
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
@@ -80,7 +77,7 @@ async def test_user(db_session: AsyncSession) -> User:
     """Create a test user in the database."""
     user = User(
         email="test@example.com",
-        hashed_password=hash_password("testpassword123"),
+        password_hash=hash_password("testpassword123"),
         name="Test User",
         is_active=True,
         plan="free",
@@ -95,7 +92,7 @@ async def test_user(db_session: AsyncSession) -> User:
 @pytest.fixture
 async def test_user_token(test_user: User) -> str:
     """Create access token for test user."""
-    return create_access_token(data={"sub": str(test_user.id)})
+    return create_token(test_user.id)
 
 
 @pytest.fixture
@@ -0,0 +1,169 @@
+"""
+In-memory stand-in for a Postgres AsyncEngine, for DatabaseManager tests.
+
+It records every statement together with the transaction mode it ran in,
+and keeps _migrations rows transactional: a transaction sees its own rows,
+and other connections see them only after commit. It rejects writes inside
+READ ONLY transactions the way Postgres does. Statements containing a
+`fail` pattern raise. Other SELECTs return the first matching `results`
+entry.
+"""
+
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.api.database.manager import DatabaseManager
+from src.api.database.sharding import DEFAULT_SHARD, ShardMap
+
+WRITES = ("INSERT", "UPDATE", "DELETE", "CREATE", "ALTER", "DROP", "TRUNCATE", "COPY")
+
+
+class FakeDBError(Exception):
+    pass
+
+
+class FakeResult:
+    def __init__(self, columns: Sequence[str] = (), rows: Sequence[tuple] = (), rowcount: int = 0):
+        self.columns = list(columns)
+        self.rows = [tuple(row) for row in rows]
+        self.rowcount = rowcount
+        self.returns_rows = bool(self.columns)
+
+    def keys(self):
+        return self.columns
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else None
+
+
+class FakeServer:
+    def __init__(self):
+        self.migrations: List[dict] = []  # committed _migrations rows
+        self.statements: List[Tuple[str, str]] = []  # (sql, "autocommit" | "transaction" | "read only")
+        self.fail: Dict[str, str] = {}  # sql substring -> error message
+        self.results: Dict[str, Tuple[List[str], List[tuple]]] = {}  # sql substring -> (columns, rows)
+        self.locks: List[Tuple[str, str]] = []  # (mode, relation) reported by pg_locks
+        self.invalid_indexes: List[str] = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def executed(self, fragment: str) -> List[Tuple[str, str]]:
+        return [(sql, mode) for sql, mode in self.statements if fragment in sql]
+
+
+class FakeConnection:
+    def __init__(self, server: FakeServer):
+        self.server = server
+        self.autocommit = False
+        self.in_transaction = False
+        self.read_only = False
+        self.pending: List[dict] = []
+
+    async def execution_options(self, isolation_level: Optional[str] = None, **_):
+        self.autocommit = isolation_level == "AUTOCOMMIT"
+        return self
+
+    async def begin(self):
+        self.in_transaction = True
+
+    def _end(self):
+        self.in_transaction = False
+        self.read_only = False
+        self.pending = []
+
+    async def commit(self):
+        if self.in_transaction:
+            self.server.migrations.extend(self.pending)
+            self.server.commits += 1
+        self._end()
+
+    async def rollback(self):
+        if self.in_transaction:
+            self.server.rollbacks += 1
+        self._end()
+
+    async def execute(self, clause, params: Optional[dict] = None) -> FakeResult:
+        sql = " ".join(str(clause).split())
+        upper = sql.upper()
+        if not self.autocommit:
+            self.in_transaction = True  # autobegin
+        if upper == "SET TRANSACTION READ ONLY":
+            self.read_only = True
+        mode = "autocommit" if self.autocommit else ("read only" if self.read_only else "transaction")
+        self.server.statements.append((sql, mode))
+
+        for pattern, message in self.server.fail.items():
+            if pattern in sql:
+                raise FakeDBError(message)
+        if self.read_only:
+            for part in upper.split(";"):
+                if part.strip().startswith(WRITES):
+                    raise FakeDBError(f"cannot execute {part.split()[0]} in a read-only transaction")
+
+        visible = self.server.migrations + self.pending
+        if upper.startswith("INSERT INTO _MIGRATIONS"):
+            if self.autocommit:
+                self.server.migrations.append(dict(params))
+            else:
+                self.pending.append(dict(params))
+            return FakeResult(rowcount=1)
+        if upper.startswith("SELECT CHECKSUM FROM _MIGRATIONS"):
+            return FakeResult(["checksum"], [(row["checksum"],) for row in visible if row.get("checksum")])
+        if upper.startswith("SELECT 1 FROM _MIGRATIONS WHERE CHECKSUM"):
+            found = any(row.get("checksum") == params["checksum"] for row in visible)
+            return FakeResult(["?column?"], [(1,)] if found else [])
+        if "FROM PG_LOCKS" in upper:
+            return FakeResult(["mode", "relname"], self.server.locks)
+        if "FROM PG_INDEX" in upper:
+            found = params["name"] in self.server.invalid_indexes
+            return FakeResult(["?column?"], [(1,)] if found else [])
+        for pattern, (columns, rows) in self.server.results.items():
+            if pattern in sql:
+                return FakeResult(columns, rows, len(rows))
+        return FakeResult(rowcount=1)
+
+
+class FakeDialect:
+    name = "postgresql"
+
+
+class FakeEngine:
+    dialect = FakeDialect()
+
+    def __init__(self, server: Optional[FakeServer] = None):
+        self.server = server or FakeServer()
+        self.connections = 0
+
+    @asynccontextmanager
+    async def connect(self):
+        self.connections += 1
+        conn = FakeConnection(self.server)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()  # closing a connection rolls back its transaction
+
+    @asynccontextmanager
+    async def begin(self):
+        async with self.connect() as conn:
+            await conn.begin()
+            try:
+                yield conn
+            except BaseException:
+                await conn.rollback()
+                raise
+            await conn.commit()
+
+    async def dispose(self):
+        pass
+
+
+def fake_manager(engine: Optional[FakeEngine] = None, **kwargs) -> DatabaseManager:
+    """DatabaseManager whose only shard is engine."""
+    engine = engine or FakeEngine()
+    url = "postgresql+asyncpg://fake/xbasis"
+    return DatabaseManager(url, shard_map=ShardMap({DEFAULT_SHARD: url}, engine_factory=lambda _: engine), **kwargs)
@@ -0,0 +1,77 @@
+"""
+Local stub of Railway's GraphQL API for deployment monitor tests.
+
+Serves aliased `deployment(id: $var)` queries from an in-memory table on
+127.0.0.1 in a background thread. Unknown ids come back as null with an
+error entry, like the real API.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import json
+import re
+import threading
+
+FIELD = re.compile(r"(\w+):\s*deployment\(id:\s*\$(\w+)\)")
+
+
+class RailwayStub:
+    def __init__(self, api_key: str = "test-key"):
+        self.api_key = api_key
+        self.deployments: Dict[str, dict] = {}  # id -> {"status", "staticUrl"}
+        self.requests: List[dict] = []  # GraphQL payloads received
+        self.fail_next = 0  # answer this many requests with 500
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def set(self, deployment_id: str, status: str, static_url: Optional[str] = None):
+        self.deployments[deployment_id] = {"status": status, "staticUrl": static_url}
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/graphql/v2"
+
+    def answer(self, payload: dict) -> dict:
+        variables = payload.get("variables") or {}
+        data, errors = {}, []
+        for alias, variable in FIELD.findall(payload["query"]):
+            deployment_id = variables[variable]
+            node = self.deployments.get(deployment_id)
+            data[alias] = {"id": deployment_id, **node} if node else None
+            if node is None:
+                errors.append({"message": "Deployment not found", "path": [alias]})
+        return {"data": data, "errors": errors} if errors else {"data": data}
+
+    def start(self) -> "RailwayStub":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.requests.append(payload)
+                if self.headers.get("Authorization") != f"Bearer {stub.api_key}":
+                    return self.reply(401, {"errors": [{"message": "Not Authorized"}]})
+                if stub.fail_next:
+                    stub.fail_next -= 1
+                    return self.reply(500, {"errors": [{"message": "Internal error"}]})
+                self.reply(200, stub.answer(payload))
+
+            def reply(self, code: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
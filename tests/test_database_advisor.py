@@ -0,0 +1,98 @@
+"""
+Tests for index advisor plan heuristics.
+"""
+
+from src.api.database.advisor import (
+    IndexProposal, is_concurrent_index, is_covered, merge_proposals,
+    parse_index_statement, proposals_from_plan, without_concurrently,
+)
+
+
+def seq_scan(table: str, filter: str = "", alias: str = None) -> dict:
+    node = {"Node Type": "Seq Scan", "Relation Name": table, "Alias": alias or table, "Total Cost": 100.0}
+    if filter:
+        node["Filter"] = filter
+    return node
+
+
+def explain(plan: dict) -> list:
+    return [{"Plan": plan}]
+
+
+class TestProposalsFromPlan:
+    def test_equality_then_range(self):
+        plan = explain(seq_scan("orders", "((created_at > '2024-01-01'::date) AND (user_id = 42))"))
+        [proposal] = proposals_from_plan(plan, "abc")
+        assert proposal.table == "orders"
+        assert proposal.columns == ["user_id", "created_at"]
+        assert proposal.queries == ["abc"]
+
+    def test_sort_over_seq_scan(self):
+        plan = explain({
+            "Node Type": "Sort",
+            "Sort Key": ["posts.published_at DESC"],
+            "Plans": [seq_scan("posts", "(author_id = 7)")],
+        })
+        [proposal] = proposals_from_plan(plan)
+        assert proposal.columns == ["author_id", "published_at DESC"]
+
+    def test_skips_expressions_and_other_relations(self):
+        plan = explain({
+            "Node Type": "Hash Join",
+            "Plans": [
+                seq_scan("users", "((lower(email) = 'a@b.c'::text) AND (u.status = 'active'::text))", alias="u"),
+                {"Node Type": "Index Scan", "Relation Name": "orders"},
+            ],
+        })
+        [proposal] = proposals_from_plan(plan)
+        assert proposal.table == "users"
+        assert proposal.columns == ["status"]
+
+    def test_no_filter_no_proposal(self):
+        assert proposals_from_plan(explain(seq_scan("logs"))) == []
+
+    def test_accepts_json_text(self):
+        assert proposals_from_plan('[{"Plan": {"Node Type": "Seq Scan", "Relation Name": "t", "Filter": "(a = 1)"}}]')
+
+
+class TestMerge:
+    def test_prefix_dropped_and_queries_merged(self):
+        merged = merge_proposals([
+            IndexProposal("t", ["a"], "", queries=["q1"]),
+            IndexProposal("t", ["a", "b"], "", queries=["q2"]),
+            IndexProposal("t", ["a", "b"], "", queries=["q3"]),
+        ])
+        assert [(p.columns, p.queries) for p in merged] == [(["a", "b"], ["q2", "q3"])]
+
+    def test_covered_by_existing_index(self):
+        indexes = {"t": [["a", "b", "c"]]}
+        assert is_covered(IndexProposal("t", ["a", "b"], ""), indexes)
+        assert not is_covered(IndexProposal("t", ["b"], ""), indexes)
+
+
+class TestStatements:
+    def test_proposal_sql(self):
+        proposal = IndexProposal("orders", ["user_id", "created_at DESC"], "")
+        assert proposal.sql == (
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS "idx_orders_user_id_created_at" '
+            'ON "orders" ("user_id", "created_at" DESC)'
+        )
+        assert is_concurrent_index(proposal.sql)
+        assert without_concurrently(proposal.sql).startswith("CREATE INDEX IF NOT EXISTS")
+
+    def test_benefit(self):
+        proposal = IndexProposal("t", ["a"], "", cost_before=200.0, cost_after=50.0)
+        assert proposal.benefit == 0.75
+        assert IndexProposal("t", ["a"], "").benefit is None
+
+    def test_parse_ai_statement(self):
+        proposal = parse_index_statement('CREATE INDEX CONCURRENTLY idx_x ON "orders" (user_id, created_at desc);')
+        assert proposal.table == "orders"
+        assert proposal.columns == ["user_id", "created_at DESC"]
+        assert proposal.source == "ai"
+
+    def test_rejects_other_statements(self):
+        assert parse_index_statement("CREATE INDEX idx_x ON orders (user_id)") is None
+        assert parse_index_statement("DROP TABLE orders") is None
+        assert parse_index_statement("CREATE INDEX CONCURRENTLY i ON t (a); DROP TABLE t") is None
+        assert parse_index_statement("CREATE INDEX CONCURRENTLY i ON t (lower(a))") is None
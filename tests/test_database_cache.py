@@ -0,0 +1,140 @@
+"""
+Tests for the read-only query cache and read-only routing.
+"""
+
+import pytest
+
+from src.api.database.cache import QueryCache
+from src.api.database.manager import QueryResult
+
+from .fake_pg import FakeEngine, fake_manager
+
+
+def result(*rows) -> QueryResult:
+    return QueryResult(["x"], [list(row) for row in rows], len(rows))
+
+
+class TestQueryCache:
+    def test_hit_ignores_whitespace_and_semicolon(self):
+        cache = QueryCache()
+        cache.put(1, 0, "SELECT  *\n FROM t;", result([1]))
+        assert cache.get(1, 0, "SELECT * FROM t").rows == [[1]]
+        assert (cache.hits, cache.misses) == (1, 0)
+
+    def test_whitespace_inside_literals_is_part_of_the_key(self):
+        cache = QueryCache()
+        cache.put(1, 0, "SELECT * FROM t WHERE s = 'a  b'", result([1]))
+        assert cache.get(1, 0, "SELECT * FROM t WHERE s = 'a b'") is None
+        assert cache.get(1, 0, 'SELECT "a  b" FROM t') is None
+        assert cache.get(1, 0, "SELECT * FROM t WHERE s = 'a  b'") is not None
+
+    def test_new_version_misses(self):
+        cache = QueryCache()
+        cache.put(1, 0, "SELECT 1", result([1]))
+        assert cache.get(1, 1, "SELECT 1") is None
+        assert cache.get(2, 0, "SELECT 1") is None
+
+    def test_skips_errors_and_large_results(self):
+        cache = QueryCache(max_rows=2)
+        cache.put(1, 0, "SELECT 1", QueryResult([], [], 0, "boom"))
+        cache.put(1, 0, "SELECT 2", result([1], [2], [3]))
+        assert cache.get(1, 0, "SELECT 1") is None
+        assert cache.get(1, 0, "SELECT 2") is None
+
+    def test_lru_eviction(self):
+        cache = QueryCache(max_entries=2)
+        for sql in ("SELECT 1", "SELECT 2"):
+            cache.put(1, 0, sql, result([1]))
+        cache.get(1, 0, "SELECT 1")
+        cache.put(1, 0, "SELECT 3", result([1]))
+        assert cache.get(1, 0, "SELECT 2") is None
+        assert cache.get(1, 0, "SELECT 1") is not None
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=0)
+        cache.put(1, 0, "SELECT 1", result([1]))
+        assert cache.get(1, 0, "SELECT 1") is None
+
+
+@pytest.fixture
+def primary() -> FakeEngine:
+    engine = FakeEngine()
+    engine.server.results["FROM t"] = (["x"], [(1,)])
+    return engine
+
+
+class TestReadOnlyQueries:
+    async def test_cached_until_write(self, primary):
+        db = fake_manager(primary, query_cache=QueryCache())
+        first = await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert first.rows == [[1]]
+        await db.execute_sql(1, "SELECT  x FROM t;", readonly=True)
+        assert len(primary.server.executed("SELECT x FROM t")) == 1
+
+        await db.execute_sql(1, "INSERT INTO t VALUES (2)")
+        assert db.data_version(1) == 1
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert len(primary.server.executed("SELECT x FROM t")) == 2
+        assert db.query_cache.hits == 1
+
+    async def test_select_outside_readonly_invalidates(self, primary):
+        db = fake_manager(primary, query_cache=QueryCache())
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        await db.execute_sql(1, "SELECT bump_counter() FROM t")  # may write
+        assert db.data_version(1) == 1
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert len(primary.server.executed("SELECT x FROM t")) == 2
+
+    async def test_literal_whitespace_is_not_a_cache_hit(self, primary):
+        db = fake_manager(primary, query_cache=QueryCache())
+        await db.execute_sql(1, "SELECT x FROM t WHERE s = 'a  b'", readonly=True)
+        await db.execute_sql(1, "SELECT x FROM t WHERE s = 'a b'", readonly=True)
+        assert len(primary.server.executed("SELECT x FROM t WHERE")) == 2
+
+    async def test_runs_in_read_only_transaction(self, primary):
+        db = fake_manager(primary)
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert primary.server.statements[0] == ("SET TRANSACTION READ ONLY", "read only")
+        assert primary.server.executed("SELECT x FROM t") == [("SELECT x FROM t", "read only")]
+
+    @pytest.mark.parametrize("sql", [
+        "INSERT INTO t VALUES (1)",
+        "DELETE FROM t",
+        "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+    ])
+    async def test_rejects_non_select(self, primary, sql):
+        db = fake_manager(primary)
+        query_result = await db.execute_sql(1, sql, readonly=True)
+        assert query_result.error == "Only SELECT allowed in readonly mode"
+        assert primary.server.statements == []
+
+    async def test_write_smuggled_after_select_fails_in_read_only_transaction(self, primary):
+        db = fake_manager(primary, query_cache=QueryCache())
+        query_result = await db.execute_sql(1, "SELECT 1; DELETE FROM t", readonly=True)
+        assert "read-only transaction" in query_result.error
+        assert primary.server.commits == 0
+        assert db.data_version(1) == 0
+        assert len(db.query_cache._entries) == 0
+
+    async def test_routed_to_replica_except_after_write(self, primary):
+        replica = FakeEngine()
+        db = fake_manager(primary)
+        db.replica_engine = replica
+
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert replica.connections == 1 and primary.connections == 0
+
+        await db.execute_sql(1, "UPDATE t SET x = 2")
+        await db.execute_sql(1, "SELECT x FROM t", readonly=True)
+        assert replica.connections == 1 and primary.connections == 2  # read-your-writes
+
+        await db.execute_sql(2, "SELECT x FROM t", readonly=True)
+        assert replica.connections == 2
+
+    async def test_replica_rejects_writes(self, primary):
+        replica = FakeEngine()
+        db = fake_manager(primary)
+        db.replica_engine = replica
+        query_result = await db.execute_sql(1, "SELECT 1; UPDATE t SET x = 2", readonly=True)
+        assert "read-only transaction" in query_result.error
+        assert replica.server.executed("UPDATE t") == [("SELECT 1; UPDATE t SET x = 2", "read only")]
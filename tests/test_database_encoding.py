@@ -0,0 +1,115 @@
+"""
+Tests for the columnar result encodings.
+"""
+
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from uuid import UUID
+import json
+
+import pytest
+
+from src.api.database.encoding import (
+    COLUMNAR_JSON_MEDIA_TYPE,
+    column_type,
+    encode_columnar_json,
+    negotiate,
+    transpose,
+)
+from src.api.database.manager import QueryResult
+from src.api.database.router import columnar_response
+
+from .fake_pg import fake_manager
+
+ID = UUID("12345678-1234-5678-1234-567812345678")
+
+
+class TestColumnType:
+    @pytest.mark.parametrize("value, name", [
+        (True, "bool"),
+        (1, "int"),
+        (1.5, "float"),
+        ("x", "string"),
+        (Decimal("1.10"), "decimal"),
+        (datetime(2026, 1, 2, 3, 4, 5), "datetime"),
+        (date(2026, 1, 2), "date"),
+        (time(3, 4), "time"),
+        (timedelta(minutes=1), "interval"),
+        (ID, "uuid"),
+        ({"a": 1}, "json"),
+        ([1, 2], "json"),
+        (b"\x00", "bytes"),
+    ])
+    def test_detected_from_first_non_null(self, value, name):
+        assert column_type([None, value])[0] == name
+
+    def test_all_null(self):
+        assert column_type([None, None]) == ("null", None)
+
+
+class TestColumnarJson:
+    def test_scalars_and_nulls(self):
+        rows = [
+            [1, Decimal("1.10"), datetime(2026, 1, 2, 3, 4, 5), timedelta(seconds=90), ID, b"hi", None],
+            [None, None, None, None, None, None, None],
+        ]
+        payload = encode_columnar_json(["i", "d", "ts", "iv", "u", "b", "n"], rows)
+        assert [c["type"] for c in payload["columns"]] == ["int", "decimal", "datetime", "interval", "uuid", "bytes", "null"]
+        assert payload["data"] == [
+            [1, None],
+            ["1.10", None],
+            ["2026-01-02T03:04:05", None],
+            [90.0, None],
+            [str(ID), None],
+            ["aGk=", None],
+            [None, None],
+        ]
+        assert payload["row_count"] == 2
+
+    def test_arrays_and_json_of_non_json_types(self):
+        rows = [
+            [[date(2026, 1, 2), None], [ID], [Decimal("2.5")], {"at": datetime(2026, 1, 2), "tags": [ID]}],
+            [None, [], [[Decimal("1"), Decimal("2")]], {"n": None}],
+        ]
+        payload = encode_columnar_json(["dates", "ids", "nums", "doc"], rows)
+        assert [c["type"] for c in payload["columns"]] == ["json"] * 4
+        assert payload["data"] == [
+            [["2026-01-02", None], None],
+            [[str(ID)], []],
+            [["2.5"], [["1", "2"]]],
+            [{"at": "2026-01-02T00:00:00", "tags": [str(ID)]}, {"n": None}],
+        ]
+
+    def test_response_renders_arrays(self):
+        result = QueryResult(["ids"], [[[ID, ID]], [None]], 2)
+        response = columnar_response(result, COLUMNAR_JSON_MEDIA_TYPE)
+        assert json.loads(response.body)["data"] == [[[str(ID), str(ID)], None]]
+
+    def test_round_trip_matches_row_format(self):
+        """Transposed back, scalar columns equal what the row format returns."""
+        serialize = fake_manager()._serialize_value
+        rows = [
+            [1, 2.5, "x", True, Decimal("1.10"), date(2026, 1, 2), ID],
+            [None, None, None, False, None, None, None],
+            [3, -1.0, "", None, Decimal("-0"), date(1999, 12, 31), ID],
+        ]
+        payload = encode_columnar_json(list("abcdefg"), rows)
+        decoded = [list(row) for row in transpose(payload["data"], len(rows[0]))]
+        assert decoded == [[serialize(v) for v in row] for row in rows]
+
+    def test_empty_result(self):
+        payload = encode_columnar_json(["a", "b"], [])
+        assert payload == {
+            "columns": [{"name": "a", "type": "null"}, {"name": "b", "type": "null"}],
+            "data": [[], []],
+            "row_count": 0,
+        }
+
+
+class TestNegotiate:
+    def test_columnar_json(self):
+        assert negotiate(f"{COLUMNAR_JSON_MEDIA_TYPE}, application/json") == COLUMNAR_JSON_MEDIA_TYPE
+
+    def test_default(self):
+        assert negotiate(None) is None
+        assert negotiate("application/json") is None
@@ -0,0 +1,68 @@
+"""
+Tests for EXPLAIN-based cost guard.
+"""
+
+import pytest
+
+from src.api.database.guard import PLAN_QUERY_BUDGETS, CostGuard, QueryBudget
+
+
+@pytest.fixture
+def budget() -> QueryBudget:
+    return QueryBudget(max_cost=1000, max_rows=500, confirm_cost=100, max_timeout_ms=5000)
+
+
+def explain(cost: float, rows: int) -> list:
+    return [{"Plan": {"Node Type": "Seq Scan", "Total Cost": cost, "Plan Rows": rows}}]
+
+
+class TestEvaluate:
+    def test_cheap_query_allowed(self, budget: QueryBudget):
+        verdict = CostGuard().evaluate(explain(10, 5), budget)
+        assert verdict.allowed
+        assert not verdict.needs_confirmation
+        assert verdict.timeout_ms == budget.min_timeout_ms
+
+    def test_expensive_query_rejected(self, budget: QueryBudget):
+        verdict = CostGuard().evaluate(explain(5000, 5), budget)
+        assert not verdict.allowed
+        assert "too expensive" in verdict.reason
+
+    def test_too_many_rows_rejected(self, budget: QueryBudget):
+        verdict = CostGuard().evaluate(explain(10, 10_000), budget)
+        assert not verdict.allowed
+
+    def test_confirmation_required(self, budget: QueryBudget):
+        verdict = CostGuard().evaluate(explain(500, 5), budget)
+        assert verdict.allowed
+        assert verdict.needs_confirmation
+
+    def test_timeout_capped_by_budget(self):
+        budget = QueryBudget(max_cost=10**9, max_rows=10**9, confirm_cost=10**9, max_timeout_ms=2000)
+        verdict = CostGuard().evaluate(explain(10**8, 1), budget)
+        assert verdict.timeout_ms == 2000
+
+    def test_floor_never_exceeds_plan_limit(self):
+        budget = QueryBudget(max_cost=1000, max_rows=500, confirm_cost=100, max_timeout_ms=500)
+        assert CostGuard().evaluate(explain(1, 1), budget).timeout_ms == 500
+
+    def test_json_string_input(self, budget: QueryBudget):
+        verdict = CostGuard().evaluate('[{"Plan": {"Total Cost": 1, "Plan Rows": 1}}]', budget)
+        assert verdict.allowed
+
+    def test_unknown_plan_uses_free_budget(self):
+        guard = CostGuard()
+        assert guard.get_budget("unknown") == guard.get_budget("free")
+
+
+class TestPlanBudgets:
+    def test_budget_ordering(self):
+        for budget in PLAN_QUERY_BUDGETS.values():
+            assert budget.min_timeout_ms <= budget.max_timeout_ms
+            assert budget.confirm_cost <= budget.max_cost
+        plans = [PLAN_QUERY_BUDGETS[plan] for plan in ("free", "pro", "team", "enterprise")]
+        for smaller, larger in zip(plans, plans[1:]):
+            assert smaller.max_cost <= larger.max_cost
+            assert smaller.max_rows <= larger.max_rows
+            assert smaller.confirm_cost <= larger.confirm_cost
+            assert smaller.max_timeout_ms <= larger.max_timeout_ms
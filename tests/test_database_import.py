@@ -0,0 +1,69 @@
+"""
+Tests for streaming CSV / NDJSON import helpers.
+"""
+
+import pytest
+
+from src.api.database.importer import (
+    ImportFormatError, ImportProgress, validate_columns,
+    read_csv_header, csv_body, read_ndjson_columns, ndjson_body,
+)
+from src.api.database.manager import ColumnInfo
+
+
+async def chunked(data: bytes, size: int = 5):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def columns() -> list:
+    return [
+        ColumnInfo(name="id", type="integer", nullable=False, default="nextval('t_id_seq')", is_primary=True),
+        ColumnInfo(name="name", type="text", nullable=False),
+        ColumnInfo(name="meta", type="jsonb", nullable=True),
+    ]
+
+
+class TestValidateColumns:
+    def test_valid(self, columns: list):
+        assert validate_columns(["name", "meta"], columns) is None
+
+    def test_unknown_column(self, columns: list):
+        assert "Unknown columns: age" == validate_columns(["name", "age"], columns)
+
+    def test_missing_required(self, columns: list):
+        assert "name" in validate_columns(["meta"], columns)
+
+
+class TestCsv:
+    async def test_header_and_body(self):
+        progress = ImportProgress(table="t", format="csv")
+        chunks = chunked(b"name,meta\r\nalice,\nbob,\n")
+        names, first = await read_csv_header(chunks, progress)
+        body = b"".join([c async for c in csv_body(first, chunks, progress)])
+        assert names == ["name", "meta"]
+        assert body == b"alice,\nbob,\n"
+        assert progress.rows == 2
+
+    async def test_empty_upload(self):
+        with pytest.raises(ImportFormatError):
+            await read_csv_header(chunked(b""), ImportProgress(table="t", format="csv"))
+
+
+class TestNdjson:
+    async def test_converts_to_csv(self):
+        progress = ImportProgress(table="t", format="ndjson")
+        chunks = chunked(b'{"name": "a\\"b", "meta": {"k": 1}}\n\n{"name": "c"}')
+        names, first = await read_ndjson_columns(chunks, progress)
+        body = b"".join([c async for c in ndjson_body(first, chunks, names, progress)])
+        assert names == ["name", "meta"]
+        assert body == b'"a""b","{""k"": 1}"\n"c",\n'
+        assert progress.rows == 2
+
+    async def test_unknown_key_on_later_line(self):
+        progress = ImportProgress(table="t", format="ndjson")
+        chunks = chunked(b'{"name": "a"}\n{"name": "b", "age": 3}\n')
+        names, first = await read_ndjson_columns(chunks, progress)
+        with pytest.raises(ImportFormatError):
+            [c async for c in ndjson_body(first, chunks, names, progress)]
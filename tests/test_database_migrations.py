@@ -0,0 +1,93 @@
+"""
+Tests for batched project migrations (fake Postgres).
+"""
+
+import pytest
+
+from src.api.database.manager import MigrationStep
+
+from .fake_pg import FakeEngine, fake_manager
+
+CREATE = MigrationStep("CREATE TABLE t (id int)", "create t")
+ALTER = MigrationStep("ALTER TABLE t ADD COLUMN name text", "add name")
+INDEX = MigrationStep("CREATE INDEX CONCURRENTLY ix_t_name ON t (name)", "index name")
+
+
+@pytest.fixture
+def engine() -> FakeEngine:
+    return FakeEngine()
+
+
+class TestApplyMigrations:
+    async def test_batch_runs_in_one_transaction_with_lock_timeout(self, engine):
+        result = await fake_manager(engine).apply_migrations(1, [CREATE, ALTER])
+        assert result.error is None
+        assert [step.status for step in result.steps] == ["applied", "applied"]
+        modes = {mode for _, mode in engine.server.statements}
+        assert modes == {"transaction"}
+        assert engine.server.executed("SET LOCAL lock_timeout = '3000ms'")
+        assert engine.server.commits == 1
+        assert [row["checksum"] for row in engine.server.migrations] == [CREATE.checksum, ALTER.checksum]
+
+    async def test_applied_checksums_are_skipped(self, engine):
+        manager = fake_manager(engine)
+        await manager.apply_migrations(1, [CREATE])
+        result = await manager.apply_migrations(1, [MigrationStep(" CREATE TABLE t (id int)\n", "same"), ALTER])
+        assert [step.status for step in result.steps] == ["skipped", "applied"]
+        assert len(engine.server.executed("CREATE TABLE t")) == 1
+
+    async def test_changed_sql_does_not_match_checksum(self, engine):
+        manager = fake_manager(engine)
+        await manager.apply_migrations(1, [CREATE])
+        changed = MigrationStep("CREATE TABLE t (id bigint)", "create t")
+        assert changed.checksum != CREATE.checksum
+        result = await manager.apply_migrations(1, [changed])
+        assert result.steps[0].status == "applied"
+        assert len(engine.server.migrations) == 2
+
+    async def test_failed_step_leaves_no_partial_batch(self, engine):
+        engine.server.fail["ADD COLUMN name"] = "lock timeout"
+        result = await fake_manager(engine).apply_migrations(1, [CREATE, ALTER])
+        assert "add name" in result.error and "lock timeout" in result.error
+        assert [step.status for step in result.steps] == ["not_run", "failed"]
+        assert engine.server.migrations == []
+        assert (engine.server.commits, engine.server.rollbacks) == (0, 1)
+
+    async def test_dry_run_rolls_back(self, engine):
+        result = await fake_manager(engine).apply_migrations(1, [CREATE, INDEX], dry_run=True)
+        assert result.error is None and result.dry_run
+        assert [step.status for step in result.steps] == ["dry_run", "dry_run"]
+        assert engine.server.executed("CREATE INDEX ix_t_name ON t (name)")  # without CONCURRENTLY
+        assert not engine.server.executed("CONCURRENTLY")
+        assert engine.server.migrations == []
+        assert (engine.server.commits, engine.server.rollbacks) == (0, 1)
+
+
+class TestConcurrentIndex:
+    async def test_runs_in_autocommit_outside_a_batch(self, engine):
+        result = await fake_manager(engine).apply_migrations(1, [INDEX])
+        assert result.error is None and result.steps[0].status == "applied"
+        assert engine.server.executed("CONCURRENTLY") == [(INDEX.sql, "autocommit")]
+        assert engine.server.executed("SET lock_timeout = '3000ms'")
+        assert engine.server.executed("RESET lock_timeout")
+        assert [row["checksum"] for row in engine.server.migrations] == [INDEX.checksum]
+
+    async def test_rejected_in_a_batch(self, engine):
+        result = await fake_manager(engine).apply_migrations(1, [CREATE, INDEX])
+        assert "separate migration" in result.error
+        assert engine.server.statements == []
+
+    async def test_already_applied_is_skipped(self, engine):
+        manager = fake_manager(engine)
+        await manager.apply_migrations(1, [INDEX])
+        result = await manager.apply_migrations(1, [INDEX])
+        assert result.steps[0].status == "skipped"
+        assert len(engine.server.executed("CONCURRENTLY")) == 1
+
+    async def test_failed_build_drops_invalid_index(self, engine):
+        engine.server.fail["CONCURRENTLY"] = "deadlock detected"
+        engine.server.invalid_indexes.append("ix_t_name")
+        result = await fake_manager(engine).apply_migrations(1, [INDEX])
+        assert result.steps[0].status == "failed" and "deadlock" in result.error
+        assert engine.server.executed("DROP INDEX")
+        assert engine.server.migrations == []
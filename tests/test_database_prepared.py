@@ -0,0 +1,87 @@
+"""
+Tests for the prepared-statement cache (fake asyncpg connection).
+"""
+
+from asyncpg.exceptions import InvalidCachedStatementError
+
+from src.api.database.prepared import PinnedConnection, PreparedStatementCache
+
+
+class FakeAttribute:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeStatement:
+    def __init__(self, sql, fail_once=False):
+        self.sql = sql
+        self.fail_once = fail_once
+
+    async def fetch(self, timeout=None):
+        if self.fail_once:
+            self.fail_once = False
+            raise InvalidCachedStatementError("cached plan must not change result type")
+        return [(1,)]
+
+    def get_attributes(self):
+        return [FakeAttribute("x")]
+
+
+class FakeRaw:
+    def __init__(self):
+        self.prepared = []
+        self.fail_next = False
+
+    async def prepare(self, sql, timeout=None):
+        self.prepared.append(sql)
+        statement = FakeStatement(sql, fail_once=self.fail_next)
+        self.fail_next = False
+        return statement
+
+    def is_closed(self):
+        return False
+
+
+def pinned_cache(**kwargs):
+    cache = PreparedStatementCache(**kwargs)
+    pinned = PinnedConnection(1, conn=None, raw=FakeRaw(), schema_version=0)
+    cache.pinned[1] = pinned
+    return cache, pinned
+
+
+class TestPreparedStatementCache:
+    async def test_reuses_statement_for_same_normalized_sql(self):
+        cache, pinned = pinned_cache()
+        assert await cache.fetch(pinned, "SELECT 1", 1) == (["x"], [(1,)])
+        await cache.fetch(pinned, "SELECT  1;", 1)
+        assert pinned.raw.prepared == ["SELECT 1"]
+        assert (pinned.hits, pinned.misses) == (1, 1)
+
+    async def test_lru_eviction(self):
+        cache, pinned = pinned_cache(max_statements=2)
+        for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"):
+            await cache.fetch(pinned, sql, 1)
+        assert list(pinned.statements) == ["SELECT 1", "SELECT 3"]
+
+    async def test_schema_version_change_clears(self):
+        cache, pinned = pinned_cache()
+        await cache.fetch(pinned, "SELECT 1", 1)
+
+        acquired = await cache.acquire(1, engine=None, schema="project_1", schema_version=0)
+        assert acquired is pinned and pinned.statements
+        acquired.lock.release()
+
+        acquired = await cache.acquire(1, engine=None, schema="project_1", schema_version=1)
+        assert not pinned.statements
+        acquired.lock.release()
+
+    async def test_busy_connection_not_awaited(self):
+        cache, pinned = pinned_cache()
+        await pinned.lock.acquire()
+        assert await cache.acquire(1, engine=None, schema="project_1", schema_version=0) is None
+
+    async def test_reprepares_after_result_type_change(self):
+        cache, pinned = pinned_cache()
+        pinned.raw.fail_next = True
+        assert await cache.fetch(pinned, "SELECT * FROM t", 1) == (["x"], [(1,)])
+        assert len(pinned.raw.prepared) == 2
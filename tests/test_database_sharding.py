@@ -0,0 +1,47 @@
+"""
+Tests for project schema shard map.
+"""
+
+import pytest
+
+from src.api.database.sharding import ShardMap
+
+
+def make_map(names, **kwargs) -> ShardMap:
+    return ShardMap({name: f"postgresql+asyncpg://{name}/xbasis" for name in names}, engine_factory=lambda url: url, **kwargs)
+
+
+class TestShardMap:
+    def test_requires_default_shard(self):
+        with pytest.raises(ValueError):
+            make_map(["a", "b"])
+
+    def test_single_shard(self):
+        shard_map = make_map(["default"])
+        assert {shard_map.shard_for(i) for i in range(100)} == {"default"}
+
+    def test_spreads_projects(self):
+        shard_map = make_map(["default", "a", "b"])
+        counts = {}
+        for i in range(3000):
+            shard = shard_map.shard_for(i)
+            counts[shard] = counts.get(shard, 0) + 1
+        assert set(counts) == {"default", "a", "b"}
+        assert min(counts.values()) > 700
+
+    def test_adding_shard_moves_few_projects(self):
+        before = make_map(["default", "a", "b"])
+        after = make_map(["default", "a", "b", "c"])
+        moved = sum(before.shard_for(i) != after.shard_for(i) for i in range(3000))
+        assert moved < 3000 * 0.35
+        assert all(after.shard_for(i) == "c" for i in range(3000) if before.shard_for(i) != after.shard_for(i))
+
+    def test_override_wins(self):
+        shard_map = make_map(["default", "a"], overrides={7: "a"})
+        assert shard_map.shard_for(7) == "a"
+
+    def test_engine_per_shard(self):
+        shard_map = make_map(["default", "a"])
+        assert shard_map.engine("a") == "postgresql+asyncpg://a/xbasis"
+        with pytest.raises(ValueError):
+            shard_map.engine("missing")
@@ -0,0 +1,109 @@
+"""
+Tests for snapshot archive reading.
+"""
+
+import json
+import struct
+import zlib
+
+import pytest
+
+from src.api.database.snapshot import MAGIC, SnapshotError, SnapshotProgress, SnapshotReader, check_ddl
+
+
+def frame(kind: bytes, payload: bytes = b"") -> bytes:
+    return kind + struct.pack(">I", len(payload)) + payload
+
+
+def archive(*frames: bytes, magic: bytes = MAGIC) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(magic + b"".join(frames)) + compressor.flush()
+
+
+async def chunked(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+MANIFEST = frame(b"M", json.dumps({
+    "version": 1, "schema": "project_1", "tables": ["t"],
+    "copy_columns": {"t": ["id"]}, "pre_data": [], "post_data": [],
+}).encode())
+
+
+class TestSnapshotReader:
+    async def test_reads_frames(self):
+        data = archive(MANIFEST, frame(b"T", b'{"table": "t"}'), frame(b"D", b"abc"), frame(b"D", b"def"), frame(b"E"), frame(b"Z"))
+        progress = SnapshotProgress(operation="restore")
+        reader = SnapshotReader(chunked(data), progress)
+
+        manifest = await reader.manifest()
+        assert manifest["tables"] == ["t"]
+        assert await reader.frame() == (b"T", b'{"table": "t"}')
+        assert [chunk async for chunk in reader.table_data()] == [b"abc", b"def"]
+        assert await reader.frame() == (b"Z", b"")
+        await reader.finish()
+        assert progress.bytes_compressed == len(data)
+
+    async def test_rejects_other_files(self):
+        reader = SnapshotReader(chunked(archive(MANIFEST, magic=b"NOTSNAP\n")), SnapshotProgress("restore"))
+        with pytest.raises(SnapshotError):
+            await reader.manifest()
+
+    async def test_truncated(self):
+        data = archive(MANIFEST, frame(b"T", b'{"table": "t"}'), frame(b"D", b"abc"))
+        reader = SnapshotReader(chunked(data), SnapshotProgress("restore"))
+        await reader.manifest()
+        await reader.frame()
+        with pytest.raises(SnapshotError):
+            [chunk async for chunk in reader.table_data()]
+
+    async def test_corrupt_trailer(self):
+        data = bytearray(archive(MANIFEST, frame(b"Z")))
+        data[-8] ^= 0xFF  # CRC32
+        reader = SnapshotReader(chunked(bytes(data)), SnapshotProgress("restore"))
+        await reader.manifest()
+        await reader.frame()
+        with pytest.raises(SnapshotError):
+            await reader.finish()
+
+    async def test_decompression_is_bounded(self):
+        data = archive(MANIFEST, frame(b"T", b'{"table": "t"}'), frame(b"D", b"\0" * 5_000_000), frame(b"E"), frame(b"Z"))
+        reader = SnapshotReader(chunked(data, 1 << 16), SnapshotProgress("restore"))
+        await reader.manifest()
+        await reader.frame()
+        assert len(reader.buffer) < 1 << 20
+        [chunk] = [chunk async for chunk in reader.table_data()]
+        assert len(chunk) == 5_000_000
+
+
+class TestCheckDDL:
+    def test_accepts_introspected_statements(self):
+        assert check_ddl('CREATE TABLE "t" ("id" integer)')
+        assert check_ddl("SELECT setval('\"t_id_seq\"', 5, true)")
+        assert check_ddl('ALTER SEQUENCE "t_id_seq" OWNED BY "t"."id"')
+        assert check_ddl(
+            "SELECT setval(pg_get_serial_sequence('\"t\"', 'id'), "
+            '(SELECT COALESCE(MAX("id"), 0) + 1 FROM "t"), false)'
+        )
+        assert check_ddl('CREATE INDEX ix_t_name ON t USING btree (lower((name)::text))')
+        assert check_ddl("""ALTER TABLE "t" ADD CONSTRAINT "c" CHECK (((price > 1.5) AND (name <> 'a;b."c"')))""")
+        assert check_ddl("""CREATE TABLE "t" ("id" integer DEFAULT nextval('t_id_seq'::regclass), "n" pg_catalog.int4)""")
+
+    def test_rejects_anything_else(self):
+        with pytest.raises(SnapshotError):
+            check_ddl('DROP SCHEMA "project_2" CASCADE')
+
+    @pytest.mark.parametrize("statement", [
+        'ALTER TABLE "project_7".users ADD COLUMN x int',
+        'ALTER TABLE "t" ADD CONSTRAINT "f" FOREIGN KEY (a) REFERENCES project_7.users(id)',
+        "SELECT setval('s', 1), pg_sleep(1)",
+        "SELECT setval('\"project_7\".\"s\"', 1, true)",
+        'CREATE TABLE "t" (id int); DROP SCHEMA "project_2" CASCADE',
+        'CREATE TABLE "t" (id int) -- trailing',
+        "CREATE TABLE \"t\" (s text DEFAULT E'\\'' )",
+        'CREATE TABLE "t" (s text DEFAULT $$x$$)',
+    ])
+    def test_rejects_statements_leaving_the_schema(self, statement):
+        with pytest.raises(SnapshotError):
+            check_ddl(statement)
@@ -0,0 +1,48 @@
+"""
+Tests for query statistics collector.
+"""
+
+from src.api.database.sqltext import fingerprint_sql
+from src.api.database.stats import LatencyHistogram, QueryStatsCollector
+
+
+class TestFingerprint:
+    def test_literals_replaced(self):
+        assert fingerprint_sql("SELECT * FROM users WHERE id = 42 AND name = 'bob'") == \
+            "select * from users where id = ? and name = ?"
+
+    def test_in_list_collapsed(self):
+        assert fingerprint_sql("select 1 from t where id in (1, 2, 3)") == fingerprint_sql("select 1 from t where id in (7)")
+
+
+class TestLatencyHistogram:
+    def test_percentiles_within_error(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 100_001):
+            histogram.record(value)
+        assert abs(histogram.percentile(50) - 50_000) / 50_000 < 0.02
+        assert abs(histogram.percentile(99) - 99_000) / 99_000 < 0.02
+        assert histogram.max_us == 100_000
+
+    def test_empty(self):
+        assert LatencyHistogram().percentile(95) == 0
+
+
+class TestCollector:
+    def test_groups_by_fingerprint(self):
+        stats = QueryStatsCollector(slow_ms=100)
+        stats.record(1, "select * from t where id = 1", 5.0, rows=1)
+        stats.record(1, "select * from t where id = 2", 150.0, rows=1)
+        stats.record(1, "select * from other", 1.0, error_class="UndefinedTableError")
+
+        top = stats.top(1, by="calls")
+        assert top[0].calls == 2
+        assert top[0].example == "select * from t where id = 2"
+        assert stats.top(1, by="p95")[0].query == "select * from t where id = ?"
+        assert [q.duration_ms for q in stats.slow_queries(1)] == [150.0]
+
+    def test_bounded_per_project(self):
+        stats = QueryStatsCollector(max_statements=3)
+        for i in range(10):
+            stats.record(1, f"select * from t{i}", 1.0)
+        assert len(stats.projects[1]) == 3
@@ -0,0 +1,53 @@
+"""
+Tests for storage quota checks.
+"""
+
+from src.api.database.usage import MB, PLAN_STORAGE_LIMITS, ProjectUsage, StorageSampler
+
+
+def sampler_with(project_id: int, total_bytes: int) -> StorageSampler:
+    sampler = StorageSampler()
+    sampler.latest[project_id] = ProjectUsage(project_id, "default", total_bytes, {"t": total_bytes})
+    return sampler
+
+
+class TestStorageQuota:
+    def test_under_limit_allows_writes(self):
+        sampler = sampler_with(1, 10 * MB)
+        assert sampler.check_write(1, "free", "INSERT INTO t VALUES (1)") is None
+
+    def test_over_limit_blocks_growth(self):
+        sampler = sampler_with(1, PLAN_STORAGE_LIMITS["free"] + 1)
+        assert sampler.over_limit(1, "free")
+        assert "Storage limit exceeded" in sampler.check_write(1, "free", "INSERT INTO t VALUES (1)")
+        assert sampler.check_write(1, "free") is not None  # imports, migrations
+
+    def test_over_limit_allows_shrinking(self):
+        sampler = sampler_with(1, PLAN_STORAGE_LIMITS["free"] + 1)
+        for sql in (
+            "DELETE FROM t", "  drop table t", "TRUNCATE t", "SELECT 1", "SELECT * FROM t FOR UPDATE",
+            "WITH x AS (SELECT 1) SELECT * FROM x", "SELECT 'insert into' AS s", "EXPLAIN INSERT INTO t VALUES (1)",
+            "EXPLAIN ANALYZE SELECT 1",
+        ):
+            assert sampler.check_write(1, "free", sql) is None, sql
+
+    def test_over_limit_blocks_writing_reads(self):
+        sampler = sampler_with(1, PLAN_STORAGE_LIMITS["free"] + 1)
+        for sql in (
+            "WITH x AS (SELECT 1) INSERT INTO t SELECT generate_series(1, 100000000)",
+            "WITH moved AS (DELETE FROM a RETURNING *) INSERT INTO b SELECT * FROM moved",
+            "SELECT * INTO big FROM generate_series(1, 100000000)",
+            "select g into big from generate_series(1, 10) g",
+            "EXPLAIN ANALYZE INSERT INTO t SELECT generate_series(1, 100000000)",
+        ):
+            assert "Storage limit exceeded" in sampler.check_write(1, "free", sql), sql
+
+    def test_limit_follows_plan(self):
+        sampler = sampler_with(1, PLAN_STORAGE_LIMITS["free"] + 1)
+        assert sampler.check_write(1, "pro", "INSERT INTO t VALUES (1)") is None
+
+    def test_unknown_project_or_plan(self):
+        sampler = sampler_with(1, PLAN_STORAGE_LIMITS["free"] + 1)
+        assert sampler.check_write(2, "free", "INSERT INTO t VALUES (1)") is None
+        assert sampler.check_write(1, None, "INSERT INTO t VALUES (1)") is None
+        assert sampler.get_limit("unknown") == PLAN_STORAGE_LIMITS["free"]
@@ -0,0 +1,167 @@
+"""
+Tests for the deployment monitor against a local Railway stub.
+"""
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.api.core.database import Base
+from src.api.deploy.monitor import NO_RAILWAY_ID, DeploymentMonitor, batch_query
+from src.api.models.project import Deployment, Project, ProjectStatus
+from src.api.models.user import User
+
+from .railway_stub import RailwayStub
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine)() as session:
+        session.add(User(id=1, email="a@example.com", password_hash="x", name="A"))
+        session.add(Project(id=1, name="p", slug="p", owner_id=1, status=ProjectStatus.BUILDING))
+        session.add(Project(id=2, name="q", slug="q", owner_id=1, status=ProjectStatus.BUILDING))
+        await session.commit()
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def railway():
+    stub = RailwayStub().start()
+    yield stub
+    stub.stop()
+
+
+async def add_deployments(engine, *rows):
+    async with async_sessionmaker(engine)() as session:
+        for deployment_id, project_id, railway_id in rows:
+            session.add(Deployment(
+                id=deployment_id, project_id=project_id, status="building", railway_deployment_id=railway_id,
+            ))
+        await session.commit()
+
+
+async def deployments(engine):
+    async with engine.connect() as conn:
+        rows = (await conn.execute(select(Deployment.id, Deployment.status, Deployment.finished_at, Deployment.url))).all()
+    return {row.id: row for row in rows}
+
+
+def monitor(engine, railway, **kwargs):
+    return DeploymentMonitor(engine, api_url=railway.url, api_key=railway.api_key, min_interval=5, **kwargs)
+
+
+class TestBatchQuery:
+    def test_aliases_and_variables(self):
+        query, variables = batch_query(["r1", "r2"])
+        assert variables == {"d0": "r1", "d1": "r2"}
+        assert "$d0: String!, $d1: String!" in query
+        assert "d1: deployment(id: $d1) { id status staticUrl }" in query
+
+
+class TestDeploymentMonitor:
+    async def test_one_request_for_all_due_deployments(self, engine, railway):
+        await add_deployments(engine, (1, 1, "r1"), (2, 2, "r2"))
+        railway.set("r1", "SUCCESS", "p.up.railway.app")
+        railway.set("r2", "BUILDING")
+        deployments_monitor = monitor(engine, railway)
+
+        delay = await deployments_monitor.tick()
+        assert len(railway.requests) == 1
+        rows = await deployments(engine)
+        assert rows[1].status == "live" and rows[1].finished_at is not None
+        assert rows[1].url == "https://p.up.railway.app"
+        assert rows[2].status == "building" and rows[2].finished_at is None
+        assert 0 < delay <= 5
+
+        async with engine.connect() as conn:
+            projects = dict((await conn.execute(select(Project.id, Project.status))).all())
+            deployed_at = await conn.scalar(select(Project.last_deployed_at).where(Project.id == 1))
+        assert projects == {1: ProjectStatus.DEPLOYED, 2: ProjectStatus.BUILDING}
+        assert deployed_at is not None
+
+    async def test_batches_split_by_size(self, engine, railway):
+        await add_deployments(engine, *[(i, 1, f"r{i}") for i in range(1, 6)])
+        for i in range(1, 6):
+            railway.set(f"r{i}", "FAILED")
+        await monitor(engine, railway, batch_size=2).tick()
+        assert len(railway.requests) == 3
+        assert {row.status for row in (await deployments(engine)).values()} == {"failed"}
+
+    async def test_unchanged_status_backs_off(self, engine, railway):
+        await add_deployments(engine, (1, 1, "r1"))
+        railway.set("r1", "BUILDING")
+        deployments_monitor = monitor(engine, railway, max_interval=8)
+        await deployments_monitor.tick()
+        assert deployments_monitor.tracked[1].interval == 5
+        await deployments_monitor.tick()  # not due yet: no request
+        assert len(railway.requests) == 1
+
+        for tracked in deployments_monitor.tracked.values():
+            tracked.next_poll = 0
+        await deployments_monitor.tick()
+        assert deployments_monitor.tracked[1].interval == 7.5
+        tracked = deployments_monitor.tracked[1]
+        tracked.next_poll = 0
+        await deployments_monitor.tick()
+        assert deployments_monitor.tracked[1].interval == 8  # capped
+
+        railway.set("r1", "DEPLOYING")
+        deployments_monitor.tracked[1].next_poll = 0
+        await deployments_monitor.tick()
+        assert deployments_monitor.tracked[1].interval == 5
+        assert (await deployments(engine))[1].status == "deploying"
+
+    async def test_railway_errors_leave_rows_alone(self, engine, railway):
+        await add_deployments(engine, (1, 1, "r1"), (2, 1, "unknown"))
+        railway.set("r1", "SUCCESS")
+        railway.fail_next = 1
+        deployments_monitor = monitor(engine, railway)
+        await deployments_monitor.tick()
+        assert {row.status for row in (await deployments(engine)).values()} == {"building"}
+
+        for tracked in deployments_monitor.tracked.values():
+            tracked.next_poll = 0
+        await deployments_monitor.tick()
+        rows = await deployments(engine)
+        assert rows[1].status == "live" and rows[2].status == "building"
+
+    async def test_cancelled_meanwhile_is_not_overwritten(self, engine, railway):
+        await add_deployments(engine, (1, 1, "r1"))
+        railway.set("r1", "SUCCESS")
+        deployments_monitor = monitor(engine, railway)
+        async with engine.connect() as conn:
+            row = (await conn.execute(select(
+                Deployment.id, Deployment.project_id, Deployment.status, Deployment.railway_deployment_id,
+            ))).one()
+        changes = await deployments_monitor._poll([row])
+        async with engine.begin() as conn:
+            await conn.execute(Deployment.__table__.update().values(status="cancelled"))
+        async with engine.begin() as conn:
+            await deployments_monitor._store(conn, changes, {row.id: row})
+        assert (await deployments(engine))[1].status == "cancelled"
+        async with engine.connect() as conn:
+            assert await conn.scalar(select(Project.status).where(Project.id == 1)) == ProjectStatus.BUILDING
+
+    async def test_without_api_key_deployments_go_live(self, engine, railway):
+        await add_deployments(engine, (1, 1, "deploy-1-preview"))
+        deployments_monitor = DeploymentMonitor(engine, api_url=railway.url, api_key="")
+        assert await deployments_monitor.tick() == deployments_monitor.max_interval
+        assert railway.requests == []
+        assert (await deployments(engine))[1].status == "live"
+        assert deployments_monitor.tracked == {}
+
+    async def test_without_railway_id_deployment_fails(self, engine, railway):
+        await add_deployments(engine, (1, 1, None), (2, 2, "r2"))
+        railway.set("r2", "BUILDING")
+        await monitor(engine, railway).tick()
+        rows = await deployments(engine)
+        assert rows[1].status == "failed" and rows[1].finished_at is not None
+        assert rows[2].status == "building"
+        async with engine.connect() as conn:
+            assert await conn.scalar(select(Deployment.build_logs).where(Deployment.id == 1)) == NO_RAILWAY_ID
+            assert await conn.scalar(select(Project.status).where(Project.id == 1)) == ProjectStatus.FAILED
@@ -0,0 +1,256 @@
+"""
+Tests for the webhook deploy job queue.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.api.core.database import Base
+from src.api.deploy.queue import DeferJob, DeployQueue, SkipJob
+from src.api.models.project import DeployJob, Project
+from src.api.models.user import User
+
+
+@pytest.fixture
+async def sessions():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with factory() as session:
+        session.add(User(id=1, email="a@example.com", password_hash="x", name="A"))
+        session.add(Project(id=1, name="p", slug="p", owner_id=1))
+        session.add(Project(id=2, name="q", slug="q", owner_id=1))
+        await session.commit()
+    yield factory
+    await engine.dispose()
+
+
+class Handler:
+    def __init__(self, fail=0, skip=False, defer=0):
+        self.fail = fail
+        self.skip = skip
+        self.defer = defer
+        self.calls = []
+
+    async def __call__(self, session, job):
+        self.calls.append(job.commit_sha)
+        if self.skip:
+            raise SkipJob("nothing to do")
+        if self.defer:
+            self.defer -= 1
+            raise DeferJob("deploying")
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("railway down")
+        return 100 + job.id
+
+
+async def enqueue(queue, sessions, project_id, sha, repo="o/r", pushed_at=None):
+    async with sessions() as session:
+        job_id = await queue.enqueue(session, project_id, repo, sha, "msg", pushed_at=pushed_at)
+        await session.commit()
+    return job_id
+
+
+async def jobs(sessions):
+    async with sessions() as session:
+        return {job.id: job for job in (await session.scalars(select(DeployJob))).all()}
+
+
+class TestEnqueue:
+    async def test_duplicate_push_is_not_queued(self, sessions):
+        queue = DeployQueue(sessions, Handler())
+        first = await enqueue(queue, sessions, 1, "a" * 40)
+        assert first is not None
+        assert await enqueue(queue, sessions, 1, "a" * 40) is None
+        assert await enqueue(queue, sessions, 1, "a" * 40, repo="o/other") is not None
+        assert queue.stats()["duplicates"] == 1
+
+    async def test_redelivery_of_finished_commit_is_not_queued(self, sessions):
+        queue = DeployQueue(sessions, Handler())
+        first = await enqueue(queue, sessions, 1, "a" * 40)
+        assert await queue.run_once()
+        assert (await jobs(sessions))[first].status == "done"
+        assert await enqueue(queue, sessions, 1, "a" * 40) is None
+        assert len(await jobs(sessions)) == 1
+
+
+class TestClaim:
+    async def test_one_job_per_project_at_a_time(self, sessions):
+        queue = DeployQueue(sessions, Handler())
+        a = await enqueue(queue, sessions, 1, "a")
+        assert await queue.claim() == a
+        b = await enqueue(queue, sessions, 1, "b")
+        c = await enqueue(queue, sessions, 2, "c")
+
+        assert await queue.claim() == c  # b waits for a
+        assert await queue.claim() is None
+
+        await queue.process(a)
+        assert await queue.claim() == b
+
+    async def test_expired_lease_is_claimed_again(self, sessions):
+        queue = DeployQueue(sessions, Handler())
+        job_id = await enqueue(queue, sessions, 1, "a")
+        assert await queue.claim() == job_id
+        assert await queue.claim() is None
+
+        async with sessions() as session:
+            await session.execute(
+                update(DeployJob).values(run_after=datetime.utcnow() - timedelta(seconds=1))
+            )
+            await session.commit()
+        assert await queue.claim() == job_id
+        assert (await jobs(sessions))[job_id].attempts == 2
+
+
+class TestProcess:
+    async def test_done_records_deployment(self, sessions):
+        done = []
+        queue = DeployQueue(sessions, Handler(), on_done=done.append)
+        job_id = await enqueue(queue, sessions, 1, "a")
+        assert await queue.run_once()
+        assert not await queue.run_once()
+
+        job = (await jobs(sessions))[job_id]
+        assert job.status == "done"
+        assert job.deployment_id == 100 + job_id
+        assert job.finished_at is not None
+        assert [j.id for j in done] == [job_id]
+
+    async def test_failure_is_retried_with_backoff(self, sessions):
+        handler = Handler(fail=1)
+        queue = DeployQueue(sessions, handler, backoff_seconds=30)
+        job_id = await enqueue(queue, sessions, 1, "a")
+        await queue.run_once()
+
+        job = (await jobs(sessions))[job_id]
+        assert job.status == "queued"
+        assert job.attempts == 1
+        assert "railway down" in job.last_error
+        assert job.run_after > datetime.utcnow() + timedelta(seconds=20)
+        assert not await queue.run_once()  # not due yet
+
+        async with sessions() as session:
+            await session.execute(update(DeployJob).values(run_after=datetime.utcnow()))
+            await session.commit()
+        assert await queue.run_once()
+        assert (await jobs(sessions))[job_id].status == "done"
+        assert queue.stats()["retried"] == 1
+
+    async def test_gives_up_after_max_attempts(self, sessions):
+        queue = DeployQueue(sessions, Handler(fail=10), max_attempts=2, backoff_seconds=0)
+        job_id = await enqueue(queue, sessions, 1, "a")
+        await queue.run_once()
+        await queue.run_once()
+        next_job = await enqueue(queue, sessions, 1, "b")
+
+        job = (await jobs(sessions))[job_id]
+        assert job.status == "failed"
+        assert job.attempts == 2
+        assert await queue.claim() == next_job  # a failed job does not block its project
+
+    async def test_skipped(self, sessions):
+        queue = DeployQueue(sessions, Handler(skip=True))
+        job_id = await enqueue(queue, sessions, 1, "a")
+        await queue.run_once()
+
+        job = (await jobs(sessions))[job_id]
+        assert job.status == "skipped"
+        assert job.last_error == "nothing to do"
+
+    async def test_deferred_job_keeps_its_attempts(self, sessions):
+        queue = DeployQueue(sessions, Handler(defer=1), max_attempts=1, defer_seconds=30)
+        job_id = await enqueue(queue, sessions, 1, "a")
+        await queue.run_once()
+
+        job = (await jobs(sessions))[job_id]
+        assert (job.status, job.attempts) == ("queued", 0)
+        assert job.run_after > datetime.utcnow() + timedelta(seconds=20)
+        assert queue.stats()["deferred"] == 1
+
+    def test_backoff_is_capped(self):
+        queue = DeployQueue(None, Handler(), backoff_seconds=10, max_backoff_seconds=60)
+        assert [queue.backoff(n) for n in range(1, 6)] == [10, 20, 40, 60, 60]
+
+
+async def make_due(sessions):
+    async with sessions() as session:
+        await session.execute(update(DeployJob).values(run_after=datetime.utcnow()))
+        await session.commit()
+
+
+class TestCoalescing:
+    async def test_burst_deploys_newest_commit_once(self, sessions):
+        handler = Handler()
+        queue = DeployQueue(sessions, handler, coalesce_seconds=60)
+        ids = [await enqueue(queue, sessions, 1, sha) for sha in "abc"]
+        other = await enqueue(queue, sessions, 2, "d")
+
+        queued = await jobs(sessions)
+        assert [queued[i].status for i in ids] == ["superseded", "superseded", "queued"]
+        assert queued[ids[2]].run_after == queued[ids[0]].run_after  # window starts at the first push
+        assert queued[other].status == "queued"
+        assert not await queue.run_once()  # window still open
+
+        await make_due(sessions)
+        while await queue.run_once():
+            pass
+        assert sorted(handler.calls) == ["c", "d"]
+        assert queue.stats()["coalesced"] == 2
+
+    async def test_pushes_during_deploy_give_one_follow_up(self, sessions):
+        handler = Handler(defer=1)
+        queue = DeployQueue(sessions, handler)
+        first = await enqueue(queue, sessions, 1, "a")
+        await queue.run_once()  # deferred: a deploy is in progress
+        assert (await jobs(sessions))[first].status == "queued"
+
+        for sha in "bc":
+            await enqueue(queue, sessions, 1, sha)
+        await make_due(sessions)
+        while await queue.run_once():
+            pass
+        assert handler.calls == ["a", "c"]
+        assert queue.stats()["coalesced"] == 2
+
+    async def test_late_redelivery_of_older_push_does_not_win(self, sessions):
+        handler = Handler()
+        queue = DeployQueue(sessions, handler, coalesce_seconds=60)
+        pushed = datetime.utcnow()
+        newer = await enqueue(queue, sessions, 1, "b", pushed_at=pushed)
+        older = await enqueue(queue, sessions, 1, "a", pushed_at=pushed - timedelta(seconds=30))
+
+        states = await jobs(sessions)
+        assert (states[newer].status, states[older].status) == ("queued", "superseded")
+        assert states[older].last_error == f"Superseded by job {newer}"
+        await make_due(sessions)
+        while await queue.run_once():
+            pass
+        assert handler.calls == ["b"]
+
+    async def test_older_push_after_deploy_is_not_deployed(self, sessions):
+        handler = Handler()
+        queue = DeployQueue(sessions, handler)
+        pushed = datetime.utcnow()
+        await enqueue(queue, sessions, 1, "b", pushed_at=pushed)
+        assert await queue.run_once()
+        older = await enqueue(queue, sessions, 1, "a", pushed_at=pushed - timedelta(seconds=30))
+        assert (await jobs(sessions))[older].status == "superseded"
+        assert not await queue.run_once()
+        assert handler.calls == ["b"]
+
+    async def test_running_job_is_not_superseded(self, sessions):
+        queue = DeployQueue(sessions, Handler())
+        running = await enqueue(queue, sessions, 1, "a")
+        assert await queue.claim() == running
+        newer = await enqueue(queue, sessions, 1, "b")
+
+        states = await jobs(sessions)
+        assert (states[running].status, states[newer].status) == ("running", "queued")
+        assert queue.stats()["coalesced"] == 0
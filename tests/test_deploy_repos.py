@@ -0,0 +1,125 @@
+"""
+Tests for the repository -> project index used by the GitHub webhook.
+"""
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.api.core.database import Base
+from src.api.deploy.repos import RepoIndex, backfill_repo_keys
+from src.api.models.project import Project, repo_key
+from src.api.models.user import User
+from src.api.projects.router import ProjectUpdate, update_project
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine)() as session:
+        session.add(User(id=1, email="a@example.com", password_hash="x", name="A"))
+        session.add(Project(id=1, name="p", slug="p", owner_id=1, repo_url="https://github.com/Acme/Shop"))
+        await session.commit()
+    yield engine
+    await engine.dispose()
+
+
+class TestRepoKey:
+    @pytest.mark.parametrize("url", [
+        "https://github.com/Acme/Shop",
+        "https://github.com/acme/shop/",
+        "https://github.com/Acme/Shop.git",
+        "git@github.com:Acme/Shop.git",
+        "http://github.com/acme/shop?tab=readme",
+        "acme/shop",
+    ])
+    def test_normalized(self, url):
+        assert repo_key(url) == "acme/shop"
+
+    @pytest.mark.parametrize("url", [None, "", "shop", "https://github.com/"])
+    def test_no_repository(self, url):
+        assert repo_key(url) is None
+
+    def test_model_keeps_key_in_sync(self):
+        project = Project(repo_url="https://github.com/Acme/Shop/")
+        assert project.repo_key == "acme/shop"
+        project.repo_url = None
+        assert project.repo_key is None
+
+
+class TestRepoIndex:
+    async def test_lookup_is_cached(self, engine):
+        index = RepoIndex()
+        async with async_sessionmaker(engine)() as session:
+            assert await index.lookup(session, "ACME/shop") == 1
+            assert await index.lookup(session, "https://github.com/acme/shop/") == 1
+            assert await index.lookup(session, "acme/other") is None
+            assert await index.lookup(session, "acme/other") is None
+        assert index.stats() == {"entries": 2, "hits": 2, "misses": 2}
+
+    async def test_invalidate(self, engine):
+        index = RepoIndex()
+        async with async_sessionmaker(engine)() as session:
+            assert await index.lookup(session, "acme/other") is None
+            project = await session.get(Project, 1)
+            project.repo_url = "https://github.com/acme/other"
+            await session.commit()
+
+            assert await index.lookup(session, "acme/other") is None  # cached miss
+            index.invalidate("acme/shop", "acme/other")
+            assert await index.lookup(session, "acme/other") == 1
+            assert await index.lookup(session, "acme/shop") is None
+
+    async def test_entries_expire_and_are_bounded(self, engine):
+        index = RepoIndex(ttl=0, max_entries=2)
+        async with async_sessionmaker(engine)() as session:
+            for name in ("a/1", "a/2", "a/3", "acme/shop", "acme/shop"):
+                await index.lookup(session, name)
+        assert index.stats() == {"entries": 2, "hits": 0, "misses": 5}
+
+
+class TestBackfill:
+    async def test_sets_keys_and_skips_taken(self, engine):
+        async with engine.begin() as conn:
+            for project_id, url in [(2, "https://github.com/Acme/Blog/"), (3, "git@github.com:acme/blog.git"), (4, "x")]:
+                await conn.execute(text(
+                    "INSERT INTO projects (id, name, slug, owner_id, type, status, branch, auto_deploy, repo_url, created_at, updated_at) "
+                    f"VALUES ({project_id}, 'p{project_id}', 'p{project_id}', 1, 'WEB', 'DRAFT', 'main', 0, '{url}', "
+                    "'2026-01-01', '2026-01-01')"
+                ))
+
+        assert await backfill_repo_keys(engine) == 1
+        assert await backfill_repo_keys(engine) == 0
+        async with engine.connect() as conn:
+            rows = (await conn.execute(select(Project.id, Project.repo_key, Project.updated_at))).all()
+        assert {row.id: row.repo_key for row in rows} == {1: "acme/shop", 2: "acme/blog", 3: None, 4: None}
+        assert str({row.id: row.updated_at for row in rows}[2]).startswith("2026-01-01")  # not bumped
+
+
+class TestUpdateProject:
+    async def test_repository_of_another_project_is_409(self, engine):
+        async with async_sessionmaker(engine)() as session:
+            session.add(Project(id=2, name="q", slug="q", owner_id=1))
+            await session.commit()
+            user = await session.get(User, 1)
+
+            with pytest.raises(HTTPException) as error:
+                await update_project(2, ProjectUpdate(repo_url="git@github.com:acme/shop.git"), BackgroundTasks(), user, session)
+            assert error.value.status_code == 409
+            assert (await session.get(Project, 2)).repo_key is None
+
+    async def test_connect_and_disconnect(self, engine):
+        async with async_sessionmaker(engine)() as session:
+            user = await session.get(User, 1)
+            tasks = BackgroundTasks()
+            response = await update_project(1, ProjectUpdate(repo_url="https://github.com/acme/blog", auto_deploy=True), tasks, user, session)
+            assert (response.repo_url, response.auto_deploy) == ("https://github.com/acme/blog", True)
+            assert (await session.get(Project, 1)).repo_key == "acme/blog"
+            assert tasks.tasks[0].args == ("acme/shop", "acme/blog")
+
+            await update_project(1, ProjectUpdate(repo_url=""), BackgroundTasks(), user, session)
+            assert (await session.get(Project, 1)).repo_key is None
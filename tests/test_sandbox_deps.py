@@ -0,0 +1,183 @@
+"""
+Tests for content-addressed dependency cache volumes (fake Docker).
+"""
+
+import asyncio
+
+import pytest
+
+from src.api.sandbox.deps import LABEL, DependencyCache, volume_name
+from src.api.sandbox.manager import RestartRequired
+from src.api.sandbox.runtimes import RUNTIMES
+
+from .test_sandbox_manager import FakeContainer, FakeContainers, FakeDocker, manager
+
+MB = 1024 * 1024
+
+
+class FakeVolume:
+    def __init__(self, volumes, name):
+        self.volumes = volumes
+        self.name = name
+        self.in_use = False
+
+    def remove(self):
+        if self.in_use:
+            raise RuntimeError("volume is in use")
+        del self.volumes.volumes[self.name]
+
+
+class FakeVolumes:
+    def __init__(self):
+        self.volumes = {}
+
+    def create(self, name, labels):
+        return self.volumes.setdefault(name, FakeVolume(self, name))
+
+    def get(self, name):
+        return self.volumes[name]
+
+
+class BuilderContainers(FakeContainers):
+    """Containers whose exec is a dependency build when they mount a volume."""
+
+    def __init__(self, size_kb=2048, fail=False):
+        super().__init__()
+        self.size_kb = size_kb
+        self.fail = fail
+        self.builds = 0
+
+    def run(self, image, command, **kwargs):
+        container = super().run(image, command, **kwargs)
+        container.kwargs = kwargs
+        if LABEL in kwargs["labels"]:
+            container.exec_run = self.build
+        return container
+
+    def build(self, cmd, **kwargs):
+        self.builds += 1
+        if self.fail:
+            return 1, b"npm ERR! network"
+        return 0, f"{self.size_kb}\n".encode()
+
+
+class DepsDocker(FakeDocker):
+    def __init__(self, **kwargs):
+        super().__init__()
+        self.containers = BuilderContainers(**kwargs)
+        self.volumes = FakeVolumes()
+
+    def df(self):
+        return {"Volumes": [
+            {"Name": "xbasis-deps-web-old", "Labels": {LABEL: "old"}, "UsageData": {"Size": 5 * MB}},
+            {"Name": "unrelated", "Labels": None, "UsageData": {"Size": 1}},
+        ]}
+
+
+REQUIREMENTS = {"requirements.txt": "fastapi==0.110\n", "main.py": "app = 1"}
+
+
+class TestDepsKey:
+    def test_key_follows_lockfile_content(self):
+        web = RUNTIMES["web"]
+        files = {"package-lock.json": "{}", "package.json": '{"name": "a"}', "src/App.tsx": "x"}
+        key = web.deps_key(files)
+        assert key == web.deps_key({**files, "src/App.tsx": "changed"})
+        assert key != web.deps_key({**files, "package.json": '{"name": "b"}'})
+        assert web.deps_files(files) == {"package-lock.json": "{}", "package.json": '{"name": "a"}'}
+
+    def test_no_lockfile_no_key(self):
+        assert RUNTIMES["web"].deps_key({"package.json": "{}"}) is None
+        assert RUNTIMES["static"].deps_key({"requirements.txt": "x"}) is None
+
+    def test_same_lockfile_differs_per_image(self):
+        assert RUNTIMES["api"].deps_key(REQUIREMENTS) == RUNTIMES["bot"].deps_key(REQUIREMENTS)
+        assert RUNTIMES["web"].deps_key({"package-lock.json": "x"}) != RUNTIMES["api"].deps_key({"requirements.txt": "x"})
+
+
+class TestDependencyCache:
+    async def test_single_build_for_concurrent_misses(self):
+        docker, cache = DepsDocker(), DependencyCache()
+        key = RUNTIMES["api"].deps_key(REQUIREMENTS)
+        volumes = await asyncio.gather(*[
+            cache.acquire("local", docker, "api", RUNTIMES["api"], key, REQUIREMENTS) for _ in range(3)
+        ])
+        assert docker.containers.builds == 1
+        assert {v.name for v in volumes} == {volume_name("api", key)}
+        assert volumes[0].users == 3 and volumes[0].size_bytes == 2 * MB
+        assert (cache.misses, cache.hits) == (1, 2)
+        builder = docker.containers.started[0]
+        assert builder.removed and builder.files() == {"requirements.txt": "fastapi==0.110\n"}
+
+    async def test_failed_build_raises(self):
+        docker, cache = DepsDocker(fail=True), DependencyCache()
+        with pytest.raises(RuntimeError, match="network"):
+            await cache.acquire("local", docker, "api", RUNTIMES["api"], "k", REQUIREMENTS)
+        assert cache.failures == 1 and not cache.has("local", "api", "k")
+
+    async def test_lru_eviction_skips_volumes_in_use(self):
+        docker, cache = DepsDocker(size_kb=4096), DependencyCache(budget_mb=10)
+        runtime = RUNTIMES["api"]
+        first = await cache.acquire("local", docker, "api", runtime, "a", REQUIREMENTS)
+        second = await cache.acquire("local", docker, "api", runtime, "b", REQUIREMENTS)
+        cache.release("local", second.name)
+        await cache.acquire("local", docker, "api", runtime, "a", REQUIREMENTS)  # a is now most recent
+        await cache.acquire("local", docker, "api", runtime, "c", REQUIREMENTS)  # 12 MB > 10 MB
+        assert list(cache.volumes["local"]) == [first.name, volume_name("api", "c")]
+        assert second.name not in docker.volumes.volumes and cache.evictions == 1
+
+    async def test_loaded_volumes_are_verified_on_first_use(self):
+        docker, cache = DepsDocker(), DependencyCache()
+        await cache.load("local", docker)
+        assert list(cache.volumes["local"]) == ["xbasis-deps-web-old"]
+        assert cache.volumes["local"]["xbasis-deps-web-old"].size_bytes == 5 * MB
+        volume = await cache.acquire("local", docker, "web", RUNTIMES["web"], "old", {"package-lock.json": "{}"})
+        assert volume.ready and docker.containers.builds == 1
+
+
+class TestSandboxWithDeps:
+    def deps_manager(self, **kwargs):
+        sandboxes = manager(deps=DependencyCache(), **kwargs)
+        sandboxes.hosts["local"]._client = DepsDocker()
+        return sandboxes
+
+    async def test_mounts_volume_and_skips_install(self):
+        sandboxes = self.deps_manager(warm_pool={"api": 1})
+        await sandboxes.start()
+        sandbox = await sandboxes.create_sandbox(1, "api", REQUIREMENTS)
+        docker = sandboxes.hosts["local"].client
+        container = docker.containers.get(sandbox.container_id)
+        assert container.kwargs["volumes"] == {sandbox.deps_volume: {"bind": "/deps", "mode": "ro"}}
+        assert container.kwargs["environment"] == {"PYTHONPATH": "/deps"}
+        command = container.execs[0][0][-1]
+        assert "uvicorn" in command and "pip install" not in command
+
+        await sandboxes.destroy_sandbox(1)
+        assert sandboxes.deps.volumes["local"][sandbox.deps_volume].users == 0
+
+    async def test_second_project_with_same_lockfile_hits(self):
+        sandboxes = self.deps_manager()
+        first = await sandboxes.create_sandbox(1, "api", REQUIREMENTS)
+        second = await sandboxes.create_sandbox(2, "bot", REQUIREMENTS)
+        assert first.deps_volume != second.deps_volume  # per project type
+        third = await sandboxes.create_sandbox(3, "api", {**REQUIREMENTS, "main.py": "other"})
+        assert third.deps_volume == first.deps_volume
+        assert sandboxes.hosts["local"].client.containers.builds == 2
+
+    async def test_falls_back_to_install_when_build_fails(self):
+        sandboxes = self.deps_manager()
+        sandboxes.hosts["local"]._client.containers.fail = True
+        sandbox = await sandboxes.create_sandbox(1, "api", REQUIREMENTS)
+        container = sandboxes.hosts["local"].client.containers.get(sandbox.container_id)
+        assert sandbox.deps_volume is None
+        assert "pip install" in container.execs[0][0][-1]
+
+    async def test_lockfile_change_requires_restart(self):
+        sandboxes = self.deps_manager()
+        sandbox = await sandboxes.create_sandbox(1, "api", REQUIREMENTS)
+        container = sandboxes.hosts["local"].client.containers.get(sandbox.container_id)
+        archives = len(container.archives)
+        with pytest.raises(RestartRequired, match="requirements.txt"):
+            await sandboxes.update_files(1, {"requirements.txt": "fastapi==0.111\n", "main.py": "app = 2"})
+        assert len(container.archives) == archives  # nothing written
+        assert (await sandboxes.update_files(1, {"main.py": "app = 2"}))["written"] == 1
@@ -0,0 +1,150 @@
+"""
+Tests for the sandbox log ring buffer and SSE tail.
+"""
+
+import asyncio
+import json
+import threading
+
+from src.api.sandbox.logs import MAX_LINE_BYTES, LogBuffer, follow_container, split_lines
+from src.api.sandbox.router import log_events
+
+
+class FakeContainer:
+    id = "c1"
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def attach(self, **kwargs):
+        assert kwargs["demux"] and kwargs["stream"]
+        return iter(self.chunks)
+
+
+class BlockingStream:
+    """Attach stream that blocks like a socket read until closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        yield (b"started\n", None)
+        self.closed.wait(5)
+        raise OSError("stream closed")
+
+    def close(self):
+        self.closed.set()
+
+
+class BlockingContainer:
+    id = "c2"
+
+    def __init__(self):
+        self.stream = BlockingStream()
+
+    def attach(self, **kwargs):
+        return self.stream
+
+
+def log_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("sandbox-logs-")]
+
+
+class TestLogBuffer:
+    def test_line_cap(self):
+        logs = LogBuffer(max_lines=3)
+        for i in range(10):
+            logs.append(f"line {i}")
+        assert [line.text for line in logs.lines] == ["line 7", "line 8", "line 9"]
+        assert (logs.first_offset, logs.next_offset) == (7, 10)
+
+    def test_byte_cap(self):
+        logs = LogBuffer(max_lines=1000, max_bytes=100)
+        for _ in range(50):
+            logs.append("x" * 30)
+        assert logs.size <= 100 and len(logs.lines) == 3
+
+    def test_long_line_truncated(self):
+        logs = LogBuffer()
+        logs.append("y" * (MAX_LINE_BYTES * 3))
+        assert len(logs.lines[0].text) == MAX_LINE_BYTES + 1
+
+    def test_since_reports_dropped_lines(self):
+        logs = LogBuffer(max_lines=2)
+        for i in range(5):
+            logs.append(str(i))
+        lines, skipped = logs.since(1)
+        assert [line.text for line in lines] == ["3", "4"] and skipped == 2
+        lines, skipped = logs.since(4)
+        assert [line.offset for line in lines] == [4] and skipped == 0
+        assert logs.since(5) == ([], 0)
+
+    async def test_wait(self):
+        logs = LogBuffer()
+        assert not await logs.wait(0, 0.01)
+        asyncio.get_running_loop().call_later(0.01, logs.append, "hi")
+        assert await logs.wait(0, 1)
+
+
+class TestFollow:
+    def test_split_lines(self):
+        lines, rest = split_lines(b"par", b"tial\r\nnext\nincompl")
+        assert lines == ["partial", "next"] and rest == b"incompl"
+
+    async def test_follow_container_demuxes_and_joins_partial_lines(self):
+        logs = LogBuffer()
+        container = FakeContainer([(b"hel", None), (b"lo\nwor", b"oops\n"), (None, b"bye")])
+        await follow_container(container, logs)
+        await asyncio.sleep(0)
+        assert [(line.stream, line.text) for line in logs.lines] == [
+            ("stdout", "hello"), ("stderr", "oops"), ("stdout", "wor"), ("stderr", "bye"),
+        ]
+
+    async def test_cancel_closes_stream_and_ends_thread(self):
+        logs = LogBuffer()
+        container = BlockingContainer()
+        task = asyncio.create_task(follow_container(container, logs))
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if logs.lines:
+                break
+        assert [line.text for line in logs.lines] == ["started"]
+        assert len(log_threads()) == 1
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert container.stream.closed.is_set()
+        for thread in log_threads():
+            thread.join(1)
+        assert not log_threads()
+
+    async def test_does_not_use_default_executor(self):
+        containers = [BlockingContainer() for _ in range(50)]
+        tasks = [asyncio.create_task(follow_container(c, LogBuffer())) for c in containers]
+        await asyncio.sleep(0.05)
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: "free"), 1) == "free"
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert all(c.stream.closed.is_set() for c in containers)
+
+
+class TestTail:
+    async def test_resume_from_offset_and_gap(self):
+        logs = LogBuffer(max_lines=3)
+        for i in range(5):
+            logs.append(str(i))
+        events = [event async for event in log_events(logs, 0, follow=False)]
+        assert events[0].startswith("event: gap") and json.loads(events[0].split("data: ")[1]) == {"skipped": 2}
+        assert [event.split("\n")[0] for event in events[1:]] == ["id: 2", "id: 3", "id: 4"]
+
+    async def test_follow_until_closed(self):
+        logs = LogBuffer()
+        logs.append("first")
+        stream = log_events(logs, 1, follow=True)
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        logs.append("second")
+        assert json.loads((await pending).split("data: ")[1])["text"] == "second"
+        logs.close()
+        assert [event async for event in stream] == []
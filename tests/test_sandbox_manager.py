@@ -0,0 +1,340 @@
+"""
+Tests for the Docker sandbox manager (fake Docker client).
+"""
+
+import asyncio
+import io
+import tarfile
+
+import pytest
+
+from src.api.sandbox.hosts import DockerHost
+from src.api.sandbox.manager import SandboxError, SandboxManager
+from src.api.sandbox.sync import SyncError, content_hash
+
+
+class FakeContainer:
+    _next = 0
+
+    def __init__(self, labels):
+        FakeContainer._next += 1
+        self.id = f"c{FakeContainer._next}"
+        self.short_id = self.id
+        self.labels = labels
+        self.status = "running"
+        self.archives = []
+        self.execs = []
+        self.removed = False
+
+    def reload(self):
+        pass
+
+    def put_archive(self, path, data):
+        self.archives.append((path, b"".join(data)))
+        return True
+
+    def files(self):
+        """Contents of the last archive put."""
+        with tarfile.open(fileobj=io.BytesIO(self.archives[-1][1])) as tar:
+            return {member.name: tar.extractfile(member).read().decode() for member in tar}
+
+    def exec_run(self, cmd, **kwargs):
+        self.execs.append((cmd, kwargs))
+
+    def remove(self, force=False):
+        self.removed = True
+
+    def attach(self, **kwargs):
+        return iter([(b"ready\n", None)])
+
+
+class FakeContainers:
+    def __init__(self):
+        self.started = []
+
+    def run(self, image, command, **kwargs):
+        container = FakeContainer(kwargs["labels"])
+        self.ports = kwargs.get("ports")
+        self.started.append(container)
+        return container
+
+    def get(self, container_id):
+        return next(c for c in self.started if c.id == container_id)
+
+    def list(self, all=False, filters=None):
+        label = (filters or {}).get("label")
+        return [c for c in self.started if not c.removed and (label is None or label in c.labels)]
+
+
+class FakeDocker:
+    def __init__(self, cpus=64, memory_mb=256 * 1024):
+        self.containers = FakeContainers()
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+
+    def info(self):
+        return {"NCPU": self.cpus, "MemTotal": self.memory_mb * 1024 * 1024}
+
+
+def manager(**kwargs):
+    kwargs.setdefault("hosts", [{"name": "local", "cpus": 64, "memory_mb": 256 * 1024}])
+    sandboxes = SandboxManager(**kwargs)
+    for host in sandboxes.hosts.values():
+        host._client = FakeDocker()
+    return sandboxes
+
+
+def pools(sandboxes, host="local"):
+    return sandboxes.hosts[host].pools
+
+
+def container_of(sandboxes, sandbox):
+    return sandboxes.hosts[sandbox.host].client.containers.get(sandbox.container_id)
+
+
+async def settle(sandboxes):
+    await asyncio.gather(*sandboxes._refills.values())
+
+
+class TestWarmPool:
+    async def test_start_fills_pools(self):
+        sandboxes = manager(warm_pool={"web": 2, "static": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        assert len(pools(sandboxes)["web"]) == 2
+        assert len(pools(sandboxes)["static"]) == 1
+        assert len(pools(sandboxes)["api"]) == 0
+
+    async def test_create_claims_warm_container_and_refills(self):
+        sandboxes = manager(warm_pool={"web": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        warm = pools(sandboxes)["web"][0]
+
+        sandbox = await sandboxes.create_sandbox(7, "web", {"package.json": "{}"}, db_url="postgresql://x")
+        await settle(sandboxes)
+
+        assert sandbox.container_id == warm.id
+        assert sandbox.port == int(warm.labels["xbasis.port"]) == 10000
+        assert sandbox.host == "local"
+        assert sandbox.startup_ms is not None
+        assert warm.archives[0][0] == "/app"
+        cmd, kwargs = warm.execs[0]
+        assert "npm run dev" in cmd[-1]
+        assert kwargs["environment"]["DATABASE_URL"] == "postgresql://x"
+        assert len(pools(sandboxes)["web"]) == 1 and pools(sandboxes)["web"][0] is not warm
+
+    async def test_cold_start_when_pool_empty(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "static", {"index.html": "<p>"})
+        container = container_of(sandboxes, sandbox)
+        assert container.execs == []  # nginx serves the workdir itself
+        assert sandboxes._refills == {}
+
+    async def test_stopped_warm_container_is_skipped(self):
+        sandboxes = manager(warm_pool={"api": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        dead = pools(sandboxes)["api"][0]
+        dead.status = "exited"
+
+        sandbox = await sandboxes.create_sandbox(1, "api", {})
+        assert dead.removed
+        assert sandbox.container_id != dead.id
+
+    async def test_invalid_path_does_not_claim(self):
+        sandboxes = manager(warm_pool={"web": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        with pytest.raises(SyncError):
+            await sandboxes.create_sandbox(1, "web", {"../escape": ""})
+        assert len(pools(sandboxes)["web"]) == 1
+
+    async def test_destroy_removes_container(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "api", {})
+        container = container_of(sandboxes, sandbox)
+        await sandboxes.destroy_sandbox(1)
+        assert container.removed
+        assert await sandboxes.get_sandbox(1) is None
+
+    async def test_start_removes_containers_of_previous_process(self):
+        previous = manager(warm_pool={"web": 1})
+        await previous.start()
+        await settle(previous)
+        sandbox = await previous.create_sandbox(1, "api", {})
+        docker = previous.hosts["local"].client
+
+        sandboxes = manager()
+        sandboxes.hosts["local"]._client = docker
+        await sandboxes.start()
+        assert container_of(sandboxes, sandbox).removed
+        assert docker.containers.list(filters={"label": "xbasis.sandbox"}) == []
+
+    async def test_docker_unavailable(self, monkeypatch):
+        monkeypatch.setattr(DockerHost, "client", property(lambda self: None))
+        sandboxes = SandboxManager(hosts=[{"name": "local", "cpus": 4, "memory_mb": 4096}])
+        with pytest.raises(SandboxError):
+            await sandboxes.create_sandbox(1, "web", {})
+
+
+class TestFileSync:
+    async def test_update_writes_only_changed_files(self):
+        sandboxes = manager()
+        files = {f"src/module{i}.ts": f"export const value{i} = {i};\n" * 20 for i in range(2000)}
+        sandbox = await sandboxes.create_sandbox(1, "web", files)
+        container = container_of(sandboxes, sandbox)
+        assert len(container.files()) == 2000
+        assert sandbox.manifest["src/module5.ts"] == content_hash(files["src/module5.ts"])
+
+        files["src/module5.ts"] = files["src/module5.ts"].replace("5", "6", 1)
+        stats = await sandboxes.update_files(1, files)
+
+        assert stats["written"] == 1 and stats["unchanged"] == 1999
+        assert stats["bytes_sent"] < 4096
+        assert container.files() == {"src/module5.ts": files["src/module5.ts"]}
+        assert sandbox.manifest["src/module5.ts"] == content_hash(files["src/module5.ts"])
+
+    async def test_no_changes_touches_nothing(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "api", {"main.py": "app = 1"})
+        container = container_of(sandboxes, sandbox)
+        stats = await sandboxes.update_files(1, {"./main.py": "app = 1"})
+        assert stats == {"written": 0, "unchanged": 1, "deleted": 0, "bytes_sent": 0}
+        assert len(container.archives) == 1
+
+    async def test_delete(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "static", {"a.html": "a", "b.html": "b"})
+        container = container_of(sandboxes, sandbox)
+        stats = await sandboxes.update_files(1, {}, deleted=["b.html", "unknown.html"])
+        assert stats["deleted"] == 1
+        assert container.execs[-1][0] == ["rm", "-f", "--", "b.html"]
+        assert list(sandbox.manifest) == ["a.html"]
+
+    async def test_missing_files(self):
+        sandboxes = manager()
+        await sandboxes.create_sandbox(1, "api", {"main.py": "a", "old.py": "b"})
+        result = await sandboxes.missing_files(1, {"main.py": content_hash("a"), "new.py": content_hash("c")})
+        assert result == {"missing": ["new.py"], "stale": ["old.py"]}
+
+
+class TestReaper:
+    async def test_reaps_idle_per_plan(self):
+        sandboxes = manager(idle_timeouts={"free": 60, "pro": 600})
+        await sandboxes.create_sandbox(1, "api", {}, plan="free")
+        await sandboxes.create_sandbox(2, "api", {}, plan="pro")
+        await sandboxes.create_sandbox(3, "api", {}, plan="free")
+        for project_id in (1, 2):
+            sandboxes.sandboxes[project_id].last_active -= 120
+
+        assert await sandboxes.reap() == 1
+        assert set(sandboxes.sandboxes) == {2, 3}
+        assert sandboxes.metrics()["reaped"] == 1
+
+    async def test_touch_keeps_sandbox(self):
+        sandboxes = manager(idle_timeouts={"free": 60})
+        await sandboxes.create_sandbox(1, "api", {})
+        sandboxes.sandboxes[1].last_active -= 120
+        await sandboxes.update_files(1, {"main.py": "x"})
+        assert await sandboxes.reap() == 0
+
+    async def test_evicts_lru_over_container_budget(self):
+        sandboxes = manager(max_containers=2)
+        await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes.create_sandbox(2, "api", {})
+        sandboxes.sandboxes[2].last_active -= 10
+        sandboxes.sandboxes[1].last_active -= 5
+        await sandboxes.create_sandbox(3, "api", {})
+        assert set(sandboxes.sandboxes) == {1, 3}
+        assert sandboxes.metrics()["evicted"] == 1
+
+    async def test_container_budget_is_per_host(self):
+        sandboxes = manager(
+            hosts=[{"name": "a", "cpus": 64, "memory_mb": 65536}, {"name": "b", "cpus": 64, "memory_mb": 65536}],
+            max_containers=1,
+        )
+        first = await sandboxes.create_sandbox(1, "api", {})
+        second = await sandboxes.create_sandbox(2, "api", {})
+        assert {first.host, second.host} == {"a", "b"}
+        assert sandboxes.metrics()["evicted"] == 0
+
+        sandboxes.sandboxes[2].last_active -= 10
+        third = await sandboxes.create_sandbox(3, "api", {})
+        assert set(sandboxes.sandboxes) == {1, 3}
+        assert third.host == second.host
+
+    async def test_memory_budget_counts_warm_containers(self):
+        sandboxes = manager(warm_pool={"web": 2}, memory_limit_mb=512, memory_budget_mb=2048)
+        await sandboxes.start()
+        await settle(sandboxes)
+        await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes.create_sandbox(2, "api", {})  # 2 warm + 2 sandboxes = budget
+        sandboxes.sandboxes[1].last_active -= 5
+        await sandboxes.create_sandbox(3, "api", {})
+        assert set(sandboxes.sandboxes) == {2, 3}
+
+    async def test_metrics_live_and_idle(self):
+        sandboxes = manager()
+        await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes.create_sandbox(2, "api", {})
+        sandboxes.sandboxes[2].last_active -= 3600
+        metrics = sandboxes.metrics()
+        assert (metrics["live"], metrics["idle"]) == (1, 1)
+
+
+class TestHosts:
+    async def test_destroy_releases_port(self):
+        sandboxes = manager(port_range=(10000, 10002))
+        first = await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes.create_sandbox(2, "api", {})
+        with pytest.raises(SandboxError):
+            await sandboxes.create_sandbox(3, "api", {})  # ports exhausted
+        await sandboxes.destroy_sandbox(1)
+        third = await sandboxes.create_sandbox(3, "api", {})
+        assert third.port == first.port
+
+    async def test_capacity_probed_from_docker_info(self):
+        sandboxes = manager(hosts=[{"name": "a"}])
+        sandboxes.hosts["a"]._client = FakeDocker(cpus=8, memory_mb=16384)
+        await sandboxes.start()
+        assert (sandboxes.hosts["a"].cpus, sandboxes.hosts["a"].memory_mb) == (8, 16384)
+
+    async def test_places_across_hosts(self):
+        sandboxes = manager(
+            hosts=[
+                {"name": "a", "cpus": 2, "memory_mb": 1024, "address": "10.0.0.1"},
+                {"name": "b", "cpus": 2, "memory_mb": 1024, "address": "10.0.0.2"},
+            ],
+            memory_limit_mb=512,
+        )
+        placed = [await sandboxes.create_sandbox(i, "api", {}) for i in range(4)]
+        assert sorted(s.host for s in placed) == ["a", "a", "b", "b"]
+        with pytest.raises(SandboxError):
+            await sandboxes.create_sandbox(5, "api", {})
+        assert [h["sandboxes"] for h in sandboxes.metrics()["hosts"]] == [2, 2]
+
+    async def test_prefers_host_with_warm_container(self):
+        sandboxes = manager(
+            hosts=[{"name": "a", "cpus": 8, "memory_mb": 8192}, {"name": "b", "cpus": 8, "memory_mb": 8192}],
+        )
+        warm = await sandboxes._start_container(sandboxes.hosts["b"], "web")
+        pools(sandboxes, "b")["web"].append(warm)
+        sandbox = await sandboxes.create_sandbox(1, "web", {})
+        assert (sandbox.host, sandbox.container_id) == ("b", warm.id)
+
+
+class TestLogs:
+    async def test_container_output_reaches_buffer(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes._log_tasks[1]
+        await asyncio.sleep(0)  # lines are handed over via call_soon_threadsafe
+        lines, _ = sandbox.logs.since(0)
+        assert [(line.stream, line.text) for line in lines][-1] == ("stdout", "ready")
+
+    async def test_destroy_closes_buffer(self):
+        sandboxes = manager()
+        sandbox = await sandboxes.create_sandbox(1, "api", {})
+        await sandboxes.destroy_sandbox(1)
+        assert sandbox.logs.closed and 1 not in sandboxes._log_tasks
@@ -0,0 +1,78 @@
+"""
+Tests for the port allocator and sandbox placement across hosts.
+"""
+
+import pytest
+
+from src.api.sandbox.hosts import DockerHost, choose_host
+from src.api.sandbox.ports import PortAllocator, PortsExhausted
+
+
+class TestPortAllocator:
+    def test_allocates_whole_range_once(self):
+        ports = PortAllocator(10000, 10013)
+        allocated = [ports.allocate("x") for _ in range(13)]
+        assert sorted(allocated) == list(range(10000, 10013))
+        with pytest.raises(PortsExhausted):
+            ports.allocate("x")
+
+    def test_next_fit_does_not_reuse_released_port_immediately(self):
+        ports = PortAllocator(10000, 10100)
+        first = ports.allocate("a")
+        for _ in range(20):
+            ports.allocate("b")
+        ports.release(first)
+        assert ports.allocate("c") != first
+
+    def test_released_port_is_reused_when_range_wraps(self):
+        ports = PortAllocator(10000, 10008)
+        for _ in range(8):
+            ports.allocate("a")
+        ports.release(10003)
+        assert ports.allocate("b") == 10003
+
+    def test_expired_leases_are_reclaimed_when_exhausted(self):
+        ports = PortAllocator(10000, 10002, lease_seconds=0)
+        ports.allocate("a")
+        ports.allocate("b")
+        assert ports.allocate("c") in (10000, 10001)
+        assert ports.used == 1
+
+    def test_renew_and_reserve(self):
+        ports = PortAllocator(10000, 10004, lease_seconds=60)
+        ports.reserve(10000, "external")
+        assert ports.allocate("a") == 10001
+        assert ports.renew(10001) and not ports.renew(10002)
+        assert ports.expire() == []
+
+
+def host(name, containers=0, cpus=4, memory_mb=4096, warm=None):
+    h = DockerHost(name=name, url="", address="", ports=PortAllocator(10000, 10100), cpus=cpus, memory_mb=memory_mb)
+    h.sandboxes = set(range(containers))
+    if warm:
+        h.pools[warm].append(object())
+    return h
+
+
+class TestChooseHost:
+    def test_packs_fullest_host_below_threshold(self):
+        hosts = [host("a", containers=1), host("b", containers=2)]
+        assert choose_host(hosts, cpu=1, memory_mb=512, spread_above=0.8).name == "b"
+
+    def test_spreads_when_all_above_threshold(self):
+        hosts = [host("a", containers=3), host("b", containers=2)]
+        assert choose_host(hosts, cpu=1, memory_mb=512, spread_above=0.5).name == "b"
+
+    def test_skips_full_and_unavailable_hosts(self):
+        full, down = host("a", containers=4), host("b")
+        down.available = False
+        assert choose_host([full, down], cpu=1, memory_mb=512) is None
+
+    def test_memory_bound(self):
+        hosts = [host("a", cpus=64, memory_mb=1024, containers=2), host("b", cpus=2, memory_mb=8192)]
+        assert choose_host(hosts, cpu=1, memory_mb=512).name == "b"
+
+    def test_warm_host_preferred(self):
+        hosts = [host("a", containers=2), host("b", warm="web")]
+        assert choose_host(hosts, cpu=1, memory_mb=512, warm_type="web").name == "b"
+        assert choose_host(hosts, cpu=1, memory_mb=512, spread_above=0.8, warm_type="api").name == "a"
@@ -0,0 +1,257 @@
+"""
+Tests for the shared sandbox registry: two managers (API workers) on one
+fake Redis and one fake Docker host.
+"""
+
+import asyncio
+import fnmatch
+import time
+
+import pytest
+
+from src.api.sandbox.manager import SandboxManager
+from src.api.sandbox.registry import (
+    CREATE_OR_GET, LEASE_PORT, RELEASE_PORT, RENEW_CREATING, RENEW_OWNER, SandboxRegistry, owner_key, port_key,
+    record_key, worker_key,
+)
+
+from .test_sandbox_manager import FakeDocker
+
+
+class FakeRedis:
+    """The handful of commands the registry uses, with expiry."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+
+    def _get(self, key):
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key)
+        return self.data.get(key)
+
+    def _expire(self, key, ms):
+        self.expires[key] = time.monotonic() + ms / 1000
+
+    async def eval(self, script, numkeys, key, *args):
+        if script == CREATE_OR_GET:
+            record = self._get(key)
+            if record:
+                return [item for pair in record.items() for item in pair]
+            self.data[key] = {"status": "creating"}
+            self._expire(key, args[0])
+            return []
+        if script == RENEW_OWNER:
+            if self._get(key) == args[0]:
+                self._expire(key, args[1])
+                return 1
+            return 0
+        if script == RENEW_CREATING:
+            if (self._get(key) or {}).get("status") == "creating":
+                self._expire(key, args[0])
+                return 1
+            return 0
+        if script == LEASE_PORT:
+            if self._get(key) in (None, args[0]):
+                self.data[key] = args[0]
+                self._expire(key, args[1])
+                return 1
+            return 0
+        if script == RELEASE_PORT:
+            if self._get(key) == args[0]:
+                await self.delete(key)
+                return 1
+            return 0
+        raise NotImplementedError(script)
+
+    async def hgetall(self, key):
+        return dict(self._get(key) or {})
+
+    async def hget(self, key, field):
+        return (self._get(key) or {}).get(field)
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        self._get(key)  # drop if expired
+        record = self.data.setdefault(key, {})
+        if field is not None:
+            record[field] = value
+        record.update(mapping or {})
+
+    async def hdel(self, key, *fields):
+        for field in fields:
+            (self._get(key) or {}).pop(field, None)
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and self._get(key) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if px:
+            self._expire(key, px)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    async def exists(self, key):
+        return int(self._get(key) is not None)
+
+    async def scan_iter(self, match, count=None):
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match) and self._get(key) is not None:
+                yield key
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        pass
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@pytest.fixture
+def workers():
+    redis, docker = FakeRedis(), FakeDocker()
+    managers = []
+    for name in ("a", "b"):
+        manager = SandboxManager(
+            hosts=[{"name": "local", "cpus": 64, "memory_mb": 65536}],
+            registry=SandboxRegistry(client=redis, cache_seconds=0),
+        )
+        manager.worker_id = name
+        manager.hosts["local"]._client = docker
+        managers.append(manager)
+    return redis, docker, managers
+
+
+class TestSharedRegistry:
+    async def test_other_worker_sees_sandbox(self, workers):
+        redis, docker, (a, b) = workers
+        created = await a.create_sandbox(1, "api", {"main.py": "x"})
+        seen = await b.get_sandbox(1)
+        assert (seen.container_id, seen.port, seen.host) == (created.container_id, created.port, "local")
+        assert await b.create_sandbox(1, "api", {}) is seen
+        assert len(docker.containers.started) == 1
+
+    async def test_concurrent_create_makes_one_container(self, workers):
+        redis, docker, (a, b) = workers
+        first, second = await asyncio.gather(a.create_sandbox(1, "api", {}), b.create_sandbox(1, "api", {}))
+        assert first.container_id == second.container_id
+        assert len(docker.containers.started) == 1
+        assert len(a.sandboxes) + len(b.sandboxes) == 1
+
+    async def test_failed_create_drops_placeholder(self, workers):
+        redis, docker, (a, b) = workers
+        with pytest.raises(Exception):
+            await a.create_sandbox(1, "nope", {})
+        assert await redis.hgetall(record_key(1)) == {}
+
+    async def test_update_through_other_worker_uses_shared_manifest(self, workers):
+        redis, docker, (a, b) = workers
+        await a.create_sandbox(1, "api", {"main.py": "v1", "lib.py": "x"})
+        stats = await b.update_files(1, {"main.py": "v2", "lib.py": "x"})
+        assert (stats["written"], stats["unchanged"]) == (1, 1)
+        stats = await a.update_files(1, {"main.py": "v1"})  # back to v1: must be written
+        assert stats["written"] == 1
+
+    async def test_destroy_elsewhere_releases_owner_state(self, workers):
+        redis, docker, (a, b) = workers
+        sandbox = await a.create_sandbox(1, "api", {})
+        await b.destroy_sandbox(1)
+        assert docker.containers.get(sandbox.container_id).removed
+        await a.reap()
+        assert a.sandboxes == {} and a.hosts["local"].ports.used == 0
+        assert await a.get_sandbox(1) is None
+
+    async def test_touch_reaches_owner(self, workers):
+        redis, docker, (a, b) = workers
+        a.idle_timeouts["free"] = 60
+        await a.create_sandbox(1, "api", {})
+        a.sandboxes[1].last_active -= 120
+        await b.get_sandbox(1)
+        await b.touch(1)
+        assert await a.reap() == 0
+
+    async def test_orphan_is_adopted(self, workers):
+        redis, docker, (a, b) = workers
+        sandbox = await a.create_sandbox(1, "api", {"main.py": "x"})
+        await redis.delete(owner_key(1))  # worker a stopped renewing
+
+        await b.reap()
+        adopted = b.sandboxes[1]
+        assert adopted.container_id == sandbox.container_id
+        assert adopted.manifest == sandbox.manifest
+        assert b.hosts["local"].ports.used == 1
+
+        await a.reap()  # a notices it lost the lease
+        assert a.sandboxes == {}
+
+    async def test_workers_never_share_a_port(self, workers):
+        redis, docker, (a, b) = workers
+        first = await a.create_sandbox(1, "api", {})
+        second = await b.create_sandbox(2, "api", {})  # b's own allocator would pick the same port
+        assert first.port != second.port
+        assert await redis.eval(LEASE_PORT, 1, port_key("local", first.port), "b", 1000) == 0
+
+        await a.destroy_sandbox(1)
+        assert redis._get(port_key("local", first.port)) is None
+
+    async def test_slow_create_keeps_its_placeholder(self, workers, monkeypatch):
+        redis, docker, (a, b) = workers
+        a.registry = SandboxRegistry(client=redis, cache_seconds=0, create_lease_seconds=0.06)
+        launch = a._launch
+
+        async def slow_launch(*args):
+            await asyncio.sleep(0.2)  # a cold dependency build, well past the creation lease
+            return await launch(*args)
+
+        monkeypatch.setattr(a, "_launch", slow_launch)
+        creating = asyncio.create_task(a.create_sandbox(1, "api", {}))
+        await asyncio.sleep(0.15)
+        assert await redis.hget(record_key(1), "status") == "creating"
+        assert await b.create_sandbox(1, "api", {}) is not None
+        await creating
+        assert len(docker.containers.started) == 1
+
+    async def test_start_adopts_known_containers_and_removes_the_rest(self, workers):
+        redis, docker, (a, b) = workers
+        a.warm_pool = b.warm_pool = {"web": 1}
+        for worker in (a, b):
+            await worker.start()
+            await asyncio.gather(*worker._refills.values())
+        sandbox = await a.create_sandbox(1, "api", {})
+        stray = a.hosts["local"].pools["web"][0]
+        kept = b.hosts["local"].pools["web"][0]
+        await redis.delete(owner_key(1), worker_key("a"))  # worker a died
+
+        c = SandboxManager(
+            hosts=[{"name": "local", "cpus": 64, "memory_mb": 65536}],
+            registry=SandboxRegistry(client=redis, cache_seconds=0),
+        )
+        c.worker_id = "c"
+        c.hosts["local"]._client = docker
+        await c.start()
+        assert c.sandboxes[1].container_id == sandbox.container_id
+        assert not docker.containers.get(sandbox.container_id).removed
+        assert stray.removed
+        assert not kept.removed  # b is alive
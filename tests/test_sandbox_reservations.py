@@ -0,0 +1,132 @@
+"""
+Tests for sandbox reservations and project pre-warming (fake Docker).
+"""
+
+import asyncio
+
+from src.api.projects import prewarm
+
+from .test_sandbox_manager import container_of, manager, pools, settle
+
+
+class TestReservations:
+    async def test_reserved_container_is_used_by_first_sandbox(self):
+        sandboxes = manager(warm_pool={"web": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        warm = pools(sandboxes)["web"][0]
+
+        assert await sandboxes.reserve(1, "web")
+        await settle(sandboxes)
+        assert sandboxes.hosts["local"].reserved == {1}
+        assert len(pools(sandboxes)["web"]) == 1 and pools(sandboxes)["web"][0] is not warm
+
+        sandbox = await sandboxes.create_sandbox(1, "web", {"index.html": "x"})
+        assert sandbox.container_id == warm.id
+        assert sandboxes.reservations == {} and sandboxes.hosts["local"].reserved == set()
+        assert sandboxes.metrics()["reservations"]["used"] == 1
+
+    async def test_reserve_is_idempotent(self):
+        sandboxes = manager()
+        assert await sandboxes.reserve(1, "api")
+        assert not await sandboxes.reserve(1, "api")
+        await sandboxes.create_sandbox(1, "api", {})
+        assert not await sandboxes.reserve(1, "api")
+
+    async def test_reserve_never_evicts(self):
+        sandboxes = manager(max_containers=1)
+        await sandboxes.create_sandbox(1, "static", {})
+        assert not await sandboxes.reserve(2, "static")
+        assert 1 in sandboxes.sandboxes
+
+    async def test_expired_reservation_refills_pool(self):
+        sandboxes = manager(warm_pool={"web": 1}, reserve_seconds=0)
+        await sandboxes.start()
+        await settle(sandboxes)
+        await sandboxes.reserve(1, "web")
+        reserved = sandboxes.reservations[1].container
+        pools(sandboxes)["web"].clear()  # pool short when the reservation runs out
+
+        await sandboxes.reap()
+        assert list(pools(sandboxes)["web"]) == [reserved]
+        assert sandboxes.reservations_expired == 1
+
+    async def test_cancel_removes_surplus_container(self):
+        sandboxes = manager()
+        await sandboxes.reserve(1, "api")
+        reserved = sandboxes.reservations[1].container
+        await sandboxes.cancel_reservation(1)
+        assert reserved.removed and sandboxes.hosts["local"].containers == 0
+        assert sandboxes.hosts["local"].ports.used == 0
+
+    async def test_other_type_cancels_reservation(self):
+        sandboxes = manager()
+        await sandboxes.reserve(1, "api")
+        reserved = sandboxes.reservations[1].container
+        sandbox = await sandboxes.create_sandbox(1, "static", {})
+        assert reserved.removed and container_of(sandboxes, sandbox) is not reserved
+
+
+class FakeDatabases:
+    def __init__(self):
+        self.created = []
+        self.dropped = []
+        self.tables = {}
+
+    async def create_database(self, project_id):
+        await asyncio.sleep(0)
+        self.created.append(project_id)
+
+    async def schema_exists(self, project_id):
+        return project_id in self.created and project_id not in self.dropped
+
+    async def get_tables(self, project_id):
+        return self.tables.get(project_id, [])
+
+    async def drop_database(self, project_id):
+        self.dropped.append(project_id)
+
+
+class TestPrewarm:
+    async def test_prewarm_and_cancel(self, monkeypatch):
+        sandboxes, databases = manager(), FakeDatabases()
+        monkeypatch.setattr(prewarm, "sandbox_manager", sandboxes)
+        monkeypatch.setattr(prewarm, "get_database_manager", lambda: databases)
+
+        await prewarm.start_prewarm(5, "web")
+        await asyncio.wait([prewarm._tasks[5]])
+        await prewarm.cancel_prewarm(5)
+        assert databases.created == [5] and databases.dropped == [5]
+        assert sandboxes.reservations == {} and sandboxes.reservations_cancelled == 1
+
+    async def test_used_schema_is_kept(self, monkeypatch):
+        sandboxes, databases = manager(), FakeDatabases()
+        monkeypatch.setattr(prewarm, "sandbox_manager", sandboxes)
+        monkeypatch.setattr(prewarm, "get_database_manager", lambda: databases)
+        await prewarm.prewarm(5, "web")
+        databases.tables[5] = ["users"]
+        await prewarm.cancel_prewarm(5)
+        assert databases.dropped == []
+
+    async def test_cancel_does_not_wait_for_a_cold_start(self, monkeypatch):
+        sandboxes, databases = manager(), FakeDatabases()
+        monkeypatch.setattr(prewarm, "sandbox_manager", sandboxes)
+        monkeypatch.setattr(prewarm, "get_database_manager", lambda: databases)
+        started = asyncio.Event()
+
+        async def slow_reserve(project_id, project_type):
+            started.set()
+            await asyncio.sleep(10)
+
+        monkeypatch.setattr(sandboxes, "reserve", slow_reserve)
+        await prewarm.start_prewarm(5, "web")
+        await started.wait()
+        await asyncio.wait_for(prewarm.cancel_prewarm(5), 1)
+        assert databases.dropped == [5]
+
+    async def test_failures_are_logged_not_raised(self, monkeypatch):
+        sandboxes = manager()
+        monkeypatch.setattr(prewarm, "sandbox_manager", sandboxes)
+        monkeypatch.setattr(prewarm, "get_database_manager", lambda: None)
+        await prewarm.prewarm(6, "api")
+        assert 6 in sandboxes.reservations
@@ -0,0 +1,166 @@
+"""
+Tests for sandbox snapshots and resume (fake Docker).
+"""
+
+import functools
+
+from src.api.sandbox.snapshots import LABEL, SnapshotStore, manifest_hash
+from src.api.sandbox.sync import content_hash
+
+from .test_sandbox_manager import FakeContainers, FakeDocker, container_of, manager
+
+
+class FakeImage:
+    def __init__(self, image_id, labels, size=300 * 1024 * 1024):
+        self.id = image_id
+        self.labels = labels
+        self.attrs = {"Size": size}
+
+
+class FakeImages:
+    def __init__(self):
+        self.images = {}
+        self.commits = 0
+
+    def commit(self, container, repository, tag, conf):
+        self.commits += 1
+        image = FakeImage(f"sha256:{self.commits}", conf["Labels"])
+        self.images[image.id] = image
+        return image
+
+    def list(self, filters):
+        return [image for image in self.images.values() if filters["label"] in image.labels]
+
+    def remove(self, image, force=False):
+        del self.images[image]
+
+
+class SnapshotContainers(FakeContainers):
+    def __init__(self, images):
+        super().__init__()
+        self.images = images
+
+    def run(self, image, command, **kwargs):
+        container = super().run(image, command, **kwargs)
+        container.image = image
+        container.commit = functools.partial(self.images.commit, container)
+        return container
+
+
+class SnapshotDocker(FakeDocker):
+    def __init__(self):
+        super().__init__()
+        self.images = FakeImages()
+        self.containers = SnapshotContainers(self.images)
+
+
+FILES = {"package.json": "{}", "src/App.tsx": "export default 1"}
+
+
+def snapshot_manager(**kwargs):
+    sandboxes = manager(snapshots=SnapshotStore(**kwargs))
+    sandboxes.hosts["local"]._client = SnapshotDocker()
+    return sandboxes
+
+
+class TestManifestHash:
+    def test_order_independent(self):
+        assert manifest_hash({"a": "1", "b": "2"}) == manifest_hash({"b": "2", "a": "1"})
+        assert manifest_hash({"a": "1"}) != manifest_hash({"a": "2"})
+        assert manifest_hash({"a": "1"}) != manifest_hash({"b": "1"})
+
+
+class TestSnapshots:
+    async def test_destroy_without_snapshot_keeps_nothing(self):
+        sandboxes = snapshot_manager()
+        await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.destroy_sandbox(1)
+        assert sandboxes.snapshots.snapshots == {}
+
+    async def test_resume_when_files_match(self):
+        sandboxes = snapshot_manager()
+        first = await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.destroy_sandbox(1, snapshot=True)
+        snapshot = sandboxes.snapshots.snapshots[1]
+        assert snapshot.manifest_hash == manifest_hash(first.manifest)
+
+        sandbox = await sandboxes.create_sandbox(1, "web", FILES)
+        container = container_of(sandboxes, sandbox)
+        assert sandbox.resumed and sandbox.startup_ms is not None
+        assert container.image == snapshot.image
+        assert container.archives == []  # files are in the image
+        command = container.execs[0][0][-1]
+        assert "npm run dev" in command and "npm install" not in command
+        assert sandboxes.metrics()["snapshots"]["restored"] == 1
+
+    async def test_changed_files_start_fresh(self):
+        sandboxes = snapshot_manager()
+        await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.destroy_sandbox(1, snapshot=True)
+
+        sandbox = await sandboxes.create_sandbox(1, "web", {**FILES, "src/App.tsx": "export default 2"})
+        container = container_of(sandboxes, sandbox)
+        assert not sandbox.resumed
+        assert container.image == "node:20-alpine" and container.archives
+        assert sandboxes.snapshots.stale == 1
+
+    async def test_snapshot_follows_updated_files(self):
+        sandboxes = snapshot_manager()
+        await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.update_files(1, {"src/App.tsx": "export default 2"})
+        await sandboxes.destroy_sandbox(1, snapshot=True)
+        expected = {**FILES, "src/App.tsx": "export default 2"}
+        assert sandboxes.snapshots.snapshots[1].manifest_hash == manifest_hash(
+            {path: content_hash(content) for path, content in expected.items()}
+        )
+        assert (await sandboxes.create_sandbox(1, "web", expected)).resumed
+
+    async def test_reaped_sandbox_is_snapshotted(self):
+        sandboxes = snapshot_manager()
+        sandbox = await sandboxes.create_sandbox(1, "web", FILES)
+        sandbox.last_active -= 3600
+        await sandboxes.reap()
+        assert 1 in sandboxes.snapshots.snapshots
+
+    async def test_newer_snapshot_replaces_older_and_host_limit(self):
+        sandboxes = snapshot_manager(max_per_host=2)
+        images = sandboxes.hosts["local"].client.images
+        for project_id in (1, 2, 3):
+            await sandboxes.create_sandbox(project_id, "web", {"index.html": str(project_id)})
+            await sandboxes.destroy_sandbox(project_id, snapshot=True)
+        assert set(sandboxes.snapshots.snapshots) == {2, 3}
+        assert len(images.images) == 2
+
+        await sandboxes.create_sandbox(3, "web", {"index.html": "changed"})
+        await sandboxes.destroy_sandbox(3, snapshot=True)
+        assert len(images.images) == 2
+        assert sandboxes.snapshots.snapshots[3].image in images.images
+
+    async def test_missing_image_falls_back(self):
+        sandboxes = snapshot_manager()
+        await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.destroy_sandbox(1, snapshot=True)
+        docker = sandboxes.hosts["local"].client
+        run = docker.containers.run
+
+        def run_without_snapshots(image, command, **kwargs):
+            if image.startswith("sha256:"):
+                raise RuntimeError("No such image")
+            return run(image, command, **kwargs)
+
+        docker.containers.run = run_without_snapshots
+        sandbox = await sandboxes.create_sandbox(1, "web", FILES)
+        assert not sandbox.resumed and sandboxes.snapshots.snapshots == {}
+
+    async def test_load_indexes_images_after_restart(self):
+        sandboxes = snapshot_manager()
+        await sandboxes.create_sandbox(1, "web", FILES)
+        await sandboxes.destroy_sandbox(1, snapshot=True)
+        docker = sandboxes.hosts["local"].client
+
+        restarted = snapshot_manager()
+        restarted.hosts["local"]._client = docker
+        await restarted.start()
+        assert restarted.snapshots.snapshots[1].image == sandboxes.snapshots.snapshots[1].image
+        assert docker.images.list({"label": LABEL})
+        assert (await restarted.create_sandbox(1, "web", FILES)).resumed
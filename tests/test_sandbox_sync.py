@@ -0,0 +1,42 @@
+"""
+Tests for sandbox file sync (manifests, streamed tar).
+"""
+
+import io
+import tarfile
+
+import pytest
+
+from src.api.sandbox.sync import SyncError, content_hash, diff_files, safe_path, stream_tar
+
+
+class TestPaths:
+    def test_safe_path(self):
+        assert safe_path("src/./App.tsx") == "src/App.tsx"
+        assert safe_path("src\\App.tsx") == "src/App.tsx"
+        for path in ("/etc/passwd", "../x", "a/../../x", "."):
+            with pytest.raises(SyncError):
+                safe_path(path)
+
+
+class TestDiff:
+    def test_diff_against_manifest(self):
+        manifest = {"a.txt": content_hash("a"), "b.txt": content_hash("b"), "c.txt": content_hash("c")}
+        changes = diff_files(manifest, {"a.txt": "a", "./b.txt": "B", "d.txt": "d"}, deleted=["c.txt", "x.txt"])
+        assert changes.files == {"b.txt": "B", "d.txt": "d"}
+        assert changes.hashes == {"b.txt": content_hash("B"), "d.txt": content_hash("d")}
+        assert changes.deleted == ["c.txt"]
+        assert changes.unchanged == 1
+
+    def test_rewritten_file_is_not_deleted(self):
+        changes = diff_files({"a.txt": content_hash("a")}, {"a.txt": "new"}, deleted=["a.txt"])
+        assert changes.deleted == []
+
+
+class TestStreamTar:
+    def test_roundtrip_in_small_chunks(self):
+        files = {"a.txt": "x" * 1000, "dir/" + "long" * 40 + ".txt": "ü", "empty": ""}
+        chunks = list(stream_tar(files, chunk_bytes=512))
+        assert all(len(chunk) == 512 for chunk in chunks[:-1])
+        with tarfile.open(fileobj=io.BytesIO(b"".join(chunks))) as tar:
+            assert {m.name: tar.extractfile(m).read().decode() for m in tar} == files
@@ -0,0 +1,108 @@
+"""
+Tests for sandbox usage telemetry (fake Docker stats).
+"""
+
+from src.api.sandbox.telemetry import MB, Series, Telemetry, Usage
+
+from .test_sandbox_manager import FakeDocker, manager, pools, settle
+
+
+def stats(cpu=0, system=0, rx=0, tx=0, memory=0, cache=0, pids=1, cpus=2):
+    return {
+        "cpu_stats": {"cpu_usage": {"total_usage": cpu}, "system_cpu_usage": system, "online_cpus": cpus},
+        "memory_stats": {"usage": memory, "stats": {"inactive_file": cache}},
+        "networks": {"eth0": {"rx_bytes": rx, "tx_bytes": tx}},
+        "pids_stats": {"current": pids},
+    }
+
+
+class FakeAPI:
+    """Cumulative counters that grow by a fixed step per stats call."""
+
+    def __init__(self):
+        self.calls = {}
+        self.gone = set()
+
+    def stats(self, container_id, stream, one_shot):
+        assert not stream and one_shot
+        if container_id in self.gone:
+            raise RuntimeError("No such container")
+        n = self.calls[container_id] = self.calls.get(container_id, 0) + 1
+        return stats(cpu=n * 50, system=n * 100, rx=n * 4096, memory=64 * MB, cache=16 * MB, pids=7)
+
+
+class StatsDocker(FakeDocker):
+    def __init__(self):
+        super().__init__()
+        self.api = FakeAPI()
+
+
+def telemetry_manager(**kwargs):
+    sandboxes = manager(telemetry=Telemetry(points=3), **kwargs)
+    sandboxes.hosts["local"]._client = StatsDocker()
+    return sandboxes
+
+
+class TestSeries:
+    def test_ring_keeps_newest(self):
+        series = Series(3)
+        assert series.latest() is None and series.points() == []
+        for t in range(1, 6):
+            series.add(Usage(float(t), t, t * MB, 0, 0, t))
+        assert len(series) == 3
+        assert [u.timestamp for u in series.points()] == [3.0, 4.0, 5.0]
+        assert [u.timestamp for u in series.points(since=4.0)] == [5.0]
+        assert series.latest().pids == 5 and series.latest().memory_bytes == 5 * MB
+
+
+class TestTelemetry:
+    async def test_rates_from_consecutive_samples(self):
+        telemetry = Telemetry()
+        client = StatsDocker()
+        await telemetry.sample("local", client, ["c"])
+        assert telemetry.latest("c") is None  # first sample only sets the baseline
+        await telemetry.sample("local", client, ["c"])
+        usage = telemetry.latest("c")
+        assert usage.cpu_percent == 100.0  # half of two CPUs
+        assert usage.memory_bytes == 48 * MB
+        assert usage.pids == 7 and usage.rx_bytes_per_s > 0 and usage.tx_bytes_per_s == 0
+        summary = telemetry.summary()["local"]
+        assert summary["containers"] == 1 and summary["memory_mb"] == 48.0
+
+    async def test_missing_container_is_skipped_and_forgotten(self):
+        telemetry = Telemetry()
+        client = StatsDocker()
+        for _ in range(2):
+            await telemetry.sample("local", client, ["a", "b"])
+        client.api.gone.add("b")
+        await telemetry.sample("local", client, ["a", "b"])
+        assert telemetry.summary()["local"]["containers"] == 1
+        telemetry.forget(["a"])
+        assert telemetry.history("b") == [] and len(telemetry.history("a")) == 2
+
+
+class TestSandboxUsage:
+    async def test_samples_sandboxes_and_warm_containers(self):
+        sandboxes = telemetry_manager(warm_pool={"web": 1})
+        await sandboxes.start()
+        await settle(sandboxes)
+        sandbox = await sandboxes.create_sandbox(1, "web", {"index.html": "x"})
+        await settle(sandboxes)
+        for _ in range(3):
+            await sandboxes.sample()
+
+        warm = pools(sandboxes)["web"][0]
+        assert set(sandboxes.telemetry.series) == {sandbox.container_id, warm.id}
+        usage = await sandboxes.usage(1)
+        assert usage["latest"]["cpu_percent"] == 100.0
+        assert len(usage["samples"]) == 2 and usage["memory_limit_mb"] == 512
+        assert sandboxes.metrics()["usage"]["local"]["containers"] == 2
+
+    async def test_destroyed_sandbox_series_dropped(self):
+        sandboxes = telemetry_manager()
+        sandbox = await sandboxes.create_sandbox(1, "web", {"index.html": "x"})
+        await sandboxes.sample()
+        await sandboxes.destroy_sandbox(1)
+        await sandboxes.sample()
+        assert sandbox.container_id not in sandboxes.telemetry.series
+        assert await sandboxes.usage(1) is None